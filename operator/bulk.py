@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import json
+import logging
+import pathlib
+import random
+import sys
+import time
+
+import yaml
+from kubernetes_asyncio.client.rest import ApiException
+
+from .handlers.podstatus import pod_ready
+from .utils import clients
+from .utils.informer import Informer
+from .utils.podcache import MANAGED_SELECTOR
+from .utils.schema import InvalidSpec, SpecValidator, crd_spec_schema, load_crd
+
+logger = logging.getLogger(__name__)
+
+GROUP = 'agents.example.com'
+VERSION = 'v1'
+PLURAL = 'agenttypes'
+RETRYABLE = (429, 500, 502, 503, 504)
+# AgentType names per pod deletecollection, keeping the selector well within URL limits
+TEARDOWN_CHUNK = 200
+# Specs are checked against it before submitting, when running from a checkout
+CRD_PATH = pathlib.Path(__file__).resolve().parents[1] / 'base' / 'crd' / 'agenttype.yaml'
+
+def load_documents(stream):
+    """Read AgentType documents from a multi-document YAML or a JSONL stream"""
+    text = stream.read()
+    lines = [line for line in text.splitlines() if line.strip()]
+    if lines and all(line.lstrip().startswith('{') for line in lines):
+        docs = [json.loads(line) for line in lines]
+    else:
+        docs = [doc for doc in yaml.safe_load_all(text) if doc]
+
+    for doc in docs:
+        doc.setdefault('apiVersion', f"{GROUP}/{VERSION}")
+        doc.setdefault('kind', 'AgentType')
+    return docs
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))]
+
+def _retry_delay(error, attempt, base, cap):
+    """Honour Retry-After when the apiserver sends it, else exponential backoff with jitter"""
+    retry_after = error.headers.get('Retry-After') if error.headers else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class BatchTracker:
+    """Track submit and Ready times of the AgentTypes in a batch"""
+
+    def __init__(self, names):
+        self.pending = set(names)
+        self.submitted_at = {}
+        self.ready_at = {}
+        self.all_ready = asyncio.Event()
+        if not self.pending:
+            self.all_ready.set()
+
+    def submitted(self, name):
+        self.submitted_at[name] = time.monotonic()
+
+    def failed(self, name):
+        self._done(name)
+
+    def on_pod_event(self, event_type, pod):
+        """Pod watch listener: an agent is Ready when its pod reports Ready"""
+        name = (pod['metadata'].get('labels') or {}).get('app')
+        if name in self.pending and event_type != 'DELETED' and pod_ready(pod):
+            self.ready_at[name] = time.monotonic()
+            self._done(name)
+
+    def _done(self, name):
+        self.pending.discard(name)
+        if not self.pending:
+            self.all_ready.set()
+
+    def times_to_ready(self):
+        return [self.ready_at[name] - self.submitted_at[name] for name in self.ready_at if name in self.submitted_at]
+
+async def _submit_one(custom_api, namespace, doc, tracker, semaphore, max_retries, backoff, max_backoff):
+    """Create one AgentType, retrying on throttling and transient errors"""
+    name = doc['metadata']['name']
+    async with semaphore:
+        for attempt in range(max_retries + 1):
+            try:
+                await clients.call_json(
+                    custom_api.create_namespaced_custom_object,
+                    group=GROUP, version=VERSION, namespace=namespace, plural=PLURAL, body=doc
+                )
+                tracker.submitted(name)
+                return 'created', attempt
+            except ApiException as e:
+                if e.status == 409:
+                    tracker.submitted(name)
+                    return 'exists', attempt
+                if e.status not in RETRYABLE or attempt == max_retries:
+                    logger.error("Failed to create %s/%s: %s %s", namespace, name, e.status, e.reason)
+                    tracker.failed(name)
+                    return 'failed', attempt
+                await asyncio.sleep(_retry_delay(e, attempt, backoff, max_backoff))
+
+async def submit_batch(docs, namespace='default', concurrency=32, max_retries=8,
+                       backoff=0.5, max_backoff=30.0, wait=True, timeout=600.0, validator=None):
+    """Submit AgentTypes with bounded concurrency and wait for their pods to be Ready
+
+    Readiness is followed through one pod watch for the whole batch instead
+    of per-object polling. With a `validator`, specs that do not match the
+    schema are reported without a request. Returns a report with throughput
+    and time-to-Ready percentiles.
+    """
+    custom_api = await clients.get_custom_api()
+    core_api = await clients.get_core_api()
+    total = len(docs)
+    if validator is not None:
+        valid = []
+        for doc in docs:
+            try:
+                validator.validate(doc.get('spec') or {})
+                valid.append(doc)
+            except InvalidSpec as e:
+                logger.error("Not creating %s/%s: %s", namespace, doc['metadata']['name'], e)
+        docs = valid
+    names = [doc['metadata']['name'] for doc in docs]
+    tracker = BatchTracker(names)
+
+    watch_task = None
+    if wait:
+        informer = Informer(core_api.list_namespaced_pod, namespace=namespace, label_selector=MANAGED_SELECTOR)
+        informer.add_listener(tracker.on_pod_event)
+        watch_task = asyncio.create_task(informer.run())
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    outcomes = await asyncio.gather(*(
+        _submit_one(custom_api, namespace, doc, tracker, semaphore, max_retries, backoff, max_backoff)
+        for doc in docs
+    ))
+    submit_seconds = time.monotonic() - started
+
+    timed_out = False
+    if watch_task is not None:
+        try:
+            await asyncio.wait_for(tracker.all_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+        watch_task.cancel()
+        try:
+            await watch_task
+        except asyncio.CancelledError:
+            pass
+    total_seconds = time.monotonic() - started
+
+    counts = {}
+    for outcome, _ in outcomes:
+        counts[outcome] = counts.get(outcome, 0) + 1
+    ready = tracker.times_to_ready()
+    return {
+        'total': total,
+        'invalid': total - len(docs),
+        'created': counts.get('created', 0),
+        'existing': counts.get('exists', 0),
+        'failed': counts.get('failed', 0),
+        'retries': sum(attempts for _, attempts in outcomes),
+        'ready': len(ready),
+        'timed_out': timed_out,
+        'submit_seconds': submit_seconds,
+        'total_seconds': total_seconds,
+        'submit_per_second': len(docs) / submit_seconds if submit_seconds else None,
+        'ready_per_second': len(ready) / total_seconds if wait and total_seconds else None,
+        'time_to_ready_p50': _percentile(ready, 50),
+        'time_to_ready_p99': _percentile(ready, 99)
+    }
+
+class TeardownTracker:
+    """Follow a teardown through one pod watch until no targeted pod is left"""
+
+    def __init__(self, informer):
+        self.informer = informer
+        self.deleted = 0
+        self.all_gone = asyncio.Event()
+
+    def on_pod_event(self, event_type, pod):
+        if event_type == 'DELETED':
+            self.deleted += 1
+        self._check()
+
+    def _check(self):
+        if self.informer.synced.is_set() and not self.informer.store:
+            self.all_gone.set()
+
+    async def wait(self):
+        await self.informer.synced.wait()
+        self._check()
+        await self.all_gone.wait()
+
+def teardown_selectors(names=None):
+    """Pod label selectors covering the given AgentTypes, or all of them when None"""
+    if names is None:
+        return [f"{MANAGED_SELECTOR},app"]
+    names = sorted(names)
+    return [
+        f"{MANAGED_SELECTOR},app in ({','.join(names[i:i + TEARDOWN_CHUNK])})"
+        for i in range(0, len(names), TEARDOWN_CHUNK)
+    ]
+
+async def teardown(namespace='default', selector=None, propagation='Background', wait=True, timeout=600.0):
+    """Delete AgentTypes and their pods with a handful of deletecollection calls
+
+    AgentTypes matching `selector` (all of them when None) go in one call,
+    and their pods are deleted directly by label instead of one by one by
+    the garbage collector. Completion is followed through one pod watch.
+    With 'Foreground' propagation each AgentType stays until its pods are
+    gone, which lets the operator's delete handler run for it.
+    """
+    custom_api = await clients.get_custom_api()
+    core_api = await clients.get_core_api()
+    started = time.monotonic()
+    calls = 0
+
+    names = None
+    if selector:
+        listed = await clients.call_json(
+            custom_api.list_namespaced_custom_object,
+            group=GROUP, version=VERSION, namespace=namespace, plural=PLURAL, label_selector=selector
+        )
+        calls += 1
+        names = [item['metadata']['name'] for item in listed.get('items') or []]
+
+    agents = 0
+    if names is None or names:
+        deleted = await clients.call_json(
+            custom_api.delete_collection_namespaced_custom_object,
+            group=GROUP, version=VERSION, namespace=namespace, plural=PLURAL,
+            label_selector=selector, propagation_policy=propagation
+        )
+        calls += 1
+        agents = len(deleted.get('items') or [])
+
+    pods = 0
+    for pod_selector in teardown_selectors(names):
+        deleted = await clients.call_json(core_api.delete_collection_namespaced_pod, namespace=namespace, label_selector=pod_selector)
+        calls += 1
+        pods += len(deleted.get('items') or [])
+    delete_seconds = time.monotonic() - started
+
+    timed_out = False
+    if wait:
+        app_names = set(names) if names is not None else None
+        informer = Informer(
+            core_api.list_namespaced_pod,
+            namespace=namespace,
+            label_selector=f"{MANAGED_SELECTOR},app",
+            filter=(lambda pod: pod['metadata']['labels']['app'] in app_names) if app_names is not None else None
+        )
+        tracker = TeardownTracker(informer)
+        informer.add_listener(tracker.on_pod_event)
+        watch_task = asyncio.create_task(informer.run())
+        try:
+            await asyncio.wait_for(tracker.wait(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+        watch_task.cancel()
+        try:
+            await watch_task
+        except asyncio.CancelledError:
+            pass
+    total_seconds = time.monotonic() - started
+
+    return {
+        'agenttypes': agents,
+        'pods': pods,
+        'api_calls': calls,
+        'timed_out': timed_out,
+        'delete_seconds': delete_seconds,
+        'total_seconds': total_seconds
+    }
+
+async def _run(args):
+    if args.teardown:
+        await clients.init_clients()
+        try:
+            return await teardown(
+                namespace=args.namespace,
+                selector=args.selector,
+                propagation=args.propagation,
+                wait=not args.no_wait,
+                timeout=args.timeout
+            )
+        finally:
+            await clients.close_clients()
+
+    stream = sys.stdin if args.filename == '-' else open(args.filename)
+    with stream:
+        docs = load_documents(stream)
+    validator = SpecValidator(crd_spec_schema(load_crd(args.schema))) if args.schema else None
+    await clients.init_clients(pool_maxsize=args.concurrency)
+    try:
+        return await submit_batch(
+            docs,
+            namespace=args.namespace,
+            concurrency=args.concurrency,
+            max_retries=args.max_retries,
+            wait=not args.no_wait,
+            timeout=args.timeout,
+            validator=validator
+        )
+    finally:
+        await clients.close_clients()
+
+def main(argv=None):
+    """Command line entry point, run through scripts/bulk.py or `task bulk`"""
+    parser = argparse.ArgumentParser(description="Bulk-create (or tear down) AgentType resources and wait for the result")
+    parser.add_argument('-f', '--filename', help="YAML or JSONL file with AgentType specs, '-' for stdin")
+    parser.add_argument('--teardown', action='store_true', help="Delete AgentTypes and their pods instead of creating them")
+    parser.add_argument('-l', '--selector', help="With --teardown, only delete AgentTypes matching this label selector")
+    parser.add_argument('--propagation', choices=['Background', 'Foreground'], default='Background',
+                        help="With --teardown, deletion propagation for the AgentTypes")
+    parser.add_argument('-n', '--namespace', default='default')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--max-retries', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=600.0, help="Seconds to wait for the batch to be Ready (or gone)")
+    parser.add_argument('--no-wait', action='store_true', help="Return once every object is submitted (or deleted)")
+    parser.add_argument('--schema', default=str(CRD_PATH) if CRD_PATH.exists() else '',
+                        help="AgentType CRD manifest to validate specs against before submitting, '' to skip")
+    args = parser.parse_args(argv)
+    if not args.teardown and not args.filename:
+        parser.error("-f/--filename is required unless --teardown is given")
+
+    logging.basicConfig(level=logging.INFO)
+    report = asyncio.run(_run(args))
+    print(json.dumps(report, indent=2))
+    return 1 if report.get('failed') or report.get('invalid') or report['timed_out'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
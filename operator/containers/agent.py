@@ -1,13 +1,21 @@
-from ..utils.volume import get_volume_mounts
+from ..utils.volume import get_sdk_mount, get_volume_mounts
 
-def create_agent_container(image, env_vars=None):
-    """Create the main agent container configuration"""
+SDK_PATHS = {
+    'python': ('PYTHONPATH', '/sdk'),
+    'nodejs': ('NODE_PATH', '/sdk/node_modules')
+}
+
+def create_agent_container(image, env_vars=None, sdk=None):
+    """Create the main agent container configuration
+
+    `sdk` is the (key, runtime) of a cached SDK package set to mount.
+    """
     container = {
         'name': 'agent',
         'image': image,
         'volumeMounts': get_volume_mounts()
     }
-    
+
     if env_vars:
         container['env'] = [
             {
@@ -15,5 +23,11 @@ def create_agent_container(image, env_vars=None):
                 'value': var['value']
             } for var in env_vars
         ]
-    
+
+    if sdk:
+        key, runtime = sdk
+        container['volumeMounts'].append(get_sdk_mount())
+        path_var, path = SDK_PATHS[runtime]
+        container.setdefault('env', []).append({'name': path_var, 'value': path})
+
     return container
@@ -1,5 +1,45 @@
 from ..utils.volume import get_volume_mounts
 
+SDK_IMAGES = {
+    'python': 'python:{version}-slim',
+    'nodejs': 'node:{version}-slim'
+}
+# Runtime versions packages are installed with when spec.agent.environment.sdk.version is unset
+DEFAULT_SDK_VERSIONS = {
+    'python': '3.11',
+    'nodejs': '20'
+}
+SDK_INSTALL = {
+    'python': 'pip install --no-cache-dir --target "$tmp" -r /artifact/packages.txt',
+    'nodejs': 'npm install --no-save --prefix "$tmp" $(cat /artifact/packages.txt)'
+}
+# Builds each package set once per node and namespace; concurrent builders
+# race on the final rename and the loser discards its copy. The pod gets its
+# own copy, so the agent never sees the node cache and evicting a package set
+# cannot pull files from under a running pod. Package sets not used for
+# longest are evicted beyond `keep` entries, except those used within the
+# last `grace` minutes, which another init container may be copying.
+SDK_SCRIPT = """dir=/sdk-cache/{key}
+if [ -f "$dir/.complete" ]; then
+  echo "sdk cache hit {key}"
+else
+  echo "sdk cache miss {key}"
+  tmp="$dir.tmp-$HOSTNAME"
+  rm -rf "$tmp" && mkdir -p "$tmp"
+  {install}
+  touch "$tmp/.complete"
+  mv -T "$tmp" "$dir" 2>/dev/null || rm -rf "$tmp"
+fi
+touch "$dir/.last-used"
+cp -a "$dir/." /sdk/
+ls -1t /sdk-cache/*/.last-used | tail -n +{evict_from} | while read used; do
+  [ -n "$(find "$used" -mmin -{grace})" ] || rm -rf "$(dirname "$used")"
+done"""
+
+def sdk_image(runtime, version=None):
+    """Image installing SDK packages, pinned to the runtime version the agent runs"""
+    return SDK_IMAGES[runtime].format(version=version or DEFAULT_SDK_VERSIONS[runtime])
+
 def create_init_container():
     """Create the init container configuration"""
     return {
@@ -9,3 +49,22 @@ def create_init_container():
         'args': ['echo \'console.log("wrapped");\' > /shared/wrapper.js'],
         'volumeMounts': get_volume_mounts()
     }
+
+def create_artifact_init_container(key, runtime, wrapper_file, sdk_cache, keep=32, grace=30, version=None):
+    """Create an init container that copies a cached artifact instead of generating it"""
+    script = ['set -e', f"cp /artifact/{wrapper_file} /shared/{wrapper_file}"]
+    mounts = get_volume_mounts() + [{'name': 'artifact', 'mountPath': '/artifact', 'readOnly': True}]
+    image = 'busybox:latest'
+    if sdk_cache:
+        script.append(SDK_SCRIPT.format(key=key, install=SDK_INSTALL[runtime], evict_from=keep + 1, grace=grace))
+        mounts.append({'name': 'sdk-cache', 'mountPath': '/sdk-cache'})
+        mounts.append({'name': 'sdk', 'mountPath': '/sdk'})
+        image = sdk_image(runtime, version)
+
+    return {
+        'name': 'init-wrapper',
+        'image': image,
+        'command': ['sh', '-c'],
+        'args': ['\n'.join(script)],
+        'volumeMounts': mounts
+    }
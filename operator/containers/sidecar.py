@@ -0,0 +1,25 @@
+from ..utils.volume import get_volume_mounts
+
+SIDECAR_FIELDS = ('command', 'args', 'resources', 'ports')
+
+def create_sidecar_container(sidecar_spec):
+    """Create the sidecar container configuration from the AgentType spec"""
+    container = {
+        'name': sidecar_spec.get('name', 'tool-manager'),
+        'image': sidecar_spec.get('image'),
+        'volumeMounts': get_volume_mounts()
+    }
+
+    for field in SIDECAR_FIELDS:
+        if sidecar_spec.get(field):
+            container[field] = sidecar_spec[field]
+
+    if sidecar_spec.get('env'):
+        container['env'] = [
+            {
+                'name': var['name'],
+                'value': var['value']
+            } for var in sidecar_spec['env']
+        ]
+
+    return container
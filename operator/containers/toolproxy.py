@@ -0,0 +1,45 @@
+DEFAULT_PORT = 8080
+# Where the operator image ships the proxy (its Dockerfile's WORKDIR)
+TOOL_PROXY_SCRIPT = '/app/toolproxy.py'
+# Pod-wide port the operator's autoscaler reads the proxy's load from
+LOAD_PORT = 9091
+# Spec field -> environment variable read by toolproxy.py
+CACHE_SETTINGS = (
+    ('ttlSeconds', 'TOOL_PROXY_CACHE_TTL'),
+    ('maxEntries', 'TOOL_PROXY_CACHE_SIZE'),
+    ('maxBodyBytes', 'TOOL_PROXY_CACHE_MAX_BODY')
+)
+
+def tool_proxy_url(proxy_spec):
+    """URL the agent container reaches the proxy at, over the pod's loopback interface"""
+    return f"http://127.0.0.1:{proxy_spec.get('port', DEFAULT_PORT)}"
+
+def create_tool_proxy_container(proxy_spec, image):
+    """Create the caching tool proxy sidecar from the AgentType's spec.toolProxy
+
+    It runs toolproxy.py from the operator's own image unless the spec
+    names another image; cache settings are passed as environment variables.
+    """
+    env = [
+        {'name': 'TOOL_PROXY_UPSTREAM', 'value': proxy_spec['upstream']},
+        {'name': 'TOOL_PROXY_PORT', 'value': str(proxy_spec.get('port', DEFAULT_PORT))},
+        {'name': 'TOOL_PROXY_LOAD_PORT', 'value': str(LOAD_PORT)}
+    ]
+    cache = proxy_spec.get('cache') or {}
+    for field, name in CACHE_SETTINGS:
+        if field in cache:
+            env.append({'name': name, 'value': str(cache[field])})
+    if 'poolSize' in proxy_spec:
+        env.append({'name': 'TOOL_PROXY_POOL_SIZE', 'value': str(proxy_spec['poolSize'])})
+
+    container = {
+        'name': 'tool-proxy',
+        'image': proxy_spec.get('image') or image,
+        'imagePullPolicy': 'IfNotPresent',
+        'command': ['python', TOOL_PROXY_SCRIPT],
+        'env': env,
+        'ports': [{'name': 'load', 'containerPort': LOAD_PORT}]
+    }
+    if proxy_spec.get('resources'):
+        container['resources'] = proxy_spec['resources']
+    return container
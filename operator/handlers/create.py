@@ -1,39 +1,189 @@
-from kubernetes import client
-from ..containers.agent import create_agent_container
-from ..containers.init import create_init_container
-from ..utils.volume import get_volume_config
-
-def create_agent_pod(name, namespace, spec, owner_ref):
-    """Create a pod with agent and init containers"""
-    api = client.CoreV1Api()
-
-    # Get configurations
-    agent_spec = spec.get('agent', {})
-    image = agent_spec.get('image')
-    env_vars = agent_spec.get('environment', {}).get('variables', [])
-
-    # Create pod spec
-    pod = {
-        'apiVersion': 'v1',
-        'kind': 'Pod',
-        'metadata': {
-            'name': f"{name}-pod",
-            'namespace': namespace,
-            'labels': {
-                'app': name,
-                'managed-by': 'agent-operator'
-            },
-            'ownerReferences': [owner_ref]
-        },
-        'spec': {
-            'volumes': get_volume_config(),
-            'initContainers': [create_init_container()],
-            'containers': [create_agent_container(image, env_vars)]
-        }
+import hashlib
+import json
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from ..utils.artifacts import get_artifact_cache
+from ..utils.clients import get_core_api, call_json
+from ..utils.metrics import timed_handler
+from ..utils.placement import get_placement
+from ..utils.podcache import POOL_STATE_LABEL, REPLICA_LABEL, get_pod_cache, replica_index
+from ..utils.quota import QuotaExceeded, get_quota_cache
+from ..utils.status import get_status_writer
+from ..utils.template import get_pod_template
+from ..utils.warmpool import get_warm_pool, pool_key, warm_start_enabled
+
+SPEC_HASH_ANNOTATION = 'agents.example.com/spec-hash'
+FIELD_MANAGER = 'agent-operator'
+# Service account token volume and mounts the apiserver adds to every pod
+INJECTED_PREFIX = 'kube-api-access-'
+# Fields the apiserver never defaults, so a live value missing from the manifest is drift
+RENDERED_FIELDS = ('env', 'envFrom', 'command', 'args', 'ports', 'volumeMounts', 'volumes', 'initContainers')
+
+def agent_owner_ref(name, uid):
+    """Owner reference tying a pod to its AgentType"""
+    return {
+        'apiVersion': 'agents.example.com/v1',
+        'kind': 'AgentType',
+        'name': name,
+        'uid': uid,
+        'controller': True,
+        'blockOwnerDeletion': True
+    }
+
+def build_agent_pod(name, namespace, spec, owner_ref, replica=0):
+    """Render the pod manifest for an AgentType, or for one of its extra replicas"""
+    pod = get_pod_template().render(name, namespace, spec, owner_ref)
+    if replica:
+        # Metadata is rendered per call, so it may be changed
+        pod['metadata']['name'] = f"{pod['metadata']['name']}-{replica}"
+        pod['metadata']['labels'][REPLICA_LABEL] = str(replica)
+    return pod
+
+def pod_spec_hash(pod):
+    """Content hash of the operator-controlled parts of a pod manifest"""
+    content = {
+        'labels': pod['metadata'].get('labels'),
+        'ownerReferences': pod['metadata'].get('ownerReferences'),
+        'spec': pod['spec']
     }
+    encoded = json.dumps(content, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+def stored_spec_hash(pod):
+    """Spec hash recorded on an existing pod, if any"""
+    return (pod['metadata'].get('annotations') or {}).get(SPEC_HASH_ANNOTATION)
+
+def _without_injected(items):
+    return [item for item in items if not (isinstance(item, dict) and str(item.get('name', '')).startswith(INJECTED_PREFIX))]
+
+def _subset(want, have):
+    """Whether `have` matches `want`, ignoring defaulted fields and injected list entries"""
+    if isinstance(want, dict):
+        if not isinstance(have, dict):
+            return False
+        if any(_without_injected(have[key] or []) for key in RENDERED_FIELDS if key in have and key not in want):
+            return False
+        return all(_subset(value, have.get(key)) for key, value in want.items())
+    if isinstance(want, list):
+        if not isinstance(have, list):
+            return False
+        have = _without_injected(have)
+        return len(want) == len(have) and all(map(_subset, want, have))
+    return want == have
+
+def drift_is_mutable(live, pod):
+    """Whether a live pod differs from its manifest only where a pod may be patched
+
+    Container images and metadata can change in place; every other pod
+    spec field is immutable, so any other drift needs a new pod.
+    """
+    def without_images(spec):
+        return dict(spec, containers=[dict(container, image=None) for container in spec.get('containers') or []])
 
-    # Create pod
-    return api.create_namespaced_pod(
-        namespace=namespace,
-        body=pod
+    return _subset(without_images(pod['spec']), without_images(live.get('spec') or {}))
+
+async def _read_pod(api, namespace, name):
+    """Existing pod from the cache when it is synced, else from the API"""
+    cache = get_pod_cache()
+    if cache is not None and cache.synced.is_set():
+        return cache.get_pod(namespace, name)
+    try:
+        return await call_json(api.read_namespaced_pod, name=name, namespace=namespace)
+    except ApiException as e:
+        if e.status == 404:
+            return None
+        raise
+
+async def apply_agent_pod(api, pod):
+    """Server-side apply the manifest; the apiserver only touches changed fields"""
+    return await call_json(
+        api.patch_namespaced_pod,
+        name=pod['metadata']['name'],
+        namespace=pod['metadata']['namespace'],
+        body=pod,
+        field_manager=FIELD_MANAGER,
+        force=True,
+        _content_type='application/apply-patch+yaml'
     )
+
+@timed_handler('create_agent_pod', 'pods')
+async def create_agent_pod(name, namespace, spec, owner_ref, replica=0):
+    """Create a pod with agent and init containers; `replica` > 0 for the extra pods of an autoscaled AgentType
+
+    Returns the pod and what was done: 'created', 'unchanged' when the
+    existing pod already matches the spec hash, 'patched' on drift that
+    can be patched in place, or the live pod with 'drifted' when it has to
+    be replaced (see update.replace_agent_pod).
+    """
+    api = await get_core_api()
+
+    # The pod mounts the content-addressed artifact, so it has to exist first
+    artifact = await get_artifact_cache().ensure(namespace, spec)
+    if artifact is not None:
+        key, hit = artifact
+        get_status_writer().set_fields(namespace, name, artifact={'key': key, 'cacheHit': hit})
+
+    pod = build_agent_pod(name, namespace, spec, owner_ref, replica)
+    spec_hash = pod_spec_hash(pod)
+    pod['metadata']['annotations'] = {SPEC_HASH_ANNOTATION: spec_hash}
+    pod_name = pod['metadata']['name']
+
+    existing = await _read_pod(api, namespace, pod_name)
+    if existing is None:
+        quota = get_quota_cache()
+        if quota is not None:
+            # Raises QuotaExceeded without an API write when the pod cannot fit
+            quota.check(namespace, pod)
+        placement = get_placement()
+        if placement is not None:
+            # Added after hashing: affinity is immutable and depends on where images are now
+            estimate = placement.place(pod)
+            if estimate is not None:
+                get_status_writer().set_fields(namespace, name, placement=estimate)
+        try:
+            # Create pod
+            created = await call_json(api.create_namespaced_pod, namespace=namespace, body=pod)
+            if quota is not None:
+                quota.reserve(namespace, pod)
+            return created, 'created'
+        except ApiException as e:
+            if e.status == 403 and 'exceeded quota' in (e.body or ''):
+                raise QuotaExceeded(f"Pod {pod_name} was rejected: {e.body}") from e
+            if e.status != 409:
+                raise
+            # The cache was behind; fall through to compare against the live pod
+            existing = await call_json(api.read_namespaced_pod, name=pod_name, namespace=namespace)
+
+    if stored_spec_hash(existing) == spec_hash:
+        return existing, 'unchanged'
+    if drift_is_mutable(existing, pod):
+        return await apply_agent_pod(api, pod), 'patched'
+    return existing, 'drifted'
+
+async def claim_agent_pod(name, namespace, spec, owner_ref):
+    """Hand a pre-warmed standby pod to a warm-start AgentType
+
+    Returns (pod, 'claimed'), the previously claimed pod with 'unchanged',
+    or None when warm starts are off or the pool had no standby pod.
+    """
+    pool = get_warm_pool()
+    if pool is None or not warm_start_enabled(spec):
+        return None
+
+    cache = get_pod_cache()
+    for pod in cache.pods_for_owner(owner_ref['uid']) if cache is not None else []:
+        if (pod['metadata'].get('labels') or {}).get(POOL_STATE_LABEL) == 'claimed' and replica_index(pod) == 0:
+            pool.register(namespace, spec)
+            return pod, 'unchanged'
+
+    pod, elapsed = await pool.claim(name, namespace, spec, owner_ref)
+    get_status_writer().set_fields(namespace, name, warmPool={
+        'hit': pod is not None,
+        'claimLatencyMs': round(elapsed * 1000, 1),
+        'poolSize': len(pool.standby(pool_key(namespace, spec))),
+        'hitRate': round(pool.hit_rate(), 3)
+    })
+    if pod is None:
+        return None
+    return pod, 'claimed'
@@ -0,0 +1,37 @@
+from ..utils import clients
+from ..utils.metrics import timed_handler
+from ..utils.podcache import MANAGED_SELECTOR, get_pod_cache
+
+def agent_pod_selector(name):
+    """Label selector for the pods serving an AgentType; unclaimed standby pods have no `app` label"""
+    return f"{MANAGED_SELECTOR},app={name}"
+
+def _pods_pending_deletion(namespace, name):
+    """Whether the AgentType may still have pods that are not being deleted yet
+
+    Only a cache that has seen the pods, all of them already terminating,
+    proves there is nothing left to do: an empty cache may just not have
+    seen a pod created moments ago.
+    """
+    cache = get_pod_cache()
+    if cache is None or not cache.synced.is_set():
+        return True
+    pods = [pod for pod in cache.pods_for_app(name) if pod['metadata']['namespace'] == namespace]
+    return not pods or any(not pod['metadata'].get('deletionTimestamp') for pod in pods)
+
+@timed_handler('delete_agent_pods', 'pods')
+async def delete_agent_pods(name, namespace):
+    """Delete every pod of an AgentType with one deletecollection call
+
+    Skipped when the pod cache shows every pod already terminating, e.g.
+    because a bulk teardown deleted them. Returns the number of pods deleted.
+    """
+    if not _pods_pending_deletion(namespace, name):
+        return 0
+    api = await clients.get_core_api()
+    deleted = await clients.call_json(
+        api.delete_collection_namespaced_pod,
+        namespace=namespace,
+        label_selector=agent_pod_selector(name)
+    )
+    return len(deleted.get('items') or [])
@@ -0,0 +1,68 @@
+from ..utils.autoscaler import get_autoscaler
+from ..utils.packing import PAUSE_IMAGE, member_container_name
+from ..utils.podcache import agent_owner, is_packed, replica_index
+from ..utils.registry import get_agent_registry
+from ..utils.status import get_status_writer, make_condition
+
+def pod_ready(pod):
+    """Whether the pod reports the Ready condition"""
+    for condition in (pod.get('status') or {}).get('conditions') or []:
+        if condition.get('type') == 'Ready':
+            return condition.get('status') == 'True'
+    return False
+
+def reconcile_pod_status(event_type, pod):
+    """Mirror the phase of a managed pod onto its AgentType status
+
+    Called for every pod cache event, so no per-object GETs are needed.
+    Only the first pod of an autoscaled AgentType is mirrored.
+    """
+    if is_packed(pod):
+        reconcile_packed_status(event_type, pod)
+        return
+    owner = agent_owner(pod)
+    if owner is None or replica_index(pod) > 0:
+        return
+
+    namespace = pod['metadata']['namespace']
+    writer = get_status_writer()
+    if writer.is_deleted(namespace, owner):
+        return
+    autoscaler = get_autoscaler()
+    if event_type == 'DELETED' and autoscaler is not None and autoscaler.is_scaled_to_zero(namespace, owner):
+        get_agent_registry().set_phase(namespace, owner, 'ScaledToZero')
+        writer.set_fields(namespace, owner, phase='ScaledToZero')
+        writer.update(namespace, owner, make_condition('Ready', 'False', 'ScaledToZero', "Idle; scaled to zero replicas"))
+        return
+    if event_type == 'DELETED':
+        get_agent_registry().set_phase(namespace, owner, 'Terminated')
+        writer.set_fields(namespace, owner, phase='Terminated')
+        writer.update(namespace, owner, make_condition('Ready', 'False', 'PodDeleted', f"Pod {pod['metadata']['name']} was deleted"))
+        return
+
+    _mirror(writer, namespace, owner, (pod.get('status') or {}).get('phase') or 'Pending', pod_ready(pod))
+
+def _mirror(writer, namespace, owner, phase, ready):
+    get_agent_registry().set_phase(namespace, owner, 'Ready' if ready else phase)
+    writer.set_fields(namespace, owner, phase='Ready' if ready else phase)
+    writer.update(namespace, owner, make_condition('Ready', 'True' if ready else 'False', phase, None))
+
+def reconcile_packed_status(event_type, pod):
+    """Mirror each member's container of a packed pod onto its own AgentType
+
+    Deletions are not mirrored: packed pods are deleted once their members
+    have left or moved to another pod.
+    """
+    if event_type == 'DELETED':
+        return
+    namespace = pod['metadata']['namespace']
+    writer = get_status_writer()
+    phase = (pod.get('status') or {}).get('phase') or 'Pending'
+    images = {container['name']: container['image'] for container in pod['spec']['containers']}
+    statuses = {status['name']: status for status in (pod.get('status') or {}).get('containerStatuses') or []}
+    for ref in pod['metadata'].get('ownerReferences') or []:
+        container = member_container_name(ref['name'])
+        if ref.get('kind') != 'AgentType' or images.get(container) == PAUSE_IMAGE or writer.is_deleted(namespace, ref['name']):
+            continue
+        ready = phase == 'Running' and bool(statuses.get(container, {}).get('ready'))
+        _mirror(writer, namespace, ref['name'], phase, ready)
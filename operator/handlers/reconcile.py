@@ -0,0 +1,119 @@
+import kopf
+
+from ..utils import clients
+from ..utils.autoscaler import get_autoscaler
+from ..utils.config import env_int
+from ..utils.events import get_event_recorder, object_ref
+from ..utils.packing import get_pod_packer, packing_class
+from ..utils.quota import QuotaExceeded, get_quota_cache
+from ..utils.registry import get_agent_registry
+from ..utils.schema import InvalidSpec, validated_spec
+from ..utils.status import get_status_writer, make_condition
+from ..utils.workqueue import PRIORITY_CREATE, get_work_queue
+from .create import agent_owner_ref, claim_agent_pod, create_agent_pod, stored_spec_hash
+from .delete import delete_agent_pods
+from .update import replace_agent_pod
+
+def track_agent(namespace, name, spec, pod):
+    """Remember the pod now serving an AgentType in the compact registry"""
+    agent = spec.get('agent') or {}
+    get_agent_registry().track(namespace, name, pod, image=agent.get('image'), spec_hash=stored_spec_hash(pod))
+
+async def reconcile_agent(name, namespace, spec, body, logger, resume=False):
+    """Make sure an AgentType has its pod, the way the create handler does
+
+    Shared by the create/resume handler and by shard adoption, so an adopted
+    AgentType is validated, autoscaled, packed, warm-started and queued for
+    quota exactly like one this replica saw created. `resume` is set when
+    the AgentType may already have pods from an earlier run or replica.
+    """
+    status_writer = get_status_writer()
+    status_writer.seed(namespace, name, body.get('status', {}).get('conditions'))
+
+    def set_status(phase, reason=None, message=None, status_type="Created"):
+        # Buffered and coalesced with other updates for this object
+        status_writer.update(namespace, name, make_condition(status_type, phase, reason, message))
+
+    def create_event(event_type, reason, message):
+        # Batched and aggregated by reason into real Kubernetes Events
+        get_event_recorder().record(object_ref(body), event_type, reason, message)
+
+    try:
+        # Checked and defaulted locally: an invalid spec fails before any API call
+        spec = validated_spec(spec)
+
+        # Create owner reference
+        owner_ref = agent_owner_ref(name, body['metadata']['uid'])
+
+        # Autoscaled AgentTypes keep the replica count in their status across operator restarts
+        autoscaler = get_autoscaler()
+        replicas = (body.get('status') or {}).get('scaling', {}).get('replicas')
+        scaled = autoscaler is not None and autoscaler.track(namespace, name, spec, owner_ref, replicas)
+        if scaled and autoscaler.is_scaled_to_zero(namespace, name):
+            logger.info("Scaled to zero; no pod until it is woken")
+            return {'status': 'scaledToZero'}
+
+        async def create_pod():
+            async with clients.concurrency():
+                claimed = await claim_agent_pod(name, namespace, spec, owner_ref)
+                if claimed is not None:
+                    return claimed
+                return await create_agent_pod(name, namespace, spec, owner_ref)
+
+        packer = get_pod_packer()
+        if packer is not None and packing_class(namespace, spec) is not None:
+            # One container of a pod shared with compatible AgentTypes
+            pod, action = await packer.assign(name, namespace, spec, owner_ref)
+            if action != 'unchanged' and resume:
+                # It may have run in a pod of its own before it opted in
+                await delete_agent_pods(name, namespace)
+        else:
+            # Create pod through the rate-limited work queue; creates that do not
+            # fit the namespace quota stay pending until the quota changes
+            while True:
+                try:
+                    pod, action = await get_work_queue().submit(f"{namespace}/{name}", namespace, PRIORITY_CREATE, create_pod)
+                    break
+                except QuotaExceeded as e:
+                    quota = get_quota_cache()
+                    if quota is None:
+                        raise
+                    logger.info("Waiting for quota: %s", e)
+                    status_writer.set_fields(namespace, name, phase='Pending', message=str(e))
+                    set_status('False', reason='QuotaExceeded', message=str(e))
+                    create_event('Warning', 'QuotaExceeded', str(e))
+                    await quota.wait_for_change(namespace, timeout=env_int('QUOTA_RECHECK_INTERVAL', 60))
+        if action == 'drifted':
+            # Changed in immutable fields while the operator was down
+            pod, action = await replace_agent_pod(name, namespace, spec, owner_ref, pod)
+        metadata = pod['metadata']
+        track_agent(namespace, name, spec, pod)
+        if scaled:
+            # The first pod exists now; the autoscaler adds the others
+            autoscaler.resync(namespace, name)
+
+        # Lazy %-formatting: records dropped by level or sampling are never formatted
+        logger.info("Pod %s %s", metadata['name'], action)
+        logger.debug("Pod %s in %s is %s", metadata['name'], metadata['namespace'], (pod.get('status') or {}).get('phase', 'Unknown'))
+        if action != 'unchanged':
+            set_status('True', reason='PodCreated', message=f"Created pod {metadata['name']}")
+            create_event('Normal', 'PodCreated', f"Created pod {metadata['name']}")
+
+        # Return a dict with string values only
+        return {
+            'pod_name': str(metadata['name']),
+            'namespace': str(metadata['namespace']),
+            'uid': str(metadata['uid']),
+            'status': action
+        }
+
+    except InvalidSpec as e:
+        logger.error("Invalid spec: %s", e)
+        set_status('False', reason='InvalidSpec', message=str(e))
+        create_event('Warning', 'InvalidSpec', str(e))
+        raise
+    except Exception as e:
+        logger.error("Error creating agent pod: %s", e)
+        set_status('False', reason='PodCreationFailed', message=str(e))
+        create_event('Warning', 'PodCreationFailed', str(e))
+        raise kopf.PermanentError(f"Failed to create agent pod: {str(e)}")
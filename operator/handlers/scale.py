@@ -0,0 +1,44 @@
+from ..utils import clients
+from ..utils.metrics import timed_handler
+from ..utils.podcache import get_pod_cache, is_packed, replica_index
+from .create import build_agent_pod, create_agent_pod, pod_spec_hash, stored_spec_hash
+from .update import delete_pod
+
+def _live_replicas(owner_ref):
+    """Cached pods of an AgentType that are not terminating, by replica index"""
+    replicas = {}
+    for pod in get_pod_cache().pods_for_owner(owner_ref['uid']):
+        if not pod['metadata'].get('deletionTimestamp') and not is_packed(pod):
+            replicas.setdefault(replica_index(pod), pod)
+    return replicas
+
+@timed_handler('scale_agent_pods', 'pods')
+async def scale_agent_pods(name, namespace, spec, owner_ref, replicas):
+    """Bring an autoscaled AgentType to `replicas` pods, indexed 0 to replicas - 1
+
+    Pods beyond the count are deleted, the highest index first, and extra
+    replicas rendered from an older spec are deleted and created again.
+    A replacement whose predecessor is still terminating cannot be created
+    yet; the autoscaler sees the missing replica and comes back for it.
+    Replica 0 is the `<name>-pod` every AgentType has, so spec updates keep
+    rolling it out. Returns the number of pods created and deleted.
+    """
+    api = await clients.get_core_api()
+    live = _live_replicas(owner_ref)
+
+    deleted = 0
+    for index in sorted(live, reverse=True):
+        pod = live[index]
+        stale = index > 0 and stored_spec_hash(pod) != pod_spec_hash(build_agent_pod(name, namespace, spec, owner_ref, index))
+        if index >= replicas or stale:
+            await delete_pod(api, pod)
+            del live[index]
+            deleted += 1
+
+    created = 0
+    for index in range(replicas):
+        if index not in live:
+            _, action = await create_agent_pod(name, namespace, spec, owner_ref, replica=index)
+            # 'drifted': the deleted pod of that name is still terminating
+            created += action == 'created'
+    return created, deleted
@@ -0,0 +1,45 @@
+import asyncio
+import logging
+
+from ..utils import clients
+from ..utils.podcache import get_pod_cache
+from ..utils.sharding import get_membership
+from .reconcile import reconcile_agent
+
+logger = logging.getLogger(__name__)
+
+async def adopt_shard(old_ring, new_ring):
+    """Take over AgentTypes that moved to this replica after a membership change
+
+    kopf only reports create events once, so objects that change owner are
+    listed once and reconciled here like a resumed AgentType, unchanged pods
+    being left alone.
+    """
+    identity = get_membership().identity
+
+    cache = get_pod_cache()
+    if cache is not None:
+        cache.request_relist()
+
+    custom_api = await clients.get_custom_api()
+    agents = await clients.call_json(
+        custom_api.list_cluster_custom_object,
+        group='agents.example.com', version='v1', plural='agenttypes'
+    )
+
+    async def adopt(agent):
+        metadata = agent['metadata']
+        await reconcile_agent(metadata['name'], metadata['namespace'], agent.get('spec') or {}, agent, logger, resume=True)
+
+    moved = []
+    for agent in agents.get('items') or []:
+        key = f"{agent['metadata']['namespace']}/{agent['metadata']['name']}"
+        if new_ring.owner(key) == identity and old_ring.owner(key) != identity:
+            moved.append(agent)
+    logger.info("Adopting %s AgentTypes after shard rebalance", len(moved))
+    # One failed adoption (API error, quota, permanent failure) must not
+    # abort the others or propagate into the membership renew loop
+    results = await asyncio.gather(*(adopt(agent) for agent in moved), return_exceptions=True)
+    for agent, result in zip(moved, results):
+        if isinstance(result, Exception):
+            logger.error("Failed to adopt %s/%s: %s", agent['metadata']['namespace'], agent['metadata']['name'], result)
@@ -0,0 +1,186 @@
+from kubernetes_asyncio.client.rest import ApiException
+
+from ..utils import clients
+from ..utils.metrics import timed_handler
+from ..utils.podcache import POOL_STATE_LABEL, get_pod_cache, is_packed, replica_index
+from ..utils.rollout import get_rollout
+from ..utils.workqueue import PRIORITY_UPDATE, get_work_queue
+from .create import SPEC_HASH_ANNOTATION, build_agent_pod, create_agent_pod, pod_spec_hash, stored_spec_hash
+from .podstatus import pod_ready
+
+# A separate manager owns only the fields it patches, so applying a partial
+# manifest never drops fields owned by the full apply in create_agent_pod
+ROLLOUT_FIELD_MANAGER = 'agent-operator-rollout'
+
+# Container images are the only pod fields Kubernetes lets us change in place
+IN_PLACE_FIELDS = {('agent', 'image'), ('sidecar', 'image'), ('toolProxy', 'image')}
+# Fields, or whole sections, that only affect how pods are obtained, not the pods themselves
+NO_POD_CHANGE = {('agent', 'warmStart'), ('agent', 'name'), ('scaling',), ('packing',)}
+
+def spec_diff(old, new, path=()):
+    """Structural diff of two specs as (path, old, new) leaves; lists compare as a whole"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in sorted(old.keys() | new.keys()):
+            changes.extend(spec_diff(old.get(key), new.get(key), path + (key,)))
+        return changes
+    return [] if old == new else [(path, old, new)]
+
+def plan_update(old_spec, new_spec):
+    """Map a spec diff to the pod change it needs: 'none', 'patch' or 'replace'"""
+    changes = [change for change in spec_diff(old_spec, new_spec) if not any(change[0][:len(path)] == path for path in NO_POD_CHANGE)]
+    if not changes:
+        return 'none'
+    if all(path in IN_PLACE_FIELDS and new for path, _, new in changes):
+        return 'patch'
+    return 'replace'
+
+def image_patch(pod, old_pod, new_pod, spec_hash):
+    """Server-side apply body with only the changed container images and the new spec hash"""
+    old_images = {container['name']: container['image'] for container in old_pod['spec']['containers']}
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Pod',
+        'metadata': {
+            'name': pod['metadata']['name'],
+            'namespace': pod['metadata']['namespace'],
+            'annotations': {SPEC_HASH_ANNOTATION: spec_hash}
+        },
+        'spec': {
+            'containers': [
+                {'name': container['name'], 'image': container['image']}
+                for container in new_pod['spec']['containers']
+                if old_images.get(container['name']) != container['image']
+            ]
+        }
+    }
+
+async def _live_pod(api, name, namespace, owner_ref):
+    """The pod currently serving an AgentType, which may be a claimed standby pod"""
+    cache = get_pod_cache()
+    if cache is not None and cache.synced.is_set():
+        # Extra replicas of an autoscaled AgentType are replaced by its autoscaler, packed pods by the packer
+        pods = [pod for pod in cache.pods_for_owner(owner_ref['uid']) if replica_index(pod) == 0 and not is_packed(pod)]
+        return pods[0] if pods else None
+    try:
+        return await clients.call_json(api.read_namespaced_pod, name=f"{name}-pod", namespace=namespace)
+    except ApiException as e:
+        if e.status == 404:
+            return None
+        raise
+
+@timed_handler('update_agent_pod', 'pods')
+async def patch_or_delete_pod(name, namespace, old_spec, new_spec, owner_ref):
+    """Patch container images in place when possible, else delete the pod for replacement
+
+    Returns the pod and what was done: 'unchanged', 'patched', 'deleted',
+    or 'created' when there was no pod to update.
+    """
+    api = await clients.get_core_api()
+    live = await _live_pod(api, name, namespace, owner_ref)
+    if live is None:
+        return await create_agent_pod(name, namespace, new_spec, owner_ref)
+
+    new_pod = build_agent_pod(name, namespace, new_spec, owner_ref)
+    spec_hash = pod_spec_hash(new_pod)
+    if stored_spec_hash(live) == spec_hash:
+        return live, 'unchanged'
+
+    old_pod = build_agent_pod(name, namespace, old_spec, owner_ref)
+    # Claimed standby pods carry no spec hash but were rendered from the old spec
+    matches_old = stored_spec_hash(live) == pod_spec_hash(old_pod) or \
+        (live['metadata'].get('labels') or {}).get(POOL_STATE_LABEL) == 'claimed'
+    if matches_old and plan_update(old_spec, new_spec) == 'patch':
+        patched = await clients.call_json(
+            api.patch_namespaced_pod,
+            name=live['metadata']['name'],
+            namespace=namespace,
+            body=image_patch(live, old_pod, new_pod, spec_hash),
+            field_manager=ROLLOUT_FIELD_MANAGER,
+            force=True,
+            _content_type='application/apply-patch+yaml'
+        )
+        return patched, 'patched'
+
+    return await delete_pod(api, live), 'deleted'
+
+async def delete_pod(api, live):
+    """Delete a pod for replacement; the uid precondition keeps a retry from deleting the replacement"""
+    try:
+        await clients.call_json(
+            api.delete_namespaced_pod,
+            name=live['metadata']['name'],
+            namespace=live['metadata']['namespace'],
+            body={'preconditions': {'uid': live['metadata']['uid']}}
+        )
+    except ApiException as e:
+        if e.status != 404:
+            raise
+    return live
+
+async def _recreate(queue, rollout, name, namespace, spec, owner_ref, deleted):
+    """Create the pod again once the deleted one is gone"""
+    uid = deleted['metadata']['uid']
+    await rollout.wait(namespace, deleted['metadata']['name'], lambda current: current is None or current['metadata']['uid'] != uid)
+
+    async def create_pod():
+        async with clients.concurrency():
+            return await create_agent_pod(name, namespace, spec, owner_ref)
+
+    pod, _ = await queue.submit(f"{namespace}/{name}", namespace, PRIORITY_UPDATE, create_pod)
+    return pod
+
+def _ready_with(spec_hash):
+    return lambda current: current is not None and stored_spec_hash(current) == spec_hash and pod_ready(current)
+
+async def update_agent_pod(name, namespace, old_spec, new_spec, owner_ref):
+    """Roll a spec change out to an AgentType's pod with the least disruption
+
+    Image-only changes are patched in place; any other pod change deletes
+    the pod and creates it again once it is gone. Each update holds a
+    rollout slot until its pod is Ready with the new spec.
+
+    Returns the pod (None if the change does not touch it) and what was
+    done: 'unchanged', 'patched', 'replaced' or 'created'.
+    """
+    if plan_update(old_spec, new_spec) == 'none':
+        return None, 'unchanged'
+
+    queue = get_work_queue()
+    rollout = get_rollout()
+    key = f"{namespace}/{name}"
+    spec_hash = pod_spec_hash(build_agent_pod(name, namespace, new_spec, owner_ref))
+
+    async def update_pod():
+        async with clients.concurrency():
+            return await patch_or_delete_pod(name, namespace, old_spec, new_spec, owner_ref)
+
+    async with rollout.slot():
+        pod, action = await queue.submit(key, namespace, PRIORITY_UPDATE, update_pod)
+        if action == 'deleted':
+            pod = await _recreate(queue, rollout, name, namespace, new_spec, owner_ref, pod)
+            action = 'replaced'
+        if action != 'unchanged':
+            await rollout.wait(namespace, pod['metadata']['name'], _ready_with(spec_hash))
+    return pod, action
+
+async def replace_agent_pod(name, namespace, spec, owner_ref, live):
+    """Replace a pod that drifted from its spec in fields that cannot be patched
+
+    Used when create_agent_pod reports 'drifted', e.g. after the spec
+    changed while the operator was down. Holds a rollout slot like a spec
+    update. Returns the new pod and 'replaced'.
+    """
+    queue = get_work_queue()
+    rollout = get_rollout()
+    spec_hash = pod_spec_hash(build_agent_pod(name, namespace, spec, owner_ref))
+
+    async def delete_live():
+        async with clients.concurrency():
+            return await delete_pod(await clients.get_core_api(), live)
+
+    async with rollout.slot():
+        deleted = await queue.submit(f"{namespace}/{name}", namespace, PRIORITY_UPDATE, delete_live)
+        pod = await _recreate(queue, rollout, name, namespace, spec, owner_ref, deleted)
+        await rollout.wait(namespace, pod['metadata']['name'], _ready_with(spec_hash))
+    return pod, 'replaced'
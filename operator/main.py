@@ -1,96 +1,343 @@
+from .utils.startup import timer as startup_timer
+from .utils.lazyimport import defer_imports
+import os
+
+# Before kopf, which imports both Kubernetes clients for optional type
+# support: API and model classes are then only loaded once they are used
+defer_imports('kubernetes_asyncio', 'kubernetes_asyncio.client', 'kubernetes_asyncio.client.api',
+              'kubernetes_asyncio.client.models', 'kubernetes')
+
 import kopf
-from kubernetes import client
-from kubernetes.client.rest import ApiException
-import datetime
-from datetime import timezone
-import logging
-import json
-from .handlers.create import create_agent_pod
-
-@kopf.on.create('agents.example.com', 'v1', 'agenttypes')
-def create_agent(spec, name, namespace, logger, body, **kwargs):
-    """Create a pod when an AgentType resource is created"""
-    custom_api = client.CustomObjectsApi()
-    
-    logger.setLevel(logging.DEBUG)
-
-    isItString = datetime.datetime.utcnow().isoformat()
-    logger.info(f"is it a string? {isItString} {isinstance(isItString, str)}")
-    
-    def set_status(phase, reason=None, message=None, status_type="Created"):
-        conditions = [{
-            'type': status_type,
-            'status': phase,
-            'lastTransitionTime': datetime.datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
-            'reason': reason,
-            'message': message
-        }]
+from kubernetes_asyncio.client.rest import ApiException
+from .handlers.create import agent_owner_ref
+from .handlers.delete import delete_agent_pods
+from .handlers.podstatus import reconcile_pod_status
+from .handlers.reconcile import reconcile_agent, track_agent
+from .handlers.shard import adopt_shard
+from .handlers.update import update_agent_pod
+from .utils import clients
+from .utils.artifacts import get_artifact_cache
+from .utils.checkpoint import Checkpoint
+from .utils.autoscaler import get_autoscaler, start_autoscaler, stop_autoscaler
+from .utils import sharding
+from .utils.config import env_bool, env_int, env_float, env_str
+from .utils.events import close_event_recorder, get_event_recorder, init_event_recorder, object_ref
+from .utils.logs import setup_logging
+from .utils.metrics import count_kopf_relists, record_startup, register_stats, start_metrics_server, stop_metrics_server, timed_handler
+from .utils.packing import get_pod_packer, packing_class, start_pod_packer, stop_pod_packer
+from .utils.placement import start_placement, stop_placement
+from .utils.podcache import POOL_STATE_LABEL, agent_owner, start_pod_cache, stop_pod_cache
+from .utils.quota import start_quota_cache, stop_quota_cache
+from .utils.registry import get_agent_registry, init_agent_registry
+from .utils.schema import InvalidSpec, fetch_crd, get_spec_validator, init_spec_validator
+from .utils.rollout import init_rollout
+from .utils.status import init_status_writer, get_status_writer, close_status_writer, make_condition
+from .utils.template import init_pod_template, operator_image
+from .utils.warmpool import start_warm_pool, stop_warm_pool
+from .utils.workqueue import PRIORITY_DELETE, init_work_queue, get_work_queue, close_work_queue
+
+# Set or changed by a client, e.g. a gateway holding the first request, to wake an AgentType scaled to zero
+WAKE_ANNOTATION = 'agents.example.com/wake'
+
+startup_timer.mark('imports')
+
+@kopf.on.startup()
+async def configure_operator(settings: kopf.OperatorSettings, **kwargs):
+    """Build the operator settings once, instead of in every handler invocation"""
+    # kopf keeps its default progress storage: status.conditions is the
+    # condition list written by the StatusWriter, not a dict kopf may own.
+    # Events go through the batched recorder; kopf would post one per log line
+    settings.posting.enabled = False
+    # kopf lists AgentTypes once, then resumes its watch from the last seen
+    # resourceVersion (kept fresh by bookmarks) each time a watch request
+    # ends; long requests mean fewer reconnects, and a short backoff resumes
+    # before the version can expire
+    settings.watching.server_timeout = env_int('WATCH_SERVER_TIMEOUT', 600)
+    settings.watching.client_timeout = settings.watching.server_timeout + 60
+    settings.watching.connect_timeout = env_int('WATCH_CONNECT_TIMEOUT', 10)
+    settings.watching.reconnect_backoff = env_float('WATCH_RECONNECT_BACKOFF', 0.1)
+    # Newer kopf releases can page the initial LIST, or stream it in the watch (Kubernetes 1.34+)
+    if hasattr(settings.watching, 'chunk_size'):
+        settings.watching.chunk_size = env_int('WATCH_LIST_CHUNK_SIZE', 500)
+    if hasattr(settings.watching, 'initial_streaming'):
+        settings.watching.initial_streaming = env_bool('WATCH_INITIAL_STREAMING')
+    # AgentType relists show up next to the pod informer's
+    count_kopf_relists()
+    startup_timer.mark('kopf_init')
+
+@kopf.on.startup()
+async def init_api_clients(logger, **kwargs):
+    """Create the shared, pooled API clients once per operator process"""
+    await clients.init_clients(
+        pool_maxsize=env_int('API_POOL_MAXSIZE', 32),
+        keepalive_idle=env_int('API_KEEPALIVE_IDLE', 30),
+        max_concurrency=env_int('MAX_CONCURRENT_RECONCILES', 256)
+    )
+    init_status_writer(window=env_float('STATUS_PATCH_WINDOW', 1.0))
+    registry = init_agent_registry()
+    init_event_recorder(window=env_float('EVENT_FLUSH_WINDOW', 1.0))
+    init_work_queue(
+        workers=env_int('WORKQUEUE_WORKERS', 32),
+        global_rate=env_float('WORKQUEUE_QPS', 50.0),
+        global_burst=env_int('WORKQUEUE_BURST', 100),
+        namespace_rate=env_float('WORKQUEUE_NAMESPACE_QPS', 10.0),
+        namespace_burst=env_int('WORKQUEUE_NAMESPACE_BURST', 20),
+        max_retries=env_int('WORKQUEUE_MAX_RETRIES', 5)
+    )
+    # Tool-proxy sidecars run the exact image (tag or digest) this operator runs
+    init_pod_template(tool_proxy_image=env_str('TOOL_PROXY_IMAGE') or await operator_image())
+    startup_timer.mark('api_clients')
+    logger.info("Initialized shared Kubernetes API clients")
+
+    metrics_port = env_int('METRICS_PORT', 9090)
+    if metrics_port:
+        register_stats('agent_operator_api_pool_requests', 'API requests by connection pool hit/miss', clients.pool_stats)
+        register_stats('agent_operator_tracked_agents', 'AgentType records tracked, phase transitions and records forgotten', lambda: registry.stats)
+        port = start_metrics_server(metrics_port)
+        logger.info("Serving metrics on port %s", port)
+    startup_timer.mark('metrics')
+
+    if env_bool('SPEC_VALIDATION', True):
         try:
-            custom_api.patch_namespaced_custom_object_status(
-                group="agents.example.com",
-                version="v1",
-                name=name,
-                namespace=namespace,
-                plural="agenttypes",
-                body={'status': {'conditions': conditions}},
-                field_manager='kopf'
-            )
+            validator = init_spec_validator(await fetch_crd(), cache_size=env_int('SPEC_VALIDATION_CACHE_SIZE', 4096))
         except ApiException as e:
-            logger.error(f"Error updating status: {e}")
-    
-    def create_event(event_type, reason, message):
-        if event_type == 'Normal':
-            logger.info(f"Event: {reason} - {message}")
-        elif event_type == 'Warning':
-            logger.warning(f"Event: {reason} - {message}")
-        elif event_type == 'Error':
-            logger.error(f"Event: {reason} - {message}")
-    
-    settings = kopf.OperatorSettings()
-    settings.persistence.progress_storage = kopf.StatusProgressStorage(field='status.conditions')
+            logger.warning("Not validating AgentType specs locally, reading the CRD failed: %s %s", e.status, e.reason)
+        else:
+            if metrics_port:
+                register_stats('agent_operator_spec_validation', 'Spec validation cache hits, misses and invalid specs', lambda: validator.stats)
+            logger.info("Compiled the AgentType schema for local validation")
+        startup_timer.mark('schema')
 
+    membership = None
+    if env_bool('SHARDING_ENABLED'):
+        membership = await sharding.start_sharding(
+            namespace=env_str('POD_NAMESPACE', 'default'),
+            identity=sharding.default_identity(),
+            lease_duration=env_int('SHARD_LEASE_DURATION', 30),
+            renew_interval=env_int('SHARD_RENEW_INTERVAL', 10)
+        )
+        logger.info("Joined shard group as %s, members: %s", membership.identity, membership.ring.members)
+        startup_timer.mark('sharding')
 
-    try:
-        # Add immediate debug log to track process start
-        logger.info("Starting pod creation handler")
-        
-        # Create owner reference
-        owner_ref = {
-            'apiVersion': 'agents.example.com/v1',
-            'kind': 'AgentType',
-            'name': name,
-            'uid': body['metadata']['uid'],
-            'controller': True,
-            'blockOwnerDeletion': True
-        }
-        
-        # Create pod using handler
-        created_pod = create_agent_pod(name, namespace, spec, owner_ref)
-        
-        # Keep all the useful debug logs
-        logger.info(f"Created pod {created_pod.metadata.name}")
-        logger.debug(f"Pod details:")
-        logger.debug(f"  Name: {created_pod.metadata.name}")
-        logger.debug(f"  Namespace: {created_pod.metadata.namespace}")
-        logger.debug(f"  Phase: {created_pod.status.phase if created_pod.status else 'Unknown'}")
-        
-        # Return a dict with string values only
-        return {
-            'pod_name': str(created_pod.metadata.name),
-            'namespace': str(created_pod.metadata.namespace),
-            'uid': str(created_pod.metadata.uid),
-            'status': 'created'
-        }
+    state_dir = env_str('INFORMER_STATE_DIR')
+    pod_cache = await start_pod_cache(
+        watch_timeout=env_int('POD_WATCH_TIMEOUT', 300),
+        filter=owned_pod if membership is not None else None,
+        checkpoint=Checkpoint(os.path.join(state_dir, 'pods.json.gz'), env_int('INFORMER_CHECKPOINT_INTERVAL', 60)) if state_dir else None
+    )
+    pod_cache.add_listener(reconcile_pod_status)
+    logger.info("Started managed pod cache")
+
+    rollout = init_rollout(
+        max_unavailable=env_int('ROLLOUT_MAX_UNAVAILABLE', 20),
+        timeout=env_int('ROLLOUT_TIMEOUT', 300)
+    )
+    pod_cache.add_listener(rollout.on_pod_event)
+    startup_timer.mark('pod_cache')
+
+    if env_bool('QUOTA_PREADMISSION', True):
+        await start_quota_cache(watch_timeout=env_int('POD_WATCH_TIMEOUT', 300))
+        logger.info("Started ResourceQuota/LimitRange cache")
+        startup_timer.mark('quota_cache')
+
+    if env_bool('PLACEMENT_IMAGE_LOCALITY'):
+        await start_placement(
+            min_image_bytes=env_int('PLACEMENT_MIN_IMAGE_BYTES', 100 * 2**20),
+            max_nodes=env_int('PLACEMENT_MAX_NODES', 50),
+            pull_bandwidth=env_float('PLACEMENT_PULL_BANDWIDTH', 50e6),
+            watch_timeout=env_int('POD_WATCH_TIMEOUT', 300)
+        )
+        logger.info("Started node image cache for image-locality placement")
+        startup_timer.mark('placement')
+
+    artifacts = await get_artifact_cache().load()
+    logger.info("Loaded %s cached glue code/SDK artifacts", artifacts)
+    startup_timer.mark('artifact_cache')
+
+    warm_pool_size = env_int('WARM_POOL_SIZE', 0)
+    start_warm_pool(size=warm_pool_size, refill_interval=env_int('WARM_POOL_REFILL_INTERVAL', 30),
+                    idle_ttl=env_int('WARM_POOL_IDLE_TTL', 1800))
+    if warm_pool_size:
+        logger.info("Keeping %s standby pods per warm pool", warm_pool_size)
+
+    if env_bool('AUTOSCALING_ENABLED', True):
+        autoscaler = start_autoscaler(interval=env_int('AUTOSCALER_INTERVAL', 15), timeout=env_float('AUTOSCALER_SCRAPE_TIMEOUT', 2.0))
+        if metrics_port:
+            register_stats('agent_operator_autoscaler', 'Autoscaler evaluations, load scrapes and scaling decisions', lambda: autoscaler.stats)
+        logger.info("Started the AgentType autoscaler")
+
+    packing_max_agents = env_int('PACKING_MAX_AGENTS', 0)
+    if packing_max_agents:
+        packer = start_pod_packer(
+            max_agents=packing_max_agents,
+            window=env_float('PACKING_WINDOW', 2.0),
+            min_fill=env_float('PACKING_MIN_FILL', 0.5)
+        )
+        if metrics_port:
+            register_stats('agent_operator_packing', 'Agents packed, pods created and members released or repacked', lambda: packer.stats)
+        logger.info("Packing up to %s compatible AgentTypes per pod", packing_max_agents)
+
+    if membership is not None:
+        membership.add_listener(adopt_shard)
+
+    startup_timer.mark('warm_pool')
+    record_startup()
+    logger.info("Operator started %.3fs after exec (%s)", startup_timer.elapsed(), startup_timer.report())
+
+@kopf.on.cleanup()
+async def close_api_clients(logger, **kwargs):
+    """Release the shared API clients on shutdown"""
+    await sharding.stop_sharding()
+    await stop_warm_pool()
+    await stop_autoscaler()
+    stop_pod_packer()
+    await stop_pod_cache()
+    await stop_quota_cache()
+    await stop_placement()
+    await close_work_queue()
+    await close_status_writer()
+    await close_event_recorder()
+    logger.info("API connection pool stats: %s", clients.pool_stats())
+    await clients.close_clients()
+    stop_metrics_server()
 
+def owned_by_shard(name, namespace, **kwargs):
+    """Handler filter: only handle AgentTypes hashed to this replica"""
+    return sharding.owns(namespace, name)
+
+def owned_pod(pod):
+    """Pod cache filter: only keep pods of AgentTypes hashed to this replica
+
+    Unclaimed standby pods are shared by all replicas; claims are conditional.
+    """
+    if (pod['metadata'].get('labels') or {}).get(POOL_STATE_LABEL) == 'standby':
+        return True
+    owner = agent_owner(pod)
+    return owner is not None and sharding.owns(pod['metadata']['namespace'], owner)
+
+@kopf.on.resume('agents.example.com', 'v1', 'agenttypes', when=owned_by_shard)
+@kopf.on.create('agents.example.com', 'v1', 'agenttypes', when=owned_by_shard)
+@timed_handler('create_agent', 'agenttypes')
+async def create_agent(spec, name, namespace, logger, body, **kwargs):
+    """Create a pod when an AgentType resource is created (or re-check it on resume)"""
+    return await reconcile_agent(name, namespace, spec, body, logger, resume=kwargs.get('reason') == 'resume')
+
+@kopf.on.update('agents.example.com', 'v1', 'agenttypes', field='spec', when=owned_by_shard)
+@timed_handler('update_agent', 'agenttypes')
+async def update_agent(old, new, name, namespace, logger, body, **kwargs):
+    """Roll a spec change out to the AgentType's pod, in place where possible"""
+    status_writer = get_status_writer()
+    status_writer.seed(namespace, name, body.get('status', {}).get('conditions'))
+    owner_ref = agent_owner_ref(name, body['metadata']['uid'])
+
+    validator = get_spec_validator()
+    if validator is not None:
+        try:
+            new = validator.validate(new or {})
+        except InvalidSpec as e:
+            logger.error("Invalid spec: %s", e)
+            status_writer.update(namespace, name, make_condition('Updated', 'False', 'InvalidSpec', str(e)))
+            get_event_recorder().record(object_ref(body), 'Warning', 'InvalidSpec', str(e))
+            raise
+        # Defaulted alike, so defaults are never mistaken for a change
+        old = validator.defaulted(old or {})
+
+    autoscaler = get_autoscaler()
+    scaled = autoscaler is not None and autoscaler.track(namespace, name, new or {}, owner_ref)
+    if scaled and autoscaler.is_scaled_to_zero(namespace, name):
+        logger.info("Scaled to zero; the new spec applies when it is woken")
+        return {'status': 'scaledToZero'}
+
+    packer = get_pod_packer()
+    try:
+        if packer is not None and packing_class(namespace, new or {}) is not None:
+            pod, action = await packer.assign(name, namespace, new or {}, owner_ref)
+            if action == 'packed':
+                # Its own pod is replaced by the container in the shared one
+                await delete_agent_pods(name, namespace)
+        else:
+            if packer is not None and await packer.release(namespace, name):
+                # Left its shared pod; update_agent_pod gives it one of its own
+                old = {}
+            pod, action = await update_agent_pod(name, namespace, old or {}, new or {}, owner_ref)
     except Exception as e:
-        logger.error(f"Error creating agent pod: {str(e)}")
-        raise kopf.PermanentError(f"Failed to create agent pod: {str(e)}")
+        logger.error("Error updating agent pod: %s", e)
+        status_writer.update(namespace, name, make_condition('Updated', 'False', 'PodUpdateFailed', str(e)))
+        get_event_recorder().record(object_ref(body), 'Warning', 'PodUpdateFailed', str(e))
+        raise kopf.PermanentError(f"Failed to update agent pod: {str(e)}")
+    if scaled:
+        # The update rolled out the first pod; the autoscaler replaces the others
+        autoscaler.resync(namespace, name)
+
+    if pod is None:
+        logger.info("Spec change does not affect the pod")
+        return {'status': action}
+
+    metadata = pod['metadata']
+    track_agent(namespace, name, new or {}, pod)
+    logger.info("Pod %s %s", metadata['name'], action)
+    if action != 'unchanged':
+        reason = f"Pod{action.capitalize()}"
+        status_writer.update(namespace, name, make_condition('Updated', 'True', reason, f"Pod {metadata['name']} {action}"))
+        get_event_recorder().record(object_ref(body), 'Normal', reason, f"Pod {metadata['name']} {action}")
+    return {
+        'pod_name': str(metadata['name']),
+        'namespace': str(metadata['namespace']),
+        'status': action
+    }
+
+def forget_agent(namespace, name):
+    """Stop writing status and Events for an AgentType that is going away"""
+    get_status_writer().mark_deleted(namespace, name)
+    get_event_recorder().forget(namespace, name)
+    get_agent_registry().forget(namespace, name)
+    autoscaler = get_autoscaler()
+    if autoscaler is not None:
+        autoscaler.forget(namespace, name)
+
+@kopf.on.event('agents.example.com', 'v1', 'agenttypes', when=owned_by_shard)
+async def watch_agent_deletion(type, body, name, namespace, **kwargs):
+    """Notice AgentTypes being deleted, including those no delete handler runs for"""
+    if type == 'DELETED' or body['metadata'].get('deletionTimestamp'):
+        forget_agent(namespace, name)
+        packer = get_pod_packer()
+        if packer is not None:
+            await packer.release(namespace, name)
+
+@kopf.on.field('agents.example.com', 'v1', 'agenttypes', field=['metadata', 'annotations', WAKE_ANNOTATION], when=owned_by_shard)
+async def wake_agent(name, namespace, new, logger, **kwargs):
+    """Bring an AgentType scaled to zero back when a client sets or bumps its wake annotation"""
+    autoscaler = get_autoscaler()
+    if new and autoscaler is not None and autoscaler.wake(namespace, name) is not None:
+        logger.info("Waking from zero replicas")
+
+@kopf.on.delete('agents.example.com', 'v1', 'agenttypes', optional=True, when=owned_by_shard)
+@timed_handler('delete_agent', 'agenttypes')
+async def delete_agent(name, namespace, logger, **kwargs):
+    """Delete the AgentType's pods in one call instead of leaving them to the garbage collector
+
+    Optional, so no finalizer is added: it runs while a foreground deletion
+    keeps the AgentType around, and ownerReferences still cascade otherwise.
+    """
+    forget_agent(namespace, name)
+
+    async def delete_pods():
+        async with clients.concurrency():
+            return await delete_agent_pods(name, namespace)
+
+    deleted = await get_work_queue().submit(f"{namespace}/{name}", namespace, PRIORITY_DELETE, delete_pods)
+    logger.info("Deleted %d pods", deleted)
 
 def main():
-    settings = kopf.OperatorSettings()
-    settings.persistence.progress_storage = kopf.StatusProgressStorage(field='status.conditions')
-    kopf.configure(settings, verbose=True)
-    kopf.run(clusterwide=True)
+    kopf.configure(debug=env_bool('OPERATOR_DEBUG'), verbose=True)
+    setup_logging(
+        json_format=env_str('LOG_FORMAT') == 'json',
+        rate=env_float('LOG_RATE', 10.0),
+        burst=env_int('LOG_BURST', 20),
+        sample=env_float('LOG_SAMPLE', 1.0)
+    )
+    # Sharded replicas must not pause each other through kopf peering
+    kopf.run(clusterwide=True, standalone=env_bool('SHARDING_ENABLED'))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
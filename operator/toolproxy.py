@@ -0,0 +1,278 @@
+"""Tool and LLM API proxy, run as the `tool-proxy` sidecar of agent pods
+
+    python toolproxy.py --upstream http://tools.internal:8000
+
+Settings default to the TOOL_PROXY_* variables the operator injects from
+the AgentType's spec.toolProxy. Agents call $TOOL_PROXY_URL instead of the
+upstream; the proxy keeps pooled keep-alive connections to it, answers
+repeated idempotent calls from an LRU/TTL cache and sends identical
+concurrent calls upstream once. The operator's autoscaler reads its load
+(calls in flight and a running call count) from /_proxy/load on a second,
+pod-wide port. Only the standard library and aiohttp are used, so it runs
+straight from the operator image.
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import logging
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+from multidict import CIMultiDict
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_METHODS = frozenset(('GET', 'HEAD'))
+# Statuses that stay valid for the same request (RFC 9111 heuristically cacheable)
+CACHEABLE_STATUSES = frozenset((200, 203, 204, 300, 301, 404, 405, 410, 414, 501))
+# Request headers that select a different response from the upstream
+VARY_HEADERS = ('Authorization', 'Accept', 'Accept-Language')
+HOP_BY_HOP = frozenset(h.lower() for h in (
+    'Connection', 'Keep-Alive', 'Proxy-Authenticate', 'Proxy-Authorization', 'TE', 'Trailer',
+    'Transfer-Encoding', 'Upgrade', 'Host', 'Content-Length'
+))
+# aiohttp decompresses upstream bodies, so their encoding headers no longer apply
+DECODED = frozenset(('content-encoding', 'content-length'))
+CONTROL_PREFIX = '/_proxy/'
+
+class CachedResponse:
+    __slots__ = ('status', 'headers', 'body', 'expires')
+
+    def __init__(self, status, headers, body, expires=0.0):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+
+def cache_key(method, path_qs, headers):
+    """Digest of everything that selects the response; credentials are not kept in memory"""
+    parts = [method, path_qs] + [headers.get(name, '') for name in VARY_HEADERS]
+    return hashlib.sha256('\0'.join(parts).encode()).digest()
+
+def response_ttl(headers, default):
+    """Seconds a response may be cached for: Cache-Control caps the default, 0 when it forbids storing"""
+    directives = {}
+    for directive in headers.get('Cache-Control', '').lower().split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name] = value
+    if {'no-store', 'no-cache', 'private'} & directives.keys():
+        return 0
+    if 'max-age' in directives:
+        try:
+            return min(default, int(directives['max-age']))
+        except ValueError:
+            return 0
+    return default
+
+class ResponseCache:
+    """LRU of upstream responses, each valid for its own TTL
+
+    Bounded by entry count and by the size of a single body, so one large
+    download cannot push out every small tool response.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60.0, max_body_bytes=2**20):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_body_bytes = max_body_bytes
+        self._entries = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'stored': 0, 'uncacheable': 0, 'expired': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= (time.monotonic() if now is None else now):
+            del self._entries[key]
+            self.stats['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, response, now=None):
+        """Store a response unless its status, size or Cache-Control rule it out"""
+        ttl = response_ttl(response.headers, self.ttl)
+        if response.status not in CACHEABLE_STATUSES or ttl <= 0 or len(response.body) > self.max_body_bytes:
+            self.stats['uncacheable'] += 1
+            return False
+        response.expires = (time.monotonic() if now is None else now) + ttl
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        self.stats['stored'] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+        return True
+
+class ToolProxy:
+    """Reverse proxy to one upstream over a pooled keep-alive session"""
+
+    def __init__(self, upstream, cache=None, pool_size=32, keepalive=30.0, timeout=30.0):
+        self.upstream = upstream.rstrip('/')
+        self.cache = cache if cache is not None else ResponseCache()
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.session = None
+        self._inflight = {}
+        self.stats = {'requests': 0, 'upstream': 0, 'errors': 0}
+        self.inflight = 0
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        self.session = None
+
+    async def forward(self, method, path_qs, headers, body):
+        """Send one request upstream; failures become a 502 response, never an exception"""
+        self.stats['upstream'] += 1
+        headers = {name: value for name, value in headers.items() if name.lower() not in HOP_BY_HOP}
+        try:
+            async with self.session.request(method, self.upstream + path_qs, headers=headers, data=body or None,
+                                            allow_redirects=False) as response:
+                payload = await response.read()
+                kept = [(name, value) for name, value in response.headers.items()
+                        if name.lower() not in HOP_BY_HOP and name.lower() not in DECODED]
+                return CachedResponse(response.status, _Headers(kept), payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.stats['errors'] += 1
+            logger.warning("Upstream %s %s failed: %r", method, path_qs, e)
+            return CachedResponse(502, _Headers([('Content-Type', 'text/plain')]), f"Upstream request failed: {e!r}\n".encode())
+
+    async def _fetch(self, key, method, path_qs, headers):
+        try:
+            response = await self.forward(method, path_qs, headers, None)
+            self.cache.put(key, response)
+            return response
+        finally:
+            self._inflight.pop(key, None)
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        self.inflight += 1
+        try:
+            return await self._handle(request)
+        finally:
+            self.inflight -= 1
+
+    async def _handle(self, request):
+        if request.method not in CACHEABLE_METHODS:
+            response = await self.forward(request.method, request.path_qs, request.headers, await request.read())
+            return _to_web(response, 'BYPASS')
+
+        key = cache_key(request.method, request.path_qs, request.headers)
+        if 'no-cache' not in request.headers.get('Cache-Control', ''):
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.stats['hits'] += 1
+                return _to_web(cached, 'HIT')
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.cache.stats['misses'] += 1
+            state = 'MISS'
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(key, request.method, request.path_qs, request.headers))
+        else:
+            self.cache.stats['coalesced'] += 1
+            state = 'COALESCED'
+        # Shielded: a caller going away must not cancel the request others wait for
+        return _to_web(await asyncio.shield(task), state)
+
+    async def stats_handler(self, request):
+        return web.json_response({'proxy': self.stats, 'cache': dict(self.cache.stats, entries=len(self.cache))})
+
+    async def health_handler(self, request):
+        return web.Response(text='ok\n')
+
+    async def load_handler(self, request):
+        """Load signal for the autoscaler: calls in flight now and calls handled so far"""
+        return web.json_response({'inflight': self.inflight, 'requests': self.stats['requests']})
+
+class _Headers(list):
+    """Response headers as (name, value) pairs, keeping repeats such as Set-Cookie"""
+
+    def get(self, name, default=''):
+        name = name.lower()
+        return next((value for key, value in self if key.lower() == name), default)
+
+def _to_web(response, state):
+    headers = [*response.headers, ('X-Cache', state)]
+    return web.Response(status=response.status, body=response.body, headers=CIMultiDict(headers))
+
+def make_app(proxy):
+    """aiohttp application serving the proxy, with its stats and health under /_proxy/"""
+    app = web.Application()
+
+    async def on_startup(app):
+        await proxy.start()
+
+    async def on_cleanup(app):
+        await proxy.close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get(f"{CONTROL_PREFIX}stats", proxy.stats_handler)
+    app.router.add_get(f"{CONTROL_PREFIX}healthz", proxy.health_handler)
+    app.router.add_get(f"{CONTROL_PREFIX}load", proxy.load_handler)
+    app.router.add_route('*', '/{path:.*}', proxy.handle)
+    return app
+
+def make_load_app(proxy):
+    """aiohttp application serving only the load signal, for the pod-wide port"""
+    app = web.Application()
+    app.router.add_get(f"{CONTROL_PREFIX}load", proxy.load_handler)
+    app.router.add_get(f"{CONTROL_PREFIX}healthz", proxy.health_handler)
+    return app
+
+async def serve(proxy, host, port, load_port):
+    """Serve the proxy on host:port and its load signal on every interface, until cancelled"""
+    runners = [web.AppRunner(make_app(proxy)), web.AppRunner(make_load_app(proxy))]
+    for runner in runners:
+        await runner.setup()
+    await web.TCPSite(runners[0], host, port).start()
+    await web.TCPSite(runners[1], '0.0.0.0', load_port).start()
+    logger.info("Proxying %s:%s to %s, load on port %s", host, port, proxy.upstream, load_port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+def main(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="Caching, connection-pooling proxy for agent tool calls")
+    parser.add_argument('--upstream', default=env('TOOL_PROXY_UPSTREAM'), help="Base URL of the tool/LLM API")
+    parser.add_argument('--host', default=env('TOOL_PROXY_HOST', '127.0.0.1'), help="Only the pod's own containers should reach it")
+    parser.add_argument('--port', type=int, default=int(env('TOOL_PROXY_PORT', '8080')))
+    parser.add_argument('--load-port', type=int, default=int(env('TOOL_PROXY_LOAD_PORT', '9091')))
+    parser.add_argument('--cache-ttl', type=float, default=float(env('TOOL_PROXY_CACHE_TTL', '60')))
+    parser.add_argument('--cache-size', type=int, default=int(env('TOOL_PROXY_CACHE_SIZE', '1024')))
+    parser.add_argument('--cache-max-body', type=int, default=int(env('TOOL_PROXY_CACHE_MAX_BODY', str(2**20))))
+    parser.add_argument('--pool-size', type=int, default=int(env('TOOL_PROXY_POOL_SIZE', '32')))
+    parser.add_argument('--timeout', type=float, default=float(env('TOOL_PROXY_TIMEOUT', '30')))
+    args = parser.parse_args(argv)
+    if not args.upstream:
+        parser.error("--upstream or TOOL_PROXY_UPSTREAM is required")
+
+    logging.basicConfig(level=logging.INFO)
+    cache = ResponseCache(max_entries=args.cache_size, ttl=args.cache_ttl, max_body_bytes=args.cache_max_body)
+    proxy = ToolProxy(args.upstream, cache, pool_size=args.pool_size, timeout=args.timeout)
+    try:
+        asyncio.run(serve(proxy, args.host, args.port, args.load_port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from . import clients
+from .config import env_int
+from .metrics import ARTIFACT_CACHE_ENTRIES, ARTIFACT_CACHE_EVICTIONS, ARTIFACT_CACHE_REQUESTS
+from .podcache import get_pod_cache
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_LABEL = 'agents.example.com/artifact'
+DEFAULT_RUNTIME = 'nodejs'
+WRAPPER_FILES = {
+    'python': 'wrapper.py',
+    'nodejs': 'wrapper.js'
+}
+DEFAULT_WRAPPERS = {
+    'python': 'print("wrapped")\n',
+    'nodejs': 'console.log("wrapped");\n'
+}
+
+_cache = None
+
+def _artifact_source(spec):
+    """(runtime, version, files) of the artifact an AgentType needs, or None for the default wrapper"""
+    environment = spec.get('agent', {}).get('environment', {})
+    source = (environment.get('glueCode') or {}).get('source')
+    sdk = environment.get('sdk') or {}
+    packages = sdk.get('packages') or []
+    if source is None and not packages:
+        return None
+
+    runtime = sdk.get('runtime') or DEFAULT_RUNTIME
+    files = {WRAPPER_FILES[runtime]: source if source is not None else DEFAULT_WRAPPERS[runtime]}
+    if packages:
+        files['packages.txt'] = '\n'.join(packages) + '\n'
+    return runtime, sdk.get('version'), files
+
+def artifact_params(spec):
+    """(key, runtime, has_sdk, version) of an AgentType's artifact, or None when it needs none
+
+    The key is a content hash, so AgentTypes with the same glue code, SDK
+    packages and runtime version share one artifact. `version` is the
+    runtime version packages are installed with, None for the default.
+    """
+    source = _artifact_source(spec)
+    if source is None:
+        return None
+    runtime, version, files = source
+    encoded = json.dumps([runtime, version, files], sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16], runtime, 'packages.txt' in files, version
+
+def configmap_name(key):
+    """Name of the ConfigMap holding one artifact"""
+    return f"agent-artifact-{key}"
+
+def build_artifact_configmap(key, namespace, spec):
+    """Render the ConfigMap holding the glue code and SDK package list"""
+    _, _, files = _artifact_source(spec)
+    return {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {
+            'name': configmap_name(key),
+            'namespace': namespace,
+            'labels': {
+                'managed-by': 'agent-operator',
+                ARTIFACT_LABEL: key
+            }
+        },
+        'data': files,
+        'immutable': True
+    }
+
+class ArtifactCache:
+    """Content-addressed ConfigMaps holding the glue code and SDK package lists of AgentTypes
+
+    Each distinct artifact is written once per namespace and mounted
+    read-only by every pod that needs it. SDK packages are installed by the
+    init container with the spec's runtime version into a node-local cache
+    (unless SDK_NODE_CACHE is off), keyed by the same hash. Once
+    more than `size` ConfigMaps are cached the least recently used ones that
+    no live pod mounts are deleted; they are rebuilt on their next use.
+    Without a synced pod cache nothing is evicted, since a restarted pod
+    whose ConfigMap is gone cannot mount its volume.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._building = {}
+
+    async def load(self):
+        """Seed the cache with artifact ConfigMaps written before a restart"""
+        api = await clients.get_core_api()
+        configmaps = await clients.call_json(api.list_config_map_for_all_namespaces, label_selector=ARTIFACT_LABEL)
+        for configmap in configmaps['items']:
+            metadata = configmap['metadata']
+            self.entries[(metadata['namespace'], metadata['labels'][ARTIFACT_LABEL])] = True
+        ARTIFACT_CACHE_ENTRIES.set(len(self.entries))
+        return len(self.entries)
+
+    def _record(self, hit):
+        self.stats['hits' if hit else 'misses'] += 1
+        ARTIFACT_CACHE_REQUESTS.labels('hit' if hit else 'miss').inc()
+
+    async def ensure(self, namespace, spec):
+        """Make sure the artifact of a spec exists; returns (key, hit) or None when it needs none"""
+        params = artifact_params(spec)
+        if params is None:
+            return None
+        entry = (namespace, params[0])
+
+        if entry in self.entries:
+            self.entries.move_to_end(entry)
+            self._record(True)
+            return params[0], True
+        building = self._building.get(entry)
+        if building is not None:
+            # Another handler is already writing the same artifact
+            await asyncio.shield(building)
+            self._record(True)
+            return params[0], True
+
+        self._record(False)
+        building = self._building[entry] = asyncio.ensure_future(self._build(params[0], namespace, spec))
+        try:
+            await building
+        finally:
+            del self._building[entry]
+        self.entries[entry] = True
+        await self._evict()
+        return params[0], False
+
+    async def _build(self, key, namespace, spec):
+        api = await clients.get_core_api()
+        try:
+            await clients.call_json(api.create_namespaced_config_map, namespace=namespace, body=build_artifact_configmap(key, namespace, spec))
+        except ApiException as e:
+            # Written by another replica or before a restart; the content is the same
+            if e.status != 409:
+                raise
+
+    def _evictable(self):
+        """Cached entries no live pod mounts, least recently used first"""
+        pods = get_pod_cache()
+        if pods is None or not pods.synced.is_set():
+            return []
+        return [(namespace, key) for namespace, key in self.entries if not pods.pods_mounting(namespace, configmap_name(key))]
+
+    async def _evict(self):
+        """Delete the least recently used unmounted ConfigMaps beyond the cache size"""
+        if len(self.entries) <= self.size:
+            return
+        api = await clients.get_core_api()
+        for entry in self._evictable()[:len(self.entries) - self.size]:
+            namespace, key = entry
+            del self.entries[entry]
+            self.stats['evictions'] += 1
+            ARTIFACT_CACHE_EVICTIONS.inc()
+            try:
+                await clients.call_json(api.delete_namespaced_config_map, name=configmap_name(key), namespace=namespace)
+            except ApiException as e:
+                if e.status != 404:
+                    logger.warning("Evicting artifact %s/%s failed: %s", namespace, key, e)
+        ARTIFACT_CACHE_ENTRIES.set(len(self.entries))
+
+    def hit_rate(self):
+        requests = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / requests if requests else 0.0
+
+def get_artifact_cache():
+    """Get the process-wide artifact cache"""
+    global _cache
+
+    if _cache is None:
+        _cache = ArtifactCache(size=env_int('ARTIFACT_CACHE_SIZE', 256))
+    return _cache
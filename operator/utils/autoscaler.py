@@ -0,0 +1,274 @@
+import asyncio
+import functools
+import logging
+import math
+import time
+
+import aiohttp
+
+from ..containers.toolproxy import LOAD_PORT
+from .metrics import SCALING_DECISIONS
+from .podcache import get_pod_cache, replica_index
+from .status import get_status_writer, now
+from .workqueue import PRIORITY_UPDATE, get_work_queue
+
+logger = logging.getLogger(__name__)
+
+_autoscaler = None
+_task = None
+
+DEFAULT_POLICY = {
+    'minReplicas': 1,
+    'metric': 'queueDepth',
+    'scaleUpCooldownSeconds': 30,
+    'scaleDownCooldownSeconds': 300,
+    'tolerance': 0.1,
+    'idleSeconds': 600
+}
+
+def scaling_policy(spec):
+    """The AgentType's spec.scaling with defaults filled in, or None when it is not autoscaled"""
+    scaling = spec.get('scaling')
+    if not scaling:
+        return None
+    policy = dict(DEFAULT_POLICY, **scaling)
+    policy.setdefault('maxReplicas', max(policy['minReplicas'], 1))
+    return policy
+
+def desired_replicas(policy, replicas, load, elapsed, idle):
+    """Replica count for the observed load, or `replicas` when it should not change
+
+    `load` is the summed metric of the running replicas (None when none
+    reported one), `elapsed` the seconds since the last scaling and `idle`
+    how long the load has been zero. Loads within `tolerance` of the target
+    keep the count, so it does not flap around a boundary; scaling up and
+    down each wait out their own cooldown. An AgentType with minReplicas 0
+    goes to zero once idle for idleSeconds and is woken explicitly.
+    """
+    lowest = max(policy['minReplicas'], 1)
+    if replicas == 0:
+        return policy['minReplicas']
+    if load is None:
+        return min(max(replicas, lowest), policy['maxReplicas'])
+    if policy['minReplicas'] == 0 and load == 0 and idle >= policy['idleSeconds']:
+        return 0
+
+    desired = replicas
+    if abs(load / (policy['target'] * replicas) - 1) > policy['tolerance']:
+        desired = math.ceil(load / policy['target'])
+    desired = min(max(desired, lowest), policy['maxReplicas'])
+    if desired > replicas and elapsed < policy['scaleUpCooldownSeconds']:
+        return replicas
+    if desired < replicas and elapsed < policy['scaleDownCooldownSeconds']:
+        return replicas
+    return desired
+
+def _log_scale(key, future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Scaling %s failed: %r", key, future.exception())
+
+class ScaledAgent:
+    """Autoscaler state of one AgentType"""
+    __slots__ = ('namespace', 'name', 'spec', 'owner_ref', 'policy', 'replicas', 'last_scale', 'idle_since', 'samples')
+
+    def __init__(self, namespace, name, replicas):
+        self.namespace = namespace
+        self.name = name
+        self.spec = None
+        self.owner_ref = None
+        self.policy = None
+        self.replicas = replicas
+        self.last_scale = 0.0
+        self.idle_since = None
+        # Pod UID -> (request count, monotonic time) of its last scrape
+        self.samples = {}
+
+class Autoscaler:
+    """Scales autoscaled AgentTypes between their min and max replicas
+
+    Every `interval` seconds the tool-proxy sidecar of each replica is asked
+    for its load (calls in flight, and a running call count the request rate
+    is derived from). Pod changes go through the work queue under their own
+    key, so they never merge with the AgentType's create or update work.
+    """
+
+    def __init__(self, interval=15, timeout=2.0):
+        self.interval = interval
+        self.timeout = timeout
+        self.agents = {}
+        self.session = None
+        self.stats = {'evaluations': 0, 'scrapes': 0, 'scrape_errors': 0, 'scaled': 0}
+
+    def track(self, namespace, name, spec, owner_ref, replicas=None):
+        """Start or keep autoscaling an AgentType; `replicas` restores a count from its status
+
+        Returns whether the AgentType is autoscaled.
+        """
+        policy = scaling_policy(spec)
+        if policy is None:
+            self.forget(namespace, name)
+            return False
+        agent = self.agents.get((namespace, name))
+        if agent is None:
+            initial = replicas if replicas is not None else max(policy['minReplicas'], 1)
+            agent = self.agents[(namespace, name)] = ScaledAgent(namespace, name, initial)
+        agent.spec = spec
+        agent.owner_ref = owner_ref
+        agent.policy = policy
+        return True
+
+    def forget(self, namespace, name):
+        self.agents.pop((namespace, name), None)
+
+    def is_scaled_to_zero(self, namespace, name):
+        agent = self.agents.get((namespace, name))
+        return agent is not None and agent.replicas == 0
+
+    def replicas(self, namespace, name):
+        """Replicas an autoscaled AgentType is held at, or None when it is not autoscaled"""
+        agent = self.agents.get((namespace, name))
+        return None if agent is None else agent.replicas
+
+    def wake(self, namespace, name):
+        """Bring an AgentType scaled to zero back to its first replica"""
+        agent = self.agents.get((namespace, name))
+        if agent is None or agent.replicas != 0:
+            return None
+        return self.scale(agent, max(agent.policy['minReplicas'], 1), None, 'wake')
+
+    def resync(self, namespace, name):
+        """Reconcile an autoscaled AgentType's pods with its replica count, e.g. after a spec update"""
+        agent = self.agents.get((namespace, name))
+        if agent is None:
+            return None
+        return self._submit(agent)
+
+    def _submit(self, agent):
+        # Imported here: the pod handlers import podstatus, which imports this module
+        from ..handlers.scale import scale_agent_pods
+
+        key = f"{agent.namespace}/{agent.name}/scale"
+        future = get_work_queue().submit(
+            key, agent.namespace, PRIORITY_UPDATE,
+            functools.partial(scale_agent_pods, agent.name, agent.namespace, agent.spec, agent.owner_ref, agent.replicas)
+        )
+        future.add_done_callback(functools.partial(_log_scale, key))
+        return future
+
+    def scale(self, agent, replicas, load, direction, at=None):
+        """Record a scaling decision and queue the pod changes"""
+        SCALING_DECISIONS.labels(direction).inc()
+        self.stats['scaled'] += 1
+        logger.info("Scaling %s/%s %s from %s to %s replicas (load %s)", agent.namespace, agent.name, direction, agent.replicas, replicas, load)
+        agent.replicas = replicas
+        agent.last_scale = time.monotonic() if at is None else at
+        agent.idle_since = None
+        get_status_writer().set_fields(agent.namespace, agent.name, scaling={
+            'replicas': replicas,
+            'load': load,
+            'lastScaleTime': now()
+        })
+        return self._submit(agent)
+
+    async def scrape(self, pod):
+        """(calls in flight, calls handled so far) reported by a pod's tool proxy, or None"""
+        ip = (pod.get('status') or {}).get('podIP')
+        if not ip:
+            return None
+        self.stats['scrapes'] += 1
+        try:
+            async with self.session.get(f"http://{ip}:{LOAD_PORT}/_proxy/load") as response:
+                report = await response.json()
+                return report['inflight'], report['requests']
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            self.stats['scrape_errors'] += 1
+            logger.debug("Reading load of pod %s failed: %r", pod['metadata']['name'], e)
+            return None
+
+    async def load(self, agent, pods, at):
+        """The AgentType's summed metric over its running pods, or None when none reported"""
+        reports = await asyncio.gather(*(self.scrape(pod) for pod in pods))
+        total = None
+        samples = {}
+        for pod, report in zip(pods, reports):
+            if report is None:
+                continue
+            inflight, requests = report
+            uid = pod['metadata']['uid']
+            samples[uid] = (requests, at)
+            if agent.policy['metric'] == 'queueDepth':
+                value = inflight
+            elif uid in agent.samples and at > agent.samples[uid][1]:
+                value = max(requests - agent.samples[uid][0], 0) / (at - agent.samples[uid][1])
+            else:
+                # First sample of this pod: its rate is known from the next one
+                continue
+            total = (total or 0) + value
+        agent.samples = samples
+        return total
+
+    async def evaluate(self, agent, at=None):
+        """Scrape one AgentType and scale it when its load calls for it
+
+        Pods are also reconciled when fewer or more replicas exist than the
+        count, e.g. after an eviction or a spec update replacing replicas.
+        Returns the queued pod changes, or None when nothing is to be done.
+        """
+        at = time.monotonic() if at is None else at
+        self.stats['evaluations'] += 1
+        owned = [pod for pod in get_pod_cache().pods_for_owner(agent.owner_ref['uid']) if not pod['metadata'].get('deletionTimestamp')]
+        pods = [pod for pod in owned if (pod.get('status') or {}).get('phase') == 'Running']
+        load = await self.load(agent, pods, at) if agent.replicas else None
+        if load == 0:
+            agent.idle_since = agent.idle_since if agent.idle_since is not None else at
+        else:
+            agent.idle_since = None
+        idle = at - agent.idle_since if agent.idle_since is not None else 0.0
+
+        desired = desired_replicas(agent.policy, agent.replicas, load, at - agent.last_scale, idle)
+        if desired != agent.replicas:
+            direction = 'zero' if desired == 0 else 'up' if desired > agent.replicas else 'down'
+            return self.scale(agent, desired, load, direction, at)
+        if len({replica_index(pod) for pod in owned}) != agent.replicas:
+            return self._submit(agent)
+        return None
+
+    async def run(self):
+        """Periodically evaluate every autoscaled AgentType"""
+        cache = get_pod_cache()
+        if cache is not None:
+            await cache.synced.wait()
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        try:
+            while True:
+                results = await asyncio.gather(*(self.evaluate(agent) for agent in list(self.agents.values())), return_exceptions=True)
+                for error in results:
+                    if isinstance(error, Exception):
+                        logger.error("Autoscaler evaluation failed: %r", error)
+                await asyncio.sleep(self.interval)
+        finally:
+            await self.session.close()
+
+def start_autoscaler(interval=15, timeout=2.0):
+    """Create the process-wide autoscaler and start its evaluation task"""
+    global _autoscaler, _task
+
+    _autoscaler = Autoscaler(interval=interval, timeout=timeout)
+    _task = asyncio.create_task(_autoscaler.run())
+    return _autoscaler
+
+async def stop_autoscaler():
+    """Stop the autoscaler; pods stay at their current count"""
+    global _autoscaler, _task
+
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _autoscaler = _task = None
+
+def get_autoscaler():
+    """Get the process-wide autoscaler, or None if autoscaling is disabled"""
+    return _autoscaler
@@ -0,0 +1,67 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+class Checkpoint:
+    """An informer's objects and resourceVersion, saved to a local file
+
+    A restarted operator loads the file and resumes the watch from the
+    saved version, so it only receives what changed while it was down
+    instead of listing every object again. When the version has expired
+    meanwhile, the informer relists and diffs against the loaded objects.
+    Files are replaced atomically; one that cannot be read is ignored.
+    """
+
+    def __init__(self, path, interval=60):
+        self.path = path
+        self.interval = interval
+        self.saved_version = None
+        self._saved_at = time.monotonic()
+        self.stats = {'saves': 0, 'loads': 0, 'errors': 0}
+
+    def load(self):
+        """(resourceVersion, objects) from the file, or None when there is none to resume from"""
+        try:
+            with gzip.open(self.path, 'rb') as f:
+                state = json.loads(f.read())
+            version, items = state['resourceVersion'], state['items']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.stats['errors'] += 1
+            logger.warning("Ignoring unreadable checkpoint %s: %r", self.path, e)
+            return None
+        self.stats['loads'] += 1
+        self.saved_version = version
+        return version, items
+
+    def due(self):
+        return time.monotonic() - self._saved_at >= self.interval
+
+    def _write(self, data):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=1))
+        os.replace(tmp, self.path)
+
+    async def save(self, resource_version, items):
+        """Write the objects as of `resource_version`, unless that version is already saved"""
+        self._saved_at = time.monotonic()
+        if resource_version is None or resource_version == self.saved_version:
+            return False
+        # Encoded here, while the objects cannot change; compressed and written off the event loop
+        data = json.dumps({'resourceVersion': resource_version, 'items': items}, separators=(',', ':')).encode()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+        except OSError as e:
+            self.stats['errors'] += 1
+            logger.warning("Could not save checkpoint %s: %r", self.path, e)
+            return False
+        self.saved_version = resource_version
+        self.stats['saves'] += 1
+        return True
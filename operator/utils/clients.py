@@ -0,0 +1,158 @@
+import asyncio
+import ssl
+
+import aiohttp
+from kubernetes_asyncio import client, config
+from kubernetes_asyncio.client.rest import ApiException
+
+from .metrics import api_call_labels, observe_api_call
+
+# One ApiClient (and therefore one aiohttp connection pool) is shared by every
+# handler for the lifetime of the process. Keep-alive connections keep their
+# TLS session, so only the first request per pooled connection pays a handshake.
+_api_client = None
+_core_api = None
+_custom_api = None
+_coordination_api = None
+_apiextensions_api = None
+_semaphore = None
+_stats = {'requests': 0, 'hits': 0, 'misses': 0}
+
+async def load_kube_config():
+    """Load in-cluster credentials, falling back to the local kubeconfig"""
+    try:
+        config.load_incluster_config()
+    except config.ConfigException:
+        await config.load_kube_config()
+
+def _ssl_context(configuration):
+    """Build the TLS context the same way kubernetes_asyncio does"""
+    context = ssl.create_default_context(cafile=configuration.ssl_ca_cert)
+    if configuration.cert_file:
+        context.load_cert_chain(configuration.cert_file, keyfile=configuration.key_file)
+    if not configuration.verify_ssl:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+def _trace_config():
+    """Count requests and whether they were served on a pooled connection"""
+    async def on_request_start(session, ctx, params):
+        _stats['requests'] += 1
+
+    async def on_connection_create_end(session, ctx, params):
+        _stats['misses'] += 1
+
+    async def on_connection_reuseconn(session, ctx, params):
+        _stats['hits'] += 1
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace
+
+def _pooled_session(configuration, pool_maxsize, keepalive_idle):
+    """Create the aiohttp session backing all API calls"""
+    connector = aiohttp.TCPConnector(
+        limit=pool_maxsize,
+        keepalive_timeout=keepalive_idle,
+        ssl=_ssl_context(configuration)
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        trust_env=True,
+        read_bufsize=2**21,
+        trace_configs=[_trace_config()]
+    )
+
+async def init_clients(pool_maxsize=32, keepalive_idle=30, max_concurrency=256, configuration=None):
+    """Create the process-wide API clients"""
+    global _api_client, _core_api, _custom_api, _coordination_api, _apiextensions_api, _semaphore
+
+    if configuration is None:
+        await load_kube_config()
+        configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = pool_maxsize
+
+    _api_client = client.ApiClient(configuration)
+    await _api_client.rest_client.pool_manager.close()
+    _api_client.rest_client.pool_manager = _pooled_session(configuration, pool_maxsize, keepalive_idle)
+
+    _core_api = client.CoreV1Api(_api_client)
+    _custom_api = client.CustomObjectsApi(_api_client)
+    _coordination_api = client.CoordinationV1Api(_api_client)
+    _apiextensions_api = client.ApiextensionsV1Api(_api_client)
+    _semaphore = asyncio.Semaphore(max_concurrency)
+    for key in _stats:
+        _stats[key] = 0
+    return _api_client
+
+async def close_clients():
+    """Release pooled connections held by the shared API client"""
+    global _api_client, _core_api, _custom_api, _coordination_api, _apiextensions_api, _semaphore
+
+    if _api_client is not None:
+        await _api_client.close()
+    _api_client = _core_api = _custom_api = _coordination_api = _apiextensions_api = _semaphore = None
+
+async def get_api_client():
+    """Get the shared ApiClient, creating it on first use"""
+    if _api_client is None:
+        await init_clients()
+    return _api_client
+
+async def get_core_api():
+    """Get the shared CoreV1Api"""
+    await get_api_client()
+    return _core_api
+
+async def get_custom_api():
+    """Get the shared CustomObjectsApi"""
+    await get_api_client()
+    return _custom_api
+
+async def get_coordination_api():
+    """Get the shared CoordinationV1Api (Leases)"""
+    await get_api_client()
+    return _coordination_api
+
+async def get_apiextensions_api():
+    """Get the shared ApiextensionsV1Api (CustomResourceDefinitions)"""
+    await get_api_client()
+    return _apiextensions_api
+
+async def call_json(func, *args, **kwargs):
+    """Call an API method and return the decoded JSON body as plain dicts
+
+    Skips building client model objects, which dominate CPU and memory for
+    large responses. Error statuses raise ApiException as usual. Every call
+    is recorded in the API latency histogram.
+    """
+    with observe_api_call(*api_call_labels(func)):
+        response = await func(*args, _preload_content=False, **kwargs)
+        try:
+            if response.status >= 400:
+                error = ApiException(status=response.status, reason=response.reason)
+                error.body = await response.text()
+                error.headers = response.headers
+                raise error
+            return await response.json()
+        finally:
+            response.release()
+
+def concurrency():
+    """Get the semaphore bounding concurrent reconciles against the API"""
+    global _semaphore
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(256)
+    return _semaphore
+
+def pool_stats():
+    """Get connection pool hit/miss counters for the shared client
+
+    A miss is a request that had to open a new connection (and do a TLS
+    handshake); a hit is a request served on an already pooled connection.
+    """
+    return dict(_stats)
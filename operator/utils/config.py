@@ -0,0 +1,23 @@
+import os
+
+def env_str(name, default=None):
+    """Read a string setting from the environment"""
+    value = os.environ.get(name)
+    return value if value not in (None, '') else default
+
+def env_int(name, default):
+    """Read an integer setting from the environment"""
+    value = env_str(name)
+    return int(value) if value is not None else default
+
+def env_float(name, default):
+    """Read a float setting from the environment"""
+    value = env_str(name)
+    return float(value) if value is not None else default
+
+def env_bool(name, default=False):
+    """Read a boolean setting from the environment"""
+    value = env_str(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
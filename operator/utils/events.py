@@ -0,0 +1,164 @@
+import asyncio
+import collections
+import hashlib
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from . import clients
+from .metrics import EVENTS, QUEUE_DEPTH
+from .status import now
+
+_recorder = None
+
+def object_ref(body, api_version='agents.example.com/v1', kind='AgentType'):
+    """involvedObject reference for an object body"""
+    metadata = body['metadata']
+    return {
+        'apiVersion': body.get('apiVersion', api_version),
+        'kind': body.get('kind', kind),
+        'name': metadata['name'],
+        'namespace': metadata['namespace'],
+        'uid': metadata.get('uid')
+    }
+
+def event_name(key):
+    """Stable Event name per object, type and reason, so repeats update one Event"""
+    digest = hashlib.sha256(repr(key).encode()).hexdigest()[:12]
+    return f"{key[2]}.{digest}"
+
+class EventRecorder:
+    """Batch Kubernetes Events per object and reason, aggregating repeats into counts
+
+    Events recorded within `window` seconds are written together. Repeats
+    of the same object, type and reason are merged: the newest message wins
+    and the count goes up. The first write creates the Event and later ones
+    only patch its count and lastTimestamp, so a reason firing thousands of
+    times costs one write per window.
+    """
+
+    def __init__(self, window=1.0, component='agent-operator', max_tracked=4096):
+        self.window = window
+        self.component = component
+        self.max_tracked = max_tracked
+        self.stats = {'recorded': 0, 'aggregated': 0, 'written': 0, 'errors': 0}
+        self._pending = {}
+        self._counts = collections.OrderedDict()
+        self._timer = None
+
+    def record(self, ref, event_type, reason, message):
+        """Queue an Event about `ref`; `event_type` is 'Normal' or 'Warning'"""
+        key = (ref['namespace'], ref['kind'], ref['name'], ref.get('uid'), event_type, reason)
+        self.stats['recorded'] += 1
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.stats['aggregated'] += 1
+            EVENTS.labels('aggregated').inc()
+            pending.update(message=message, count=pending['count'] + 1, last=now())
+        else:
+            timestamp = now()
+            self._pending[key] = {'ref': ref, 'message': message, 'count': 1, 'first': timestamp, 'last': timestamp}
+        if self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+        QUEUE_DEPTH.labels('events').set(len(self._pending))
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Write every pending Event"""
+        pending, self._pending = self._pending, {}
+        QUEUE_DEPTH.labels('events').set(0)
+        await asyncio.gather(*(self._write(key, entry) for key, entry in pending.items()))
+
+    def _event_body(self, key, entry, count):
+        namespace, _, _, _, event_type, reason = key
+        return {
+            'apiVersion': 'v1',
+            'kind': 'Event',
+            'metadata': {'name': event_name(key), 'namespace': namespace},
+            'involvedObject': entry['ref'],
+            'type': event_type,
+            'reason': reason,
+            'message': entry['message'],
+            'count': count,
+            'firstTimestamp': entry['first'],
+            'lastTimestamp': entry['last'],
+            'source': {'component': self.component},
+            'reportingComponent': self.component
+        }
+
+    async def _write(self, key, entry):
+        api = await clients.get_core_api()
+        namespace = key[0]
+        written = self._counts.get(key)
+        count = (written or 0) + entry['count']
+        try:
+            if written is None:
+                try:
+                    await clients.call_json(api.create_namespaced_event, namespace=namespace, body=self._event_body(key, entry, count))
+                except ApiException as e:
+                    # Written before a restart; keep counting on the existing Event
+                    if e.status != 409:
+                        raise
+                    written = 0
+            if written is not None:
+                await clients.call_json(
+                    api.patch_namespaced_event,
+                    name=event_name(key),
+                    namespace=namespace,
+                    body={'count': count, 'message': entry['message'], 'lastTimestamp': entry['last']},
+                    _content_type='application/merge-patch+json'
+                )
+        except ApiException as e:
+            self.stats['errors'] += 1
+            EVENTS.labels('error').inc()
+            if e.status == 404:
+                # The Event expired; the next occurrence creates it again
+                self._counts.pop(key, None)
+            return
+
+        self.stats['written'] += 1
+        EVENTS.labels('written').inc()
+        self._counts[key] = count
+        self._counts.move_to_end(key)
+        while len(self._counts) > self.max_tracked:
+            self._counts.popitem(last=False)
+
+    def forget(self, namespace, name):
+        """Drop pending Events about a deleted object"""
+        for key in [key for key in self._pending if key[0] == namespace and key[2] == name]:
+            del self._pending[key]
+        QUEUE_DEPTH.labels('events').set(len(self._pending))
+
+    async def close(self):
+        """Write every pending Event, e.g. on operator shutdown"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+def init_event_recorder(window=1.0):
+    """Create the process-wide event recorder"""
+    global _recorder
+
+    _recorder = EventRecorder(window=window)
+    return _recorder
+
+def get_event_recorder():
+    """Get the process-wide event recorder, creating it on first use"""
+    if _recorder is None:
+        init_event_recorder()
+    return _recorder
+
+async def close_event_recorder():
+    """Flush and drop the process-wide event recorder"""
+    global _recorder
+
+    if _recorder is not None:
+        await _recorder.close()
+    _recorder = None
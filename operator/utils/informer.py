@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+
+import aiohttp
+from kubernetes_asyncio.client.rest import ApiException
+
+from .metrics import INFORMER_BYTES, INFORMER_RELISTS, api_call_labels
+
+logger = logging.getLogger(__name__)
+
+class Expired(Exception):
+    """The watch resourceVersion is too old and a relist is required"""
+
+def object_key(obj):
+    """Store key of an object: namespace/name, or name if cluster-scoped"""
+    metadata = obj['metadata']
+    namespace = metadata.get('namespace')
+    return f"{namespace}/{metadata['name']}" if namespace else metadata['name']
+
+class Informer:
+    """Local, indexed cache of one resource kind, fed by a single watch stream
+
+    The cache is filled by a paged LIST and then kept current by a WATCH that
+    resumes from the last seen resourceVersion (bookmarks keep it fresh even
+    when nothing changes). Only when the apiserver reports the version as
+    expired does the informer fall back to a full relist. With a
+    `checkpoint`, a restarted process resumes from the saved contents too.
+    Objects are kept as plain dicts, no client models are built.
+    """
+
+    def __init__(self, list_func, indexers=None, page_size=500, watch_timeout=300, filter=None, checkpoint=None, **list_kwargs):
+        self.list_func = list_func
+        self.resource = api_call_labels(list_func)[1]
+        self.checkpoint = checkpoint
+        self.list_kwargs = list_kwargs
+        self.indexers = indexers or {}
+        self.filter = filter
+        self.page_size = page_size
+        self.watch_timeout = watch_timeout
+        self.resource_version = None
+        self.store = {}
+        self.indexes = {index: {} for index in self.indexers}
+        self.listeners = []
+        self.synced = asyncio.Event()
+        self._response = None
+        self._relist_cause = 'initial'
+        self.stats = {'relists': 0, 'events': 0, 'bookmarks': 0, 'reconnects': 0, 'restored': 0, 'list_bytes': 0, 'watch_bytes': 0}
+
+    def add_listener(self, callback):
+        """Call `callback(event_type, obj)` for every change; it may be a coroutine"""
+        self.listeners.append(callback)
+
+    def get(self, key):
+        """Get a cached object by its namespace/name key"""
+        return self.store.get(key)
+
+    def by_index(self, index, value):
+        """Get all cached objects with the given index value"""
+        return [self.store[key] for key in self.indexes[index].get(value, ())]
+
+    def _index(self, key, obj):
+        for index, func in self.indexers.items():
+            for value in func(obj):
+                self.indexes[index].setdefault(value, set()).add(key)
+
+    def _unindex(self, key, obj):
+        for index, func in self.indexers.items():
+            for value in func(obj):
+                keys = self.indexes[index].get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.indexes[index][value]
+
+    def request_relist(self):
+        """Drop the current watch and relist, e.g. after the filter changed"""
+        self.resource_version = None
+        self._relist_cause = 'requested'
+        if self._response is not None:
+            self._response.close()
+
+    async def _apply(self, event_type, obj):
+        key = object_key(obj)
+        if event_type != 'DELETED' and self.filter is not None and not self.filter(obj):
+            # No longer of interest to this cache: drop it like a deletion
+            if key not in self.store:
+                return
+            event_type = 'DELETED'
+        previous = self.store.pop(key, None)
+        if previous is not None:
+            self._unindex(key, previous)
+        if event_type != 'DELETED':
+            self.store[key] = obj
+            self._index(key, obj)
+        for callback in self.listeners:
+            try:
+                result = callback(event_type, obj)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error("Informer listener failed on %s %s: %s", event_type, key, e)
+
+    async def _request(self, **kwargs):
+        """Issue a raw LIST/WATCH request, skipping model deserialization"""
+        response = await self.list_func(_preload_content=False, **self.list_kwargs, **kwargs)
+        if response.status >= 400:
+            body = await response.text()
+            response.release()
+            if response.status == 410:
+                raise Expired(body)
+            raise ApiException(status=response.status, reason=body)
+        return response
+
+    def _received(self, request, size):
+        self.stats[f"{request}_bytes"] += size
+        INFORMER_BYTES.labels(self.resource, request).inc(size)
+
+    async def relist(self):
+        """Replace the cache contents with a fresh, paged LIST"""
+        self.stats['relists'] += 1
+        INFORMER_RELISTS.labels(self.resource, self._relist_cause).inc()
+        self._relist_cause = 'expired'
+        seen = {}
+        token = None
+        while True:
+            response = await self._request(limit=self.page_size, _continue=token)
+            try:
+                body = await response.read()
+            finally:
+                response.release()
+            self._received('list', len(body))
+            data = json.loads(body)
+            for obj in data.get('items') or []:
+                if self.filter is None or self.filter(obj):
+                    seen[object_key(obj)] = obj
+            token = data['metadata'].get('continue')
+            if not token:
+                self.resource_version = data['metadata']['resourceVersion']
+                break
+
+        for key in [key for key in self.store if key not in seen]:
+            await self._apply('DELETED', self.store[key])
+        for key, obj in seen.items():
+            previous = self.store.get(key)
+            if previous is None:
+                await self._apply('ADDED', obj)
+            elif previous['metadata'].get('resourceVersion') != obj['metadata'].get('resourceVersion'):
+                await self._apply('MODIFIED', obj)
+        self.synced.set()
+
+    async def restore(self):
+        """Fill the cache from the checkpoint; returns whether there was one to resume from"""
+        state = self.checkpoint.load() if self.checkpoint is not None else None
+        if state is None:
+            return False
+        version, items = state
+        for obj in items:
+            if self.filter is None or self.filter(obj):
+                await self._apply('ADDED', obj)
+        self.resource_version = version
+        self._relist_cause = 'expired'
+        self.stats['restored'] += len(items)
+        logger.info("Restored %s %s objects at resourceVersion %s", len(items), self.resource, version)
+        return True
+
+    async def save(self):
+        """Write the cache contents to the checkpoint"""
+        if self.checkpoint is not None:
+            await self.checkpoint.save(self.resource_version, list(self.store.values()))
+
+    async def watch(self):
+        """Stream changes from the last seen resourceVersion until the server closes"""
+        response = await self._request(
+            watch=True,
+            allow_watch_bookmarks=True,
+            resource_version=self.resource_version,
+            timeout_seconds=self.watch_timeout,
+            _request_timeout=aiohttp.ClientTimeout(total=None, sock_read=self.watch_timeout + 30)
+        )
+        self._response = response
+        # Accepted from the last seen version: what changed since then streams in first
+        self.synced.set()
+        try:
+            async for line in response.content:
+                self._received('watch', len(line))
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                event_type = event['type']
+                obj = event['object']
+                if event_type == 'ERROR':
+                    if obj.get('code') == 410:
+                        raise Expired(obj.get('message'))
+                    raise ApiException(status=obj.get('code'), reason=obj.get('message'))
+                self.resource_version = obj['metadata']['resourceVersion']
+                if event_type == 'BOOKMARK':
+                    self.stats['bookmarks'] += 1
+                else:
+                    self.stats['events'] += 1
+                    await self._apply(event_type, obj)
+                if self.checkpoint is not None and self.checkpoint.due():
+                    await self.save()
+        finally:
+            self._response = None
+            response.release()
+
+    async def run(self, backoff=1.0, max_backoff=30.0):
+        """Keep the cache in sync forever; cancel the task to stop
+
+        A dropped connection is resumed at once, since resuming only replays
+        the delta; repeated failures back off up to `max_backoff`.
+        """
+        delay = backoff
+        failures = 0
+        if self.resource_version is None:
+            await self.restore()
+        while True:
+            start_version = self.resource_version
+            try:
+                if self.resource_version is None:
+                    await self.relist()
+                await self.watch()
+                delay = backoff
+                failures = 0
+            except Expired:
+                logger.info("Watch resourceVersion expired, relisting")
+                self.resource_version = None
+            except ApiException as e:
+                if e.status == 410:
+                    self.resource_version = None
+                    continue
+                logger.warning("Watch failed: %s; retrying in %ss", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_backoff)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if self.resource_version is None:
+                    # The watch was closed on purpose by request_relist()
+                    continue
+                self.stats['reconnects'] += 1
+                # A stream that made progress before it broke counts as a first failure
+                failures = 1 if self.resource_version != start_version else failures + 1
+                if failures == 1:
+                    logger.info("Watch connection lost: %s; resuming from %s", e, self.resource_version)
+                    continue
+                logger.warning("Watch connection lost again: %s; retrying in %ss", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_backoff)
@@ -0,0 +1,102 @@
+import ast
+import importlib
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import types
+
+# The generated Kubernetes clients import every API and model class (~800
+# modules) from their package __init__, and kopf imports both clients at
+# startup for optional type support. The operator only needs a handful.
+
+class LazyPackage(types.ModuleType):
+    """A package whose __init__ exports are imported on first attribute access"""
+
+    def __init__(self, name, path, exports, attributes):
+        super().__init__(name)
+        self.__path__ = [path]
+        self.__file__ = os.path.join(path, '__init__.py')
+        self.__package__ = name
+        self.__spec__ = importlib.machinery.ModuleSpec(name, None, is_package=True)
+        self.__spec__.submodule_search_locations = [path]
+        self.__dict__.update(attributes)
+        self._exports = exports
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        module_name, source = self._exports.get(attr, (f"{self.__name__}.{attr}", None))
+        try:
+            module = importlib.import_module(module_name)
+        except ModuleNotFoundError as e:
+            if e.name != module_name:
+                raise
+            raise AttributeError(f"module {self.__name__!r} has no attribute {attr!r}") from None
+        value = module if source is None else getattr(module, source)
+        setattr(self, attr, value)
+        return value
+
+def _exports(name, source):
+    """(exports, literal attributes) of a package __init__ made only of imports and constants
+
+    Returns None when it does anything else, so it is imported as it is.
+    """
+    exports = {}
+    attributes = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+            continue
+        if isinstance(node, ast.ImportFrom) and node.module == '__future__':
+            continue
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                attributes[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                return None
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                parent = name.rsplit('.', node.level - 1)[0] if node.level > 1 else name
+                base = f"{parent}.{base}" if base else parent
+            for alias in node.names:
+                if not node.module and node.level:
+                    # `from . import client`: a submodule
+                    exports[alias.asname or alias.name] = (f"{base}.{alias.name}", None)
+                else:
+                    exports[alias.asname or alias.name] = (base, alias.name)
+        elif isinstance(node, ast.Import) and all(alias.asname for alias in node.names):
+            for alias in node.names:
+                exports[alias.asname] = (alias.name, None)
+        else:
+            return None
+    return exports, attributes
+
+def defer_imports(*packages):
+    """Replace not yet imported `packages` (parents first) with lazy ones; returns those replaced
+
+    Submodules still import normally, so `from package.sub import X`
+    keeps working and only loads what it names.
+    """
+    deferred = []
+    for name in packages:
+        if name in sys.modules:
+            continue
+        parent, _, child = name.rpartition('.')
+        if parent and not isinstance(sys.modules.get(parent), LazyPackage):
+            continue
+        spec = importlib.util.find_spec(name) if not parent else None
+        path = os.path.dirname(spec.origin) if spec is not None and spec.origin else \
+            os.path.join(sys.modules[parent].__path__[0], child) if parent else None
+        init = os.path.join(path, '__init__.py') if path else None
+        if init is None or not os.path.exists(init):
+            continue
+        with open(init) as f:
+            parsed = _exports(name, f.read())
+        if parsed is None:
+            continue
+        module = sys.modules[name] = LazyPackage(name, path, *parsed)
+        if parent:
+            setattr(sys.modules[parent], child, module)
+        deferred.append(name)
+    return deferred
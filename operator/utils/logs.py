@@ -0,0 +1,129 @@
+import atexit
+import collections
+import json
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from .metrics import LOG_RECORDS_DROPPED
+from .workqueue import TokenBucket
+
+# Attributes every LogRecord has; anything else was passed as `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+class RateLimitFilter(logging.Filter):
+    """Per-reason sampling and rate limits for DEBUG and INFO records
+
+    The reason is the record's `reason` extra, else its unformatted message
+    template, so every record from one call site shares a budget and
+    dropped records are never formatted. `sample` keeps that fraction of
+    records; each reason may then log `rate` records per second, bursting
+    to `burst`. Warnings and errors always pass. The first record let
+    through after a suppressed run carries the count as `suppressed`.
+    """
+
+    def __init__(self, rate=10.0, burst=20, sample=1.0, max_reasons=10000):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = sample
+        self.max_reasons = max_reasons
+        self._buckets = collections.OrderedDict()
+        self._suppressed = {}
+
+    def _bucket(self, reason):
+        bucket = self._buckets.get(reason)
+        if bucket is None:
+            bucket = self._buckets[reason] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_reasons:
+                self._buckets.popitem(last=False)
+        return bucket
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample < 1.0 and random.random() >= self.sample:
+            LOG_RECORDS_DROPPED.labels('sampled').inc()
+            return False
+
+        reason = getattr(record, 'reason', None) or record.msg
+        bucket = self._bucket(reason)
+        if bucket.wait_time(time.monotonic()) > 0:
+            self._suppressed[reason] = self._suppressed.get(reason, 0) + 1
+            LOG_RECORDS_DROPPED.labels('rate_limited').inc()
+            return False
+        bucket.consume()
+        suppressed = self._suppressed.pop(reason, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per record, with `extra` fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records to a background thread without ever blocking the event loop
+
+    Records are not formatted here; the listener thread does that, so log
+    arguments must not be mutated after the call. When the bounded queue is
+    full the record is dropped and counted.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels('queue_full').inc()
+
+def setup_logging(json_format=False, rate=10.0, burst=20, sample=1.0, queue_size=10000):
+    """Move the root handlers behind a sampled, non-blocking queue
+
+    Call after kopf.configure(), which installs the handlers that do the
+    actual output.
+    """
+    global _listener
+
+    root = logging.getLogger()
+    handlers = root.handlers[:] or [logging.StreamHandler()]
+    if json_format:
+        for handler in handlers:
+            handler.setFormatter(StructuredFormatter())
+
+    records = queue.Queue(queue_size)
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(RateLimitFilter(rate=rate, burst=burst, sample=sample))
+    root.handlers = [handler]
+
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return handler
+
+def stop_logging():
+    """Write out queued records and stop the listener thread"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = None
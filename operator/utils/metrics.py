@@ -0,0 +1,275 @@
+import functools
+import logging
+import time
+from contextlib import contextmanager
+
+import kopf
+from kubernetes_asyncio.client.rest import ApiException
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily
+
+from .startup import timer as startup_timer
+
+logger = logging.getLogger(__name__)
+
+# A dedicated registry keeps the exposition limited to operator metrics
+REGISTRY = CollectorRegistry()
+
+HANDLER_DURATION = Histogram(
+    'agent_operator_handler_duration_seconds',
+    'Duration of kopf handler invocations',
+    ['handler', 'resource', 'outcome'],
+    registry=REGISTRY
+)
+HANDLER_RETRIES = Counter(
+    'agent_operator_handler_retries_total',
+    'Handler invocations that were retries of an earlier failure',
+    ['handler', 'resource'],
+    registry=REGISTRY
+)
+API_CALL_DURATION = Histogram(
+    'agent_operator_api_call_duration_seconds',
+    'Latency of Kubernetes API calls',
+    ['verb', 'resource', 'code'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    registry=REGISTRY
+)
+QUEUE_DEPTH = Gauge(
+    'agent_operator_queue_depth',
+    'Items waiting in an internal queue',
+    ['queue'],
+    registry=REGISTRY
+)
+STATUS_PATCH_BATCH_SIZE = Histogram(
+    'agent_operator_status_patch_batch_size',
+    'Status updates coalesced into one status patch',
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34),
+    registry=REGISTRY
+)
+STATUS_PATCHES = Counter(
+    'agent_operator_status_patches_total',
+    'Status flushes by result (written, skipped, error)',
+    ['result'],
+    registry=REGISTRY
+)
+
+WARM_POOL_CLAIMS = Counter(
+    'agent_operator_warm_pool_claims_total',
+    'Warm pool claim attempts by result (hit, miss)',
+    ['result'],
+    registry=REGISTRY
+)
+WARM_POOL_CLAIM_SECONDS = Histogram(
+    'agent_operator_warm_pool_claim_seconds',
+    'Time to claim a standby pod from the warm pool',
+    registry=REGISTRY
+)
+WARM_POOL_AVAILABLE = Gauge(
+    'agent_operator_warm_pool_available',
+    'Standby pods available per warm pool',
+    ['pool'],
+    registry=REGISTRY
+)
+
+ARTIFACT_CACHE_REQUESTS = Counter(
+    'agent_operator_artifact_cache_requests_total',
+    'Glue code/SDK artifact lookups by result (hit, miss)',
+    ['result'],
+    registry=REGISTRY
+)
+ARTIFACT_CACHE_EVICTIONS = Counter(
+    'agent_operator_artifact_cache_evictions_total',
+    'Artifact ConfigMaps deleted to keep the cache within its size',
+    registry=REGISTRY
+)
+ARTIFACT_CACHE_ENTRIES = Gauge(
+    'agent_operator_artifact_cache_entries',
+    'Artifact ConfigMaps currently cached',
+    registry=REGISTRY
+)
+
+EVENTS = Counter(
+    'agent_operator_events_total',
+    'Kubernetes Events by result (aggregated into a pending Event, written, error)',
+    ['result'],
+    registry=REGISTRY
+)
+LOG_RECORDS_DROPPED = Counter(
+    'agent_operator_log_records_dropped_total',
+    'Log records dropped by cause (sampled, rate_limited, queue_full)',
+    ['cause'],
+    registry=REGISTRY
+)
+QUOTA_CHECKS = Counter(
+    'agent_operator_quota_checks_total',
+    'Local ResourceQuota pre-admission checks by result (fits, exceeded)',
+    ['result'],
+    registry=REGISTRY
+)
+PLACEMENTS = Counter(
+    'agent_operator_placements_total',
+    'Pods rendered with image-locality affinity by result (local, none)',
+    ['result'],
+    registry=REGISTRY
+)
+PLACEMENT_PULL_SAVINGS = Histogram(
+    'agent_operator_placement_pull_savings_bytes',
+    'Estimated image bytes a pod does not pull when placed on a preferred node',
+    buckets=(2**24, 2**26, 2**28, 2**30, 2**31, 2**32, 2**33, 2**34),
+    registry=REGISTRY
+)
+SCALING_DECISIONS = Counter(
+    'agent_operator_scaling_decisions_total',
+    'Autoscaler replica changes by direction (up, down, zero, wake)',
+    ['direction'],
+    registry=REGISTRY
+)
+PACKED_AGENTS = Gauge(
+    'agent_operator_packed_agents',
+    'AgentTypes running as a container of a shared, packed pod',
+    registry=REGISTRY
+)
+INFORMER_RELISTS = Counter(
+    'agent_operator_informer_relists_total',
+    'Full LISTs of an informer, or of kopf\'s watch of a resource, by cause (initial, expired, requested)',
+    ['resource', 'cause'],
+    registry=REGISTRY
+)
+INFORMER_BYTES = Counter(
+    'agent_operator_informer_bytes_total',
+    'Response bytes decoded by the operator\'s own informers (not kopf\'s), by request (list, watch)',
+    ['resource', 'request'],
+    registry=REGISTRY
+)
+STARTUP_SECONDS = Gauge(
+    'agent_operator_startup_seconds',
+    'Duration of each startup phase, from process exec to the first handled event',
+    ['phase'],
+    registry=REGISTRY
+)
+
+_server = None
+
+class _StatsCollector:
+    """Expose a dict of monotonically increasing counters, e.g. pool stats"""
+
+    def __init__(self, name, documentation, stats_func):
+        self.name = name
+        self.documentation = documentation
+        self.stats_func = stats_func
+
+    def collect(self):
+        family = CounterMetricFamily(self.name, self.documentation, labels=['kind'])
+        for kind, value in self.stats_func().items():
+            family.add_metric([kind], value)
+        yield family
+
+def register_stats(name, documentation, stats_func):
+    """Export the counters returned by `stats_func()` as one labelled metric"""
+    REGISTRY.register(_StatsCollector(name, documentation, stats_func))
+
+def start_metrics_server(port, addr='0.0.0.0'):
+    """Serve /metrics over HTTP in a background thread; returns the bound port"""
+    global _server
+
+    _server, _ = start_http_server(port, addr=addr, registry=REGISTRY)
+    return _server.server_port
+
+def stop_metrics_server():
+    """Stop the metrics HTTP server"""
+    global _server
+
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+    _server = None
+
+def api_call_labels(func):
+    """Derive (verb, resource) from a client method name
+
+    `create_namespaced_pod` -> ('create', 'pod'),
+    `list_pod_for_all_namespaces` -> ('list', 'pod').
+    """
+    verb, _, rest = func.__name__.partition('_')
+    rest = rest.replace('namespaced_', '').replace('_for_all_namespaces', '')
+    return verb, rest or verb
+
+def count_kopf_relists():
+    """Count the LISTs kopf's watchers make in INFORMER_RELISTS, as for our informers
+
+    kopf lists a resource when its watcher starts and again whenever the
+    watch's resourceVersion expires, with no hook to observe it, so its
+    list function is wrapped. Returns whether one was found to wrap.
+    """
+    from kopf._cogs.clients import fetching
+
+    # fetch_objs (paged) in newer kopf releases, list_objs before
+    name = next((name for name in ('fetch_objs', 'list_objs') if hasattr(fetching, name)), None)
+    if name is None:
+        return False
+    original = getattr(fetching, name)
+    if getattr(original, 'counted', False):
+        return True
+    listed = set()
+
+    def counted(*args, resource, namespace=None, **kwargs):
+        key = (resource.plural, namespace)
+        INFORMER_RELISTS.labels(resource.plural, 'expired' if key in listed else 'initial').inc()
+        listed.add(key)
+        return original(*args, resource=resource, namespace=namespace, **kwargs)
+
+    counted.counted = True
+    setattr(fetching, name, counted)
+    return True
+
+@contextmanager
+def observe_api_call(verb, resource):
+    """Time an API call, labelled with the HTTP status it ended with"""
+    started = time.perf_counter()
+    code = '200'
+    try:
+        yield
+    except ApiException as e:
+        code = str(e.status)
+        raise
+    except Exception:
+        code = 'error'
+        raise
+    finally:
+        API_CALL_DURATION.labels(verb, resource, code).observe(time.perf_counter() - started)
+
+def _outcome(error):
+    if error is None:
+        return 'success'
+    if isinstance(error, kopf.TemporaryError):
+        return 'temporary_error'
+    if isinstance(error, kopf.PermanentError):
+        return 'permanent_error'
+    return 'error'
+
+def record_startup():
+    """Export the startup phases recorded so far"""
+    for phase, seconds in startup_timer.phases.items():
+        STARTUP_SECONDS.labels(phase).set(seconds)
+
+def timed_handler(handler, resource):
+    """Decorator recording duration, outcome and retries of an async kopf handler"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if kwargs.get('retry'):
+                HANDLER_RETRIES.labels(handler, resource).inc()
+            started = time.perf_counter()
+            error = None
+            try:
+                return await func(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                HANDLER_DURATION.labels(handler, resource, _outcome(error)).observe(time.perf_counter() - started)
+                if startup_timer.first_event is None and startup_timer.event_handled():
+                    record_startup()
+                    logger.info("First event handled %.3fs after exec (%s)", startup_timer.first_event, startup_timer.report())
+        return wrapper
+    return decorator
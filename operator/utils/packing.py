@@ -0,0 +1,337 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from ..containers.agent import create_agent_container
+from ..containers.init import create_init_container
+from . import clients
+from .metrics import PACKED_AGENTS
+from .podcache import PACKED_LABEL, get_pod_cache, is_packed
+from .registry import get_agent_registry
+from .volume import get_volume_config
+from .workqueue import PRIORITY_CREATE, PRIORITY_DELETE, get_work_queue
+
+logger = logging.getLogger(__name__)
+
+# JSON object of member AgentType name -> hash of its container, on each packed pod
+MEMBERS_ANNOTATION = 'agents.example.com/members'
+# Left running in the container of a member that went away; the only in-place pod change is an image
+PAUSE_IMAGE = 'registry.k8s.io/pause:3.9'
+WRAPPER = 'console.log("wrapped");'
+
+_packer = None
+
+def packing_class(namespace, spec):
+    """(namespace, runtime, resource class) of an AgentType that may share a pod, else None
+
+    Only agents that opted in and need nothing pod-wide of their own (a
+    sidecar, tool proxy, cached artifact, warm start or autoscaling) are
+    packed; agents of one class are interchangeable pod mates.
+    """
+    packing = spec.get('packing') or {}
+    agent = spec.get('agent') or {}
+    if not packing.get('enabled') or agent.get('warmStart') or agent.get('environment', {}).get('glueCode'):
+        return None
+    if any(spec.get(section) for section in ('sidecar', 'toolProxy', 'scaling')):
+        return None
+    runtime = agent.get('environment', {}).get('sdk', {}).get('runtime')
+    if agent.get('environment', {}).get('sdk', {}).get('packages'):
+        return None
+    return (namespace, runtime or '', packing.get('resourceClass', 'default'))
+
+def class_label(key):
+    return hashlib.sha256('\0'.join(key).encode()).hexdigest()[:16]
+
+def member_container_name(name):
+    """Container of one member; DNS labels are at most 63 characters"""
+    if len(name) <= 57:
+        return f"agent-{name}"
+    return f"agent-{name[:48]}-{hashlib.sha256(name.encode()).hexdigest()[:8]}"
+
+def member_container(name, spec):
+    """The agent container of one member, seeing only its own subdirectory of the shared volume"""
+    agent = spec.get('agent') or {}
+    container = create_agent_container(agent.get('image'), agent.get('environment', {}).get('variables', []))
+    container['name'] = member_container_name(name)
+    container['volumeMounts'] = [dict(mount, subPath=name) for mount in container['volumeMounts']]
+    return container
+
+def container_hash(container):
+    return hashlib.sha256(json.dumps(container, sort_keys=True, separators=(',', ':')).encode()).hexdigest()[:16]
+
+def build_packed_pod(namespace, key, members):
+    """Pod running each of `members` ((name, container, owner_ref) tuples) as its own container
+
+    One init container writes every member's wrapper into its subdirectory.
+    All members own the pod, so it is only garbage collected with the last.
+    """
+    init = create_init_container()
+    init['args'] = [' && '.join(f"mkdir -p /shared/{name} && echo '{WRAPPER}' > /shared/{name}/wrapper.js" for name, _, _ in members)]
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Pod',
+        'metadata': {
+            'generateName': 'agents-packed-',
+            'namespace': namespace,
+            'labels': {
+                PACKED_LABEL: class_label(key),
+                'managed-by': 'agent-operator'
+            },
+            'annotations': {MEMBERS_ANNOTATION: json.dumps({name: container_hash(container) for name, container, _ in members}, sort_keys=True)},
+            'ownerReferences': [owner_ref for _, _, owner_ref in members]
+        },
+        'spec': {
+            'volumes': get_volume_config(),
+            'initContainers': [init],
+            'containers': [container for _, container, _ in members]
+        }
+    }
+
+def pod_members(pod):
+    """Member name -> container hash recorded on a packed pod"""
+    return json.loads((pod['metadata'].get('annotations') or {}).get(MEMBERS_ANNOTATION) or '{}')
+
+def _log_pack(key, future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Packing %s failed: %r", key, future.exception())
+
+class PackedPod:
+    """Membership of one packed pod: who runs in it and who has left"""
+    __slots__ = ('namespace', 'key', 'pod', 'members', 'released')
+
+    def __init__(self, namespace, key, pod):
+        self.namespace = namespace
+        self.key = key
+        self.pod = pod
+        self.members = pod_members(pod)
+        self.released = set()
+
+    @property
+    def name(self):
+        return self.pod['metadata']['name']
+
+    def live(self):
+        return [name for name in self.members if name not in self.released]
+
+class PodPacker:
+    """Packs compatible AgentTypes into shared pods, `max_agents` at a time
+
+    Agents arriving within `window` seconds of each other are packed into
+    the same new pod, so a burst of creates costs one pod per `max_agents`
+    agents. Containers cannot be added to or removed from a pod: an agent
+    that leaves has its container switched to a pause image, and a pod
+    whose live members fall below `min_fill` of its capacity is repacked,
+    its members moving into the next new pod of their class.
+    """
+
+    def __init__(self, max_agents=8, window=2.0, min_fill=0.5):
+        self.max_agents = max_agents
+        self.window = window
+        self.min_fill = min_fill
+        self.pods = {}
+        self.members = {}
+        self._pending = {}
+        self._timers = {}
+        self.stats = {'packed': 0, 'pods': 0, 'released': 0, 'repacked': 0, 'adopted': 0}
+
+    def _track(self, packed):
+        self.pods[(packed.namespace, packed.name)] = packed
+        for name in packed.live():
+            self.members[(packed.namespace, name)] = packed
+
+    def _adopt(self, namespace, key, owner_ref):
+        """Membership of a packed pod the cache holds for this agent, e.g. after a restart"""
+        cache = get_pod_cache()
+        for pod in cache.pods_for_owner(owner_ref['uid']) if cache is not None else []:
+            if is_packed(pod) and not pod['metadata'].get('deletionTimestamp'):
+                packed = self.pods.get((namespace, pod['metadata']['name']))
+                if packed is None:
+                    packed = PackedPod(namespace, key, pod)
+                    # Members whose containers were paused have left
+                    paused = {container['name'] for container in pod['spec']['containers'] if container['image'] == PAUSE_IMAGE}
+                    packed.released.update(name for name in packed.members if member_container_name(name) in paused)
+                    self._track(packed)
+                    self.stats['adopted'] += 1
+                return packed
+        return None
+
+    async def assign(self, name, namespace, spec, owner_ref):
+        """Run an AgentType in a packed pod; returns the pod and 'unchanged', 'packed' or 'repacked'
+
+        An agent whose container changed leaves its pod and is packed again.
+        """
+        key = packing_class(namespace, spec)
+        container = member_container(name, spec)
+        packed = self.members.get((namespace, name)) or self._adopt(namespace, key, owner_ref)
+        action = 'packed'
+        if packed is not None:
+            if packed.members.get(name) == container_hash(container) and name not in packed.released:
+                return packed.pod, 'unchanged'
+            await self.release(namespace, name)
+            action = 'repacked'
+        pod = await self._enqueue(namespace, key, name, container, owner_ref)
+        return pod, action
+
+    def _enqueue(self, namespace, key, name, container, owner_ref):
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((name, container, owner_ref, future))
+        if len(pending) >= self.max_agents:
+            self._flush_now(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush_now, key)
+        return future
+
+    def _flush_now(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        members = self._pending.pop(key, [])
+        if members:
+            future = get_work_queue().submit(f"packed/{class_label(key)}/{members[0][0]}", key[0], PRIORITY_CREATE,
+                                             functools.partial(self._create, key, members))
+            future.add_done_callback(functools.partial(_log_pack, key))
+
+    async def _create(self, key, members):
+        namespace = key[0]
+        try:
+            api = await clients.get_core_api()
+            async with clients.concurrency():
+                pod = await clients.call_json(
+                    api.create_namespaced_pod, namespace=namespace,
+                    body=build_packed_pod(namespace, key, [member[:3] for member in members])
+                )
+        except Exception as e:
+            for *_, future in members:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        packed = PackedPod(namespace, key, pod)
+        for name, *_ in members:
+            previous = self.members.get((namespace, name))
+            if previous is not None:
+                # Moved here by a repack
+                previous.released.add(name)
+        self._track(packed)
+        self.stats['pods'] += 1
+        self.stats['packed'] += len(members)
+        PACKED_AGENTS.set(len(self.members))
+        registry = get_agent_registry()
+        for name, _, _, future in members:
+            registry.track(namespace, name, pod)
+            if not future.done():
+                future.set_result(pod)
+        return pod
+
+    async def release(self, namespace, name):
+        """Take an agent out of its packed pod; returns whether it was packed
+
+        Its container is switched to the pause image. The pod is deleted
+        once nobody is left, or repacked when too few are.
+        """
+        packed = self.members.pop((namespace, name), None)
+        if packed is None:
+            return False
+        packed.released.add(name)
+        self.stats['released'] += 1
+        PACKED_AGENTS.set(len(self.members))
+        live = packed.live()
+        api = await clients.get_core_api()
+        if not live:
+            await self._delete(api, packed)
+            return True
+        await self._pause(api, packed, name)
+        if len(live) < self.max_agents * self.min_fill:
+            partner = self._partner(packed)
+            if partner is not None or self._pending.get(packed.key):
+                # Merged with another underfilled pod, or with agents waiting for a new one
+                self.repack(packed)
+                if partner is not None:
+                    self.repack(partner)
+        return True
+
+    def _partner(self, packed):
+        """Another underfilled pod of the same class whose members fit next to this one's"""
+        room = self.max_agents - len(packed.live()) - len(self._pending.get(packed.key) or ())
+        for other in self.pods.values():
+            if other is not packed and other.key == packed.key and other.namespace == packed.namespace:
+                live = len(other.live())
+                if 0 < live <= room and live < self.max_agents * self.min_fill:
+                    return other
+        return None
+
+    async def _pause(self, api, packed, name):
+        try:
+            packed.pod = await clients.call_json(
+                api.patch_namespaced_pod, name=packed.name, namespace=packed.namespace,
+                body={'spec': {'containers': [{'name': member_container_name(name), 'image': PAUSE_IMAGE}]}}
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    async def _delete(self, api, packed):
+        self.pods.pop((packed.namespace, packed.name), None)
+        for name in packed.live():
+            self.members.pop((packed.namespace, name), None)
+        try:
+            await clients.call_json(
+                api.delete_namespaced_pod, name=packed.name, namespace=packed.namespace,
+                body={'preconditions': {'uid': packed.pod['metadata']['uid']}}
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    def repack(self, packed):
+        """Move a pod's live members into the next new pod of their class, then delete it"""
+        containers = {container['name']: container for container in packed.pod['spec']['containers']}
+        owners = {ref['name']: ref for ref in packed.pod['metadata'].get('ownerReferences') or []}
+        moved = [
+            self._enqueue(packed.namespace, packed.key, name, containers[member_container_name(name)], owners[name])
+            for name in packed.live()
+        ]
+        self.stats['repacked'] += 1
+        # Deleted after its members run elsewhere, so no agent is without a pod meanwhile
+        asyncio.ensure_future(self._retire(packed, moved))
+
+    async def _retire(self, packed, moved):
+        try:
+            await asyncio.gather(*moved)
+            async def delete():
+                await self._delete(await clients.get_core_api(), packed)
+            await get_work_queue().submit(f"packed/{packed.name}", packed.namespace, PRIORITY_DELETE, delete)
+        except Exception as e:
+            logger.error("Repacking %s/%s failed: %r", packed.namespace, packed.name, e)
+
+    def member_pod(self, namespace, name):
+        packed = self.members.get((namespace, name))
+        return None if packed is None else packed.pod
+
+    def close(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+def start_pod_packer(max_agents=8, window=2.0, min_fill=0.5):
+    """Create the process-wide pod packer"""
+    global _packer
+
+    _packer = PodPacker(max_agents=max_agents, window=window, min_fill=min_fill)
+    return _packer
+
+def stop_pod_packer():
+    """Drop the pod packer; agents waiting for a pod are retried by their handlers"""
+    global _packer
+
+    if _packer is not None:
+        _packer.close()
+    _packer = None
+
+def get_pod_packer():
+    """Get the process-wide pod packer, or None if pod packing is disabled"""
+    return _packer
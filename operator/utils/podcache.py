@@ -0,0 +1,133 @@
+import asyncio
+import logging
+
+from . import clients
+from .informer import Informer
+
+logger = logging.getLogger(__name__)
+
+MANAGED_SELECTOR = 'managed-by=agent-operator'
+POOL_LABEL = 'agents.example.com/pool'
+POOL_STATE_LABEL = 'agents.example.com/pool-state'
+# Set on the extra pods of an autoscaled AgentType; its first pod has none
+REPLICA_LABEL = 'agents.example.com/replica'
+# Set on pods shared by several AgentTypes, to the hash of their packing class
+PACKED_LABEL = 'agents.example.com/packed'
+
+_cache = None
+_task = None
+
+def agent_owner(pod):
+    """Name of the AgentType owning the pod, if any"""
+    for ref in pod['metadata'].get('ownerReferences') or []:
+        if ref.get('kind') == 'AgentType':
+            return ref['name']
+    return None
+
+def replica_index(pod):
+    """Which replica of its AgentType a pod is; 0 for the `<name>-pod` every AgentType has"""
+    return int((pod['metadata'].get('labels') or {}).get(REPLICA_LABEL, 0))
+
+def is_packed(pod):
+    """Whether the pod is shared by several AgentTypes, each running as one of its containers"""
+    return PACKED_LABEL in (pod['metadata'].get('labels') or {})
+
+def owner_uids(pod):
+    """Index values: UIDs of the pod's owners"""
+    return [ref['uid'] for ref in pod['metadata'].get('ownerReferences') or []]
+
+def app_label(pod):
+    """Index values: the pod's `app` label"""
+    app = (pod['metadata'].get('labels') or {}).get('app')
+    return [app] if app else []
+
+def standby_pool(pod):
+    """Index values: the warm pool of an unclaimed standby pod"""
+    labels = pod['metadata'].get('labels') or {}
+    if labels.get(POOL_STATE_LABEL) == 'standby' and labels.get(POOL_LABEL):
+        return [labels[POOL_LABEL]]
+    return []
+
+def configmap_volumes(pod):
+    """Index values: namespace/name of the ConfigMaps the pod mounts"""
+    namespace = pod['metadata']['namespace']
+    return [
+        f"{namespace}/{volume['configMap']['name']}"
+        for volume in (pod.get('spec') or {}).get('volumes') or []
+        if volume.get('configMap')
+    ]
+
+def pod_namespace(pod):
+    """Index values: the pod's namespace"""
+    return [pod['metadata']['namespace']]
+
+class PodCache(Informer):
+    """Cache of pods labelled `managed-by: agent-operator`, indexed for O(1) lookups"""
+
+    def __init__(self, core_api, **kwargs):
+        super().__init__(
+            core_api.list_pod_for_all_namespaces,
+            indexers={
+                'owner': owner_uids,
+                'app': app_label,
+                'namespace': pod_namespace,
+                'pool': standby_pool,
+                'configmap': configmap_volumes
+            },
+            label_selector=MANAGED_SELECTOR,
+            **kwargs
+        )
+
+    def get_pod(self, namespace, name):
+        """Get a cached pod by namespace and name"""
+        return self.get(f"{namespace}/{name}")
+
+    def pods_for_owner(self, uid):
+        """Get cached pods owned by the object with this UID"""
+        return self.by_index('owner', uid)
+
+    def pods_for_app(self, app):
+        """Get cached pods with this `app` label"""
+        return self.by_index('app', app)
+
+    def pods_in_namespace(self, namespace):
+        """Get cached managed pods in a namespace"""
+        return self.by_index('namespace', namespace)
+
+    def pods_mounting(self, namespace, configmap):
+        """Get cached pods that mount this ConfigMap"""
+        return self.by_index('configmap', f"{namespace}/{configmap}")
+
+    def standby_pods(self, pool):
+        """Get cached unclaimed pods of a warm pool"""
+        return self.by_index('pool', pool)
+
+    def standby_pools(self):
+        """Keys of the warm pools with cached unclaimed pods"""
+        return list(self.indexes['pool'])
+
+async def start_pod_cache(watch_timeout=300, filter=None, checkpoint=None):
+    """Create the process-wide pod cache and start its watch task"""
+    global _cache, _task
+
+    _cache = PodCache(await clients.get_core_api(), watch_timeout=watch_timeout, filter=filter, checkpoint=checkpoint)
+    _task = asyncio.create_task(_cache.run())
+    return _cache
+
+async def stop_pod_cache():
+    """Stop the pod cache watch task, saving its checkpoint for the next start"""
+    global _cache, _task
+
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    if _cache is not None and _cache.synced.is_set():
+        await _cache.save()
+    _cache = _task = None
+
+def get_pod_cache():
+    """Get the process-wide pod cache, or None if it is not running"""
+    return _cache
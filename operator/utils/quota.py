@@ -0,0 +1,204 @@
+import asyncio
+import re
+
+import kopf
+
+from . import clients
+from .informer import Informer
+from .metrics import QUEUE_DEPTH, QUOTA_CHECKS
+
+_QUANTITY = re.compile(r'^([+-]?[0-9.]+(?:[eE][+-]?[0-9]+)?)([a-zA-Z]*)$')
+_SUFFIXES = {
+    '': 1, 'n': 1e-9, 'u': 1e-6, 'm': 1e-3,
+    'k': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12, 'P': 1e15, 'E': 1e18,
+    'Ki': 2**10, 'Mi': 2**20, 'Gi': 2**30, 'Ti': 2**40, 'Pi': 2**50, 'Ei': 2**60
+}
+# Quota resources a pod's containers are charged against
+_COMPUTE = ('cpu', 'memory', 'ephemeral-storage')
+
+_cache = None
+_tasks = []
+
+class QuotaExceeded(kopf.PermanentError):
+    """A pod would not fit its namespace's ResourceQuota
+
+    A PermanentError so the work queue does not retry it with backoff; the
+    create handler waits for the quota to change and tries again instead.
+    """
+
+def parse_quantity(value):
+    """Parse a Kubernetes quantity such as '500m', '1Gi' or '2' into a number"""
+    match = _QUANTITY.match(str(value).strip())
+    if match is None or match.group(2) not in _SUFFIXES:
+        raise ValueError(f"invalid quantity {value!r}")
+    return float(match.group(1)) * _SUFFIXES[match.group(2)]
+
+def container_resources(container, limit_ranges=()):
+    """Effective (requests, limits) of a container after LimitRange defaulting"""
+    resources = container.get('resources') or {}
+    requests = dict(resources.get('requests') or {})
+    limits = dict(resources.get('limits') or {})
+    for limit_range in limit_ranges:
+        for item in (limit_range.get('spec') or {}).get('limits') or []:
+            if item.get('type') != 'Container':
+                continue
+            for resource, value in (item.get('default') or {}).items():
+                limits.setdefault(resource, value)
+            for resource, value in (item.get('defaultRequest') or {}).items():
+                requests.setdefault(resource, value)
+    # A missing request defaults to the limit
+    for resource, value in limits.items():
+        requests.setdefault(resource, value)
+    return requests, limits
+
+def _add(total, resources, prefix):
+    for resource, value in resources.items():
+        if resource in _COMPUTE:
+            total[f"{prefix}.{resource}"] = total.get(f"{prefix}.{resource}", 0) + parse_quantity(value)
+
+def pod_usage(pod, limit_ranges=()):
+    """Quota resources a pod consumes, e.g. {'pods': 1, 'requests.cpu': 0.5}
+
+    Like the quota admission plugin, a pod is charged the larger of its
+    containers' sum and its largest init container.
+    """
+    containers = {}
+    for container in pod['spec'].get('containers') or []:
+        requests, limits = container_resources(container, limit_ranges)
+        _add(containers, requests, 'requests')
+        _add(containers, limits, 'limits')
+
+    usage = dict(containers)
+    for container in pod['spec'].get('initContainers') or []:
+        init = {}
+        requests, limits = container_resources(container, limit_ranges)
+        _add(init, requests, 'requests')
+        _add(init, limits, 'limits')
+        for resource, value in init.items():
+            usage[resource] = max(usage.get(resource, 0), value)
+
+    for resource in _COMPUTE:
+        if f"requests.{resource}" in usage:
+            usage[resource] = usage[f"requests.{resource}"]
+    usage['pods'] = usage['count/pods'] = 1
+    return usage
+
+def _namespace(obj):
+    return [obj['metadata']['namespace']]
+
+class QuotaCache:
+    """ResourceQuota and LimitRange objects of every namespace, kept by watches
+
+    `check` tells locally whether a rendered pod fits its namespace's
+    quotas, so creates that would be rejected cost no API write. Pods
+    created since the quota status was last updated are reserved against
+    it until the quota controller catches up.
+    """
+
+    def __init__(self, core_api, watch_timeout=300):
+        self.quotas = Informer(
+            core_api.list_resource_quota_for_all_namespaces,
+            indexers={'namespace': _namespace},
+            watch_timeout=watch_timeout
+        )
+        self.limit_ranges = Informer(
+            core_api.list_limit_range_for_all_namespaces,
+            indexers={'namespace': _namespace},
+            watch_timeout=watch_timeout
+        )
+        self.quotas.add_listener(self._on_quota_change)
+        self.limit_ranges.add_listener(self._on_change)
+        self.stats = {'fits': 0, 'exceeded': 0, 'waits': 0}
+        self._reserved = {}
+        self._changed = {}
+        self._waiting = 0
+
+    def synced(self):
+        return self.quotas.synced.is_set() and self.limit_ranges.synced.is_set()
+
+    def _on_quota_change(self, event_type, quota):
+        # The quota controller has recounted usage, including our pods
+        self._reserved.pop(quota['metadata']['namespace'], None)
+        self._on_change(event_type, quota)
+
+    def _on_change(self, event_type, obj):
+        changed = self._changed.pop(obj['metadata']['namespace'], None)
+        if changed is not None:
+            changed.set()
+
+    def check(self, namespace, pod):
+        """Raise QuotaExceeded if the pod would not fit a quota of its namespace"""
+        if not self.synced():
+            return
+        quotas = self.quotas.by_index('namespace', namespace)
+        if not quotas:
+            return
+
+        need = pod_usage(pod, self.limit_ranges.by_index('namespace', namespace))
+        reserved = self._reserved.get(namespace, {})
+        for quota in quotas:
+            spec = quota.get('spec') or {}
+            if spec.get('scopes') or spec.get('scopeSelector'):
+                # Scoped quotas only apply to some pods; leave them to the apiserver
+                continue
+            status = quota.get('status') or {}
+            used = status.get('used') or {}
+            for resource, hard in (status.get('hard') or spec.get('hard') or {}).items():
+                if resource not in need:
+                    continue
+                total = parse_quantity(used.get(resource, 0)) + reserved.get(resource, 0) + need[resource]
+                if total > parse_quantity(hard):
+                    self.stats['exceeded'] += 1
+                    QUOTA_CHECKS.labels('exceeded').inc()
+                    raise QuotaExceeded(
+                        f"exceeded quota: {quota['metadata']['name']}, requested: {resource}={need[resource]:g}, "
+                        f"used: {resource}={used.get(resource, 0)}, limited: {resource}={hard}"
+                    )
+        self.stats['fits'] += 1
+        QUOTA_CHECKS.labels('fits').inc()
+
+    def reserve(self, namespace, pod):
+        """Count a just-created pod against the quotas until their status includes it"""
+        if not self.quotas.by_index('namespace', namespace):
+            return
+        reserved = self._reserved.setdefault(namespace, {})
+        for resource, value in pod_usage(pod, self.limit_ranges.by_index('namespace', namespace)).items():
+            reserved[resource] = reserved.get(resource, 0) + value
+
+    async def wait_for_change(self, namespace, timeout=60):
+        """Wait until a quota or LimitRange of the namespace changes, or `timeout` passes"""
+        changed = self._changed.get(namespace)
+        if changed is None:
+            changed = self._changed[namespace] = asyncio.Event()
+        self.stats['waits'] += 1
+        self._waiting += 1
+        QUEUE_DEPTH.labels('quota').set(self._waiting)
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiting -= 1
+            QUEUE_DEPTH.labels('quota').set(self._waiting)
+
+async def start_quota_cache(watch_timeout=300):
+    """Create the process-wide quota cache and start its watch tasks"""
+    global _cache, _tasks
+
+    _cache = QuotaCache(await clients.get_core_api(), watch_timeout=watch_timeout)
+    _tasks = [asyncio.create_task(_cache.quotas.run()), asyncio.create_task(_cache.limit_ranges.run())]
+    return _cache
+
+async def stop_quota_cache():
+    """Stop the quota cache watch tasks"""
+    global _cache, _tasks
+
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _cache = None
+    _tasks = []
+
+def get_quota_cache():
+    """Get the process-wide quota cache, or None if it is not running"""
+    return _cache
@@ -0,0 +1,143 @@
+import sys
+import time
+import uuid
+
+_registry = None
+
+def _pack_uid(uid):
+    """A pod UID as a 128-bit int, about half the size of its string form"""
+    try:
+        return uuid.UUID(uid).int
+    except (TypeError, ValueError):
+        return uid
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+class AgentRecord:
+    """Operator state of one tracked AgentType, without a per-instance dict
+
+    Namespaces, images and phases repeat across the fleet and are interned,
+    so each distinct value is stored once. The pod name is only stored when
+    it is not the default `<name>-pod` (e.g. a claimed standby pod), the
+    spec hash as an int and the UID as a UUID int.
+    """
+    __slots__ = ('namespace', 'name', 'image', '_pod_name', '_pod_uid', '_spec_hash', 'phase', 'transition')
+
+    def __init__(self, namespace, name):
+        self.namespace = sys.intern(namespace)
+        self.name = name
+        self.image = None
+        self._pod_name = None
+        self._pod_uid = None
+        self._spec_hash = None
+        self.phase = None
+        self.transition = None
+
+    @property
+    def pod_name(self):
+        return self._pod_name or f"{self.name}-pod"
+
+    @pod_name.setter
+    def pod_name(self, value):
+        self._pod_name = None if value == f"{self.name}-pod" else value
+
+    @property
+    def pod_uid(self):
+        if isinstance(self._pod_uid, int):
+            return str(uuid.UUID(int=self._pod_uid))
+        return self._pod_uid
+
+    @pod_uid.setter
+    def pod_uid(self, value):
+        self._pod_uid = _pack_uid(value)
+
+    @property
+    def spec_hash(self):
+        return None if self._spec_hash is None else f"{self._spec_hash:016x}"
+
+    @spec_hash.setter
+    def spec_hash(self, value):
+        self._spec_hash = None if value is None else int(value, 16)
+
+    def as_dict(self):
+        return {
+            'namespace': self.namespace,
+            'name': self.name,
+            'image': self.image,
+            'podName': self.pod_name,
+            'podUid': self.pod_uid,
+            'specHash': self.spec_hash,
+            'phase': self.phase,
+            'lastTransitionTime': self.transition
+        }
+
+class AgentRegistry:
+    """Compact per-AgentType state for every object this replica handles
+
+    Records are kept per namespace, so no key tuple is allocated per agent.
+    """
+
+    def __init__(self):
+        self._namespaces = {}
+        self.stats = {'tracked': 0, 'transitions': 0, 'forgotten': 0}
+
+    def __len__(self):
+        return sum(len(records) for records in self._namespaces.values())
+
+    def __iter__(self):
+        for records in self._namespaces.values():
+            yield from records.values()
+
+    def get(self, namespace, name):
+        return self._namespaces.get(namespace, {}).get(name)
+
+    def _record(self, namespace, name):
+        records = self._namespaces.get(namespace)
+        if records is None:
+            records = self._namespaces[sys.intern(namespace)] = {}
+        record = records.get(name)
+        if record is None:
+            record = records[name] = AgentRecord(namespace, name)
+            self.stats['tracked'] += 1
+        return record
+
+    def track(self, namespace, name, pod, image=None, spec_hash=None):
+        """Record the pod currently serving an AgentType"""
+        record = self._record(namespace, name)
+        record.pod_name = pod['metadata']['name']
+        record.pod_uid = pod['metadata'].get('uid')
+        if image is not None:
+            record.image = _intern(image)
+        if spec_hash is not None:
+            record.spec_hash = spec_hash
+        return record
+
+    def set_phase(self, namespace, name, phase):
+        """Record a phase; the transition time only moves when the phase changes"""
+        record = self._record(namespace, name)
+        if record.phase != phase:
+            record.phase = _intern(phase)
+            record.transition = time.time()
+            self.stats['transitions'] += 1
+        return record
+
+    def forget(self, namespace, name):
+        records = self._namespaces.get(namespace)
+        if records is not None and records.pop(name, None) is not None:
+            self.stats['forgotten'] += 1
+            if not records:
+                del self._namespaces[namespace]
+
+def init_agent_registry():
+    """Create the process-wide registry of tracked AgentTypes"""
+    global _registry
+
+    _registry = AgentRegistry()
+    return _registry
+
+def get_agent_registry():
+    """Get the process-wide registry, creating it on first use"""
+    if _registry is None:
+        init_agent_registry()
+    return _registry
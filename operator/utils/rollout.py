@@ -0,0 +1,84 @@
+import asyncio
+import contextlib
+
+from .metrics import QUEUE_DEPTH
+from .podcache import get_pod_cache
+
+_rollout = None
+
+class Rollout:
+    """Bounds how many agent pods spec updates disrupt at once
+
+    An update holds one of `max_unavailable` slots from before its pod is
+    patched or replaced until the pod cache shows the result, e.g. the new
+    pod Ready, or `timeout` passes. Changing the image of thousands of
+    AgentTypes therefore rolls through them in waves instead of restarting
+    every pod at once.
+    """
+
+    def __init__(self, max_unavailable=20, timeout=300):
+        self.max_unavailable = max_unavailable
+        self.timeout = timeout
+        self.stats = {'updates': 0, 'timeouts': 0}
+        self._slots = asyncio.Semaphore(max_unavailable)
+        self._active = 0
+        self._waiters = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one of the rollout's disruption slots"""
+        async with self._slots:
+            self._active += 1
+            QUEUE_DEPTH.labels('rollout').set(self._active)
+            try:
+                yield
+            finally:
+                self._active -= 1
+                QUEUE_DEPTH.labels('rollout').set(self._active)
+                self.stats['updates'] += 1
+
+    def on_pod_event(self, event_type, pod):
+        """Pod cache listener: wake waiters whose condition now holds"""
+        key = (pod['metadata']['namespace'], pod['metadata']['name'])
+        current = None if event_type == 'DELETED' else pod
+        for predicate, future in self._waiters.get(key, ()):
+            if not future.done() and predicate(current):
+                future.set_result(True)
+
+    async def wait(self, namespace, name, predicate):
+        """Wait until `predicate(pod or None)` holds for a cached pod; False on timeout
+
+        Returns at once when there is no pod cache to observe.
+        """
+        cache = get_pod_cache()
+        if cache is None:
+            return True
+        if predicate(cache.get_pod(namespace, name)):
+            return True
+
+        key = (namespace, name)
+        entry = (predicate, asyncio.get_running_loop().create_future())
+        self._waiters.setdefault(key, []).append(entry)
+        try:
+            await asyncio.wait_for(entry[1], self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            return False
+        finally:
+            self._waiters[key].remove(entry)
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+def init_rollout(max_unavailable=20, timeout=300):
+    """Create the process-wide rollout limiter"""
+    global _rollout
+
+    _rollout = Rollout(max_unavailable=max_unavailable, timeout=timeout)
+    return _rollout
+
+def get_rollout():
+    """Get the process-wide rollout limiter, creating a default one on first use"""
+    if _rollout is None:
+        init_rollout()
+    return _rollout
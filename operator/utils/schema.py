@@ -0,0 +1,241 @@
+import copy
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import kopf
+import yaml
+
+from . import clients
+
+logger = logging.getLogger(__name__)
+
+CRD_NAME = 'agenttypes.agents.example.com'
+
+_validator = None
+
+class InvalidSpec(kopf.PermanentError):
+    """An AgentType spec that does not match the CRD schema
+
+    A PermanentError: the same spec fails the same way on every retry.
+    """
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+TYPE_CHECKS = {
+    'object': lambda value: isinstance(value, Mapping),
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    'integer': _is_integer,
+    'number': _is_number,
+    'boolean': lambda value: isinstance(value, bool)
+}
+
+def _type_name(value):
+    for name in ('boolean', 'integer', 'number', 'string', 'array', 'object'):
+        if TYPE_CHECKS[name](value):
+            return name
+    return 'null' if value is None else type(value).__name__
+
+def _bounds(schema):
+    """Checks of a number's minimum and maximum, as (test, message) pairs"""
+    checks = []
+    if 'minimum' in schema:
+        low = schema['minimum']
+        if schema.get('exclusiveMinimum'):
+            checks.append((lambda value: value > low, f"should be greater than {low}"))
+        else:
+            checks.append((lambda value: value >= low, f"should be greater than or equal to {low}"))
+    if 'maximum' in schema:
+        high = schema['maximum']
+        if schema.get('exclusiveMaximum'):
+            checks.append((lambda value: value < high, f"should be less than {high}"))
+        else:
+            checks.append((lambda value: value <= high, f"should be less than or equal to {high}"))
+    return checks
+
+def compile_schema(schema):
+    """Compile a structural OpenAPI v3 schema into `check(value, path, errors)`
+
+    The check appends apiserver-style messages to `errors` and returns the
+    value with defaults applied and unknown fields pruned, as the apiserver
+    would store it; values it does not change are returned as they are.
+    The schema is walked once here, so checking a value only runs the
+    closures for the fields it has. CEL rules (x-kubernetes-validations)
+    are not evaluated; the apiserver still enforces them.
+    """
+    if schema.get('x-kubernetes-int-or-string'):
+        is_type, type_name = (lambda value: _is_integer(value) or isinstance(value, str)), 'integer or string'
+    elif 'type' in schema:
+        is_type, type_name = TYPE_CHECKS[schema['type']], schema['type']
+    else:
+        is_type, type_name = (lambda value: True), None
+    nullable = schema.get('nullable', False)
+    enum = schema.get('enum')
+    bounds = _bounds(schema) if type_name in ('integer', 'number') else []
+    if type_name == 'object':
+        check_children = _compile_object(schema)
+    elif type_name == 'array' and 'items' in schema:
+        check_children = _compile_array(schema['items'])
+    else:
+        check_children = None
+
+    def check(value, path, errors):
+        if value is None and nullable:
+            return value
+        if not is_type(value):
+            errors.append(f"{path}: Invalid value: \"{_type_name(value)}\": {path} in body must be of type {type_name}")
+            return value
+        if enum is not None and value not in enum:
+            supported = ', '.join(json.dumps(option) for option in enum)
+            errors.append(f"{path}: Unsupported value: {json.dumps(value)}: supported values: {supported}")
+        for test, message in bounds:
+            if not test(value):
+                errors.append(f"{path}: Invalid value: {value}: {path} in body {message}")
+        if check_children is not None:
+            return check_children(value, path, errors)
+        return value
+
+    return check
+
+def _compile_object(schema):
+    properties = {key: compile_schema(sub) for key, sub in (schema.get('properties') or {}).items()}
+    defaults = [(key, sub['default']) for key, sub in (schema.get('properties') or {}).items() if 'default' in sub]
+    required = schema.get('required') or ()
+    additional = schema.get('additionalProperties')
+    check_additional = compile_schema(additional) if isinstance(additional, dict) else None
+    # Fields the schema does not describe are kept only when it says so
+    keep_unknown = schema.get('x-kubernetes-preserve-unknown-fields', False) or additional is True
+
+    def check(value, path, errors):
+        result = None
+        for key, item in value.items():
+            check_item = properties.get(key, check_additional)
+            if check_item is None:
+                if not keep_unknown:
+                    if result is None:
+                        result = dict(value)
+                    del result[key]
+                continue
+            checked = check_item(item, f"{path}.{key}", errors)
+            if checked is not item:
+                if result is None:
+                    result = dict(value)
+                result[key] = checked
+        for key, default in defaults:
+            if key not in value:
+                if result is None:
+                    result = dict(value)
+                # Defaults are checked too, so defaults nested in them apply
+                result[key] = properties[key](copy.deepcopy(default), f"{path}.{key}", [])
+        current = value if result is None else result
+        for key in required:
+            if key not in current:
+                errors.append(f"{path}.{key}: Required value")
+        return current
+
+    return check
+
+def _compile_array(items):
+    check_item = compile_schema(items)
+
+    def check(value, path, errors):
+        result = None
+        for index, item in enumerate(value):
+            checked = check_item(item, f"{path}[{index}]", errors)
+            if checked is not item:
+                if result is None:
+                    result = list(value)
+                result[index] = checked
+        return value if result is None else result
+
+    return check
+
+def spec_digest(spec):
+    """Content hash of a spec, the key its validation result is cached under"""
+    encoded = json.dumps(spec, sort_keys=True, separators=(',', ':'), default=dict).encode()
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+class SpecValidator:
+    """Validates and defaults AgentType specs against the compiled CRD schema
+
+    Results are cached by spec hash, up to `cache_size` specs: AgentTypes
+    stamped from one template, and every resume or update of an unchanged
+    spec, are checked once. Defaulted specs are shared between callers and
+    must not be modified.
+    """
+
+    def __init__(self, schema, cache_size=4096):
+        self._check = compile_schema(schema)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'invalid': 0}
+
+    def _result(self, spec):
+        key = spec_digest(spec)
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return result
+        self.stats['misses'] += 1
+        errors = []
+        defaulted = self._check(spec, 'spec', errors)
+        result = self.cache[key] = (defaulted if isinstance(defaulted, dict) else dict(defaulted), errors)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    def validate(self, spec):
+        """The spec with its defaults applied; raises InvalidSpec listing every error"""
+        defaulted, errors = self._result(spec)
+        if errors:
+            self.stats['invalid'] += 1
+            raise InvalidSpec(errors)
+        return defaulted
+
+    def defaulted(self, spec):
+        """The spec with its defaults applied, valid or not"""
+        return self._result(spec)[0]
+
+def crd_spec_schema(crd):
+    """The spec schema of a CustomResourceDefinition's storage version"""
+    version = next(version for version in crd['spec']['versions'] if version.get('storage'))
+    return version['schema']['openAPIV3Schema']['properties']['spec']
+
+def load_crd(path):
+    """Read the CustomResourceDefinition manifest, e.g. base/crd/agenttype.yaml"""
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+async def fetch_crd(name=CRD_NAME):
+    """Read the CustomResourceDefinition installed in the cluster"""
+    api = await clients.get_apiextensions_api()
+    return await clients.call_json(api.read_custom_resource_definition, name=name)
+
+def init_spec_validator(crd, cache_size=4096):
+    """Compile the process-wide validator from a CustomResourceDefinition"""
+    global _validator
+
+    _validator = SpecValidator(crd_spec_schema(crd), cache_size=cache_size)
+    return _validator
+
+def get_spec_validator():
+    """Get the process-wide validator, or None if specs are not validated locally"""
+    return _validator
+
+def validated_spec(spec):
+    """The spec with its defaults applied, or as it is when there is no validator"""
+    if _validator is None:
+        return spec
+    return _validator.validate(spec)
@@ -0,0 +1,191 @@
+import asyncio
+import bisect
+import datetime
+import hashlib
+import logging
+import socket
+from datetime import timezone
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from . import clients
+from .config import env_str
+
+logger = logging.getLogger(__name__)
+
+LEASE_GROUP_LABEL = 'agents.example.com/shard-group'
+
+_membership = None
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+def _micro_time(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def _parse_time(value):
+    return datetime.datetime.strptime(value.replace('Z', '+0000'), '%Y-%m-%dT%H:%M:%S.%f%z')
+
+class HashRing:
+    """Consistent hash ring with virtual nodes
+
+    Adding or removing one of N members only moves about 1/N of the keys.
+    """
+
+    def __init__(self, members=(), vnodes=64):
+        self.vnodes = vnodes
+        self.members = sorted(set(members))
+        points = sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(vnodes))
+        self._positions = [position for position, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key):
+        """Member owning the key, or None for an empty ring"""
+        if not self._positions:
+            return None
+        index = bisect.bisect(self._positions, _hash(key)) % len(self._positions)
+        return self._owners[index]
+
+class ShardMembership:
+    """Replica membership kept in Lease objects, one Lease per replica
+
+    Each replica renews its own Lease; the live members are the Leases whose
+    renewTime is within their leaseDurationSeconds. Ownership of an AgentType
+    is decided by the consistent hash of its namespace/name.
+    """
+
+    def __init__(self, namespace, identity, group='agent-operator', lease_duration=30, renew_interval=10, vnodes=64):
+        self.namespace = namespace
+        self.identity = identity
+        self.group = group
+        self.lease_duration = lease_duration
+        self.renew_interval = renew_interval
+        self.vnodes = vnodes
+        self.ring = HashRing([identity], vnodes)
+        self.listeners = []
+
+    @property
+    def lease_name(self):
+        return f"{self.group}-shard-{self.identity}"
+
+    def add_listener(self, callback):
+        """Call `callback(old_ring, new_ring)` after membership changes; it may be a coroutine"""
+        self.listeners.append(callback)
+
+    def owns(self, namespace, name):
+        """Whether this replica owns the object"""
+        return self.ring.owner(f"{namespace}/{name}") == self.identity
+
+    def _lease_body(self, now):
+        return {
+            'apiVersion': 'coordination.k8s.io/v1',
+            'kind': 'Lease',
+            'metadata': {
+                'name': self.lease_name,
+                'namespace': self.namespace,
+                'labels': {LEASE_GROUP_LABEL: self.group}
+            },
+            'spec': {
+                'holderIdentity': self.identity,
+                'leaseDurationSeconds': self.lease_duration,
+                'renewTime': _micro_time(now)
+            }
+        }
+
+    async def renew(self):
+        """Create or renew this replica's Lease"""
+        api = await clients.get_coordination_api()
+        body = self._lease_body(datetime.datetime.now(timezone.utc))
+        try:
+            await clients.call_json(api.patch_namespaced_lease, name=self.lease_name, namespace=self.namespace, body={'spec': body['spec']})
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            await clients.call_json(api.create_namespaced_lease, namespace=self.namespace, body=body)
+
+    async def refresh(self):
+        """Rebuild the ring from the live Leases; returns True when membership changed"""
+        api = await clients.get_coordination_api()
+        leases = await clients.call_json(
+            api.list_namespaced_lease,
+            namespace=self.namespace,
+            label_selector=f"{LEASE_GROUP_LABEL}={self.group}"
+        )
+        now = datetime.datetime.now(timezone.utc)
+        members = {self.identity}
+        for lease in leases.get('items') or []:
+            spec = lease.get('spec') or {}
+            renewed = spec.get('renewTime')
+            if not renewed or not spec.get('holderIdentity'):
+                continue
+            age = (now - _parse_time(renewed)).total_seconds()
+            if age <= spec.get('leaseDurationSeconds', self.lease_duration):
+                members.add(spec['holderIdentity'])
+
+        if sorted(members) == self.ring.members:
+            return False
+        old_ring, self.ring = self.ring, HashRing(members, self.vnodes)
+        logger.info("Shard membership changed: %s", self.ring.members)
+        for callback in self.listeners:
+            result = callback(old_ring, self.ring)
+            if asyncio.iscoroutine(result):
+                await result
+        return True
+
+    async def run(self):
+        """Renew the Lease and refresh membership until cancelled"""
+        while True:
+            try:
+                await self.renew()
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Any failure must not end renewal: an expired Lease hands this
+                # replica's shard to peers while it keeps handling it
+                logger.warning("Shard membership update failed: %s", e)
+            await asyncio.sleep(self.renew_interval)
+
+    async def release(self):
+        """Delete this replica's Lease so peers rebalance immediately"""
+        api = await clients.get_coordination_api()
+        try:
+            await clients.call_json(api.delete_namespaced_lease, name=self.lease_name, namespace=self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+def default_identity():
+    """Replica identity: the pod name from the downward API, else the hostname"""
+    return env_str('POD_NAME', socket.gethostname())
+
+async def start_sharding(namespace, identity, **kwargs):
+    """Join the shard group and start renewing membership"""
+    global _membership
+
+    _membership = ShardMembership(namespace, identity, **kwargs)
+    await _membership.renew()
+    await _membership.refresh()
+    _membership.task = asyncio.create_task(_membership.run())
+    return _membership
+
+async def stop_sharding():
+    """Leave the shard group"""
+    global _membership
+
+    if _membership is not None:
+        _membership.task.cancel()
+        try:
+            await _membership.task
+        except asyncio.CancelledError:
+            pass
+        await _membership.release()
+    _membership = None
+
+def get_membership():
+    """Get the shard membership, or None when sharding is disabled"""
+    return _membership
+
+def owns(namespace, name):
+    """Whether this replica should handle the object; always true when unsharded"""
+    return _membership is None or _membership.owns(namespace, name)
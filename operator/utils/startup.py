@@ -0,0 +1,59 @@
+import os
+import time
+
+# Imported first by main.py and kept free of heavy dependencies, so the
+# `imports` phase covers everything the operator loads.
+
+def process_age():
+    """Seconds since this process was exec'd, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime), counted after the parenthesised command name
+            start_ticks = int(f.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+
+class StartupTimer:
+    """Wall time of each operator startup phase, from process exec to the first handled event
+
+    `mark(phase)` records the time since the previous mark, so phases are
+    consecutive and add up to the total.
+    """
+
+    def __init__(self):
+        now = time.perf_counter()
+        age = process_age()
+        self.phases = {}
+        if age is not None:
+            self.phases['interpreter'] = age
+        self.started = now - (age or 0.0)
+        self.first_event = None
+        self._last = now
+
+    def mark(self, phase):
+        """Record the time since the previous mark as `phase`; returns its duration"""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+        return self.phases[phase]
+
+    def event_handled(self):
+        """Record the first handled event; returns True only for the first one"""
+        if self.first_event is not None:
+            return False
+        self.mark('first_event')
+        self.first_event = self._last - self.started
+        return True
+
+    def elapsed(self):
+        """Seconds since process exec"""
+        return time.perf_counter() - self.started
+
+    def report(self):
+        """Phase durations in milliseconds, for logs"""
+        return ', '.join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in self.phases.items())
+
+timer = StartupTimer()
@@ -0,0 +1,225 @@
+import asyncio
+import collections
+import datetime
+import logging
+from datetime import timezone
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from . import clients
+from .metrics import QUEUE_DEPTH, STATUS_PATCH_BATCH_SIZE, STATUS_PATCHES
+
+logger = logging.getLogger(__name__)
+
+_writer = None
+
+def now():
+    """Current time formatted as a Kubernetes timestamp"""
+    return datetime.datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def make_condition(status_type, status, reason=None, message=None):
+    """Build a status condition entry"""
+    return {
+        'type': status_type,
+        'status': status,
+        'lastTransitionTime': now(),
+        'reason': reason,
+        'message': message
+    }
+
+def _same_condition(a, b):
+    """Compare two conditions ignoring their transition time"""
+    keys = ('status', 'reason', 'message')
+    return all(a.get(key) == b.get(key) for key in keys)
+
+class StatusWriter:
+    """Coalesce AgentType condition updates into one status patch per window
+
+    Updates for the same object that arrive within `window` seconds are merged
+    by condition type (the newest one wins) and written with a single patch.
+    Patches that would not change the stored conditions are skipped.
+    Plain status fields such as `phase` are coalesced the same way.
+    """
+
+    def __init__(self, window=1.0, group='agents.example.com', version='v1', plural='agenttypes', max_deleted=65536):
+        self.window = window
+        self.max_deleted = max_deleted
+        self.group = group
+        self.version = version
+        self.plural = plural
+        self.stats = {'updates': 0, 'patches': 0, 'skipped': 0, 'errors': 0}
+        self._pending = {}
+        self._written = {}
+        self._pending_fields = {}
+        self._written_fields = {}
+        self._batch_sizes = {}
+        self._timers = {}
+        self._deleted = collections.OrderedDict()
+
+    def seed(self, namespace, name, conditions):
+        """Record conditions already stored on the object"""
+        key = (namespace, name)
+        # Seen again, so a new object of the same name
+        self._deleted.pop(key, None)
+        if key not in self._written:
+            self._written[key] = {c['type']: dict(c) for c in conditions or [] if 'type' in c}
+
+    def update(self, namespace, name, condition):
+        """Queue a condition update; it is written when the window closes"""
+        key = (namespace, name)
+        if key in self._deleted:
+            return
+        self.stats['updates'] += 1
+        self._pending.setdefault(key, {})[condition['type']] = condition
+        self._schedule(key)
+
+    def set_fields(self, namespace, name, **fields):
+        """Queue an update of plain status fields, e.g. `phase`"""
+        key = (namespace, name)
+        if key in self._deleted:
+            return
+        self.stats['updates'] += 1
+        self._pending_fields.setdefault(key, {}).update(fields)
+        self._schedule(key)
+
+    def _schedule(self, key):
+        self._batch_sizes[key] = self._batch_sizes.get(key, 0) + 1
+        if key not in self._timers:
+            self._timers[key] = asyncio.ensure_future(self._flush_later(key))
+            QUEUE_DEPTH.labels('status').set(len(self._timers))
+
+    def forget(self, namespace, name):
+        """Drop all state for a deleted object"""
+        key = (namespace, name)
+        self._pending.pop(key, None)
+        self._written.pop(key, None)
+        self._pending_fields.pop(key, None)
+        self._written_fields.pop(key, None)
+        self._batch_sizes.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+    def mark_deleted(self, namespace, name):
+        """Drop all state for an object being deleted and ignore later updates for it
+
+        Its pods going away would otherwise patch the status of an object
+        that no longer exists, one failing call per object in a teardown.
+        """
+        self.forget(namespace, name)
+        self._deleted[(namespace, name)] = True
+        self._deleted.move_to_end((namespace, name))
+        while len(self._deleted) > self.max_deleted:
+            self._deleted.popitem(last=False)
+
+    def is_deleted(self, namespace, name):
+        """Whether the object was marked as being deleted"""
+        return (namespace, name) in self._deleted
+
+    async def _flush_later(self, key):
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return
+        self._timers.pop(key, None)
+        QUEUE_DEPTH.labels('status').set(len(self._timers))
+        await self.flush(key)
+
+    def _merge_fields(self, key):
+        """Pending status fields that differ from the written ones"""
+        pending = self._pending_fields.pop(key, {})
+        written = self._written_fields.get(key, {})
+        return {field: value for field, value in pending.items() if written.get(field) != value}
+
+    def _merge(self, key):
+        """Merge pending updates into the written conditions, or None if unchanged"""
+        pending = self._pending.pop(key, {})
+        written = self._written.get(key, {})
+        merged = dict(written)
+        changed = False
+        for status_type, condition in pending.items():
+            previous = written.get(status_type)
+            if previous is not None and _same_condition(previous, condition):
+                continue
+            if previous is not None and previous.get('status') == condition.get('status'):
+                # Only reason/message changed; keep the original transition time
+                condition = dict(condition, lastTransitionTime=previous.get('lastTransitionTime'))
+            merged[status_type] = condition
+            changed = True
+        return merged if changed else None
+
+    async def flush(self, key):
+        """Write the pending updates for one object"""
+        merged = self._merge(key)
+        fields = self._merge_fields(key)
+        batch_size = self._batch_sizes.pop(key, 0)
+        if merged is None and not fields:
+            self.stats['skipped'] += 1
+            STATUS_PATCHES.labels('skipped').inc()
+            return False
+        STATUS_PATCH_BATCH_SIZE.observe(batch_size)
+
+        status = dict(fields)
+        if merged is not None:
+            status['conditions'] = list(merged.values())
+
+        namespace, name = key
+        custom_api = await clients.get_custom_api()
+        try:
+            await clients.call_json(
+                custom_api.patch_namespaced_custom_object_status,
+                group=self.group,
+                version=self.version,
+                name=name,
+                namespace=namespace,
+                plural=self.plural,
+                body={'status': status},
+                field_manager='kopf',
+                # Custom resources default to JSON Patch, which a dict body is not
+                _content_type='application/merge-patch+json'
+            )
+        except ApiException as e:
+            self.stats['errors'] += 1
+            STATUS_PATCHES.labels('error').inc()
+            if e.status == 404:
+                self.forget(namespace, name)
+            else:
+                logger.error("Error updating status of %s/%s: %s", namespace, name, e)
+            return False
+
+        if merged is not None:
+            self._written[key] = merged
+        self._written_fields.setdefault(key, {}).update(fields)
+        self.stats['patches'] += 1
+        STATUS_PATCHES.labels('written').inc()
+        return True
+
+    async def close(self):
+        """Flush every pending update, e.g. on operator shutdown"""
+        timers = list(self._timers.values())
+        self._timers.clear()
+        for timer in timers:
+            timer.cancel()
+        keys = set(self._pending) | set(self._pending_fields)
+        await asyncio.gather(*(self.flush(key) for key in keys))
+
+def init_status_writer(window=1.0):
+    """Create the process-wide status writer"""
+    global _writer
+
+    _writer = StatusWriter(window=window)
+    return _writer
+
+def get_status_writer():
+    """Get the process-wide status writer, creating it on first use"""
+    if _writer is None:
+        init_status_writer()
+    return _writer
+
+async def close_status_writer():
+    """Flush and drop the process-wide status writer"""
+    global _writer
+
+    if _writer is not None:
+        await _writer.close()
+    _writer = None
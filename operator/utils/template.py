@@ -0,0 +1,195 @@
+import functools
+import json
+import logging
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from ..containers.agent import create_agent_container
+from ..containers.init import create_artifact_init_container, create_init_container
+from ..containers.sidecar import create_sidecar_container
+from ..containers.toolproxy import create_tool_proxy_container, tool_proxy_url
+from . import clients
+from .artifacts import WRAPPER_FILES, artifact_params, configmap_name
+from .config import env_bool, env_int, env_str
+from .volume import get_artifact_volumes, get_volume_config
+
+logger = logging.getLogger(__name__)
+
+# Only used when TOOL_PROXY_IMAGE is unset and the operator's own image cannot be read
+DEFAULT_TOOL_PROXY_IMAGE = 'agent-operator'
+
+def template_key(spec):
+    """Cache key of the pod parts that depend on the spec: (image, env, sidecar, artifact, tool proxy)"""
+    agent_spec = spec.get('agent', {})
+    env_vars = agent_spec.get('environment', {}).get('variables') or []
+    sidecar = spec.get('sidecar')
+    tool_proxy = spec.get('toolProxy')
+    return (
+        agent_spec.get('image'),
+        tuple((var['name'], var['value']) for var in env_vars),
+        json.dumps(sidecar, sort_keys=True) if sidecar else None,
+        artifact_params(spec),
+        json.dumps(tool_proxy, sort_keys=True) if tool_proxy else None
+    )
+
+def _agent_env(env_vars, tool_proxy):
+    """The agent's variables, plus TOOL_PROXY_URL when it runs next to a tool proxy"""
+    if not tool_proxy:
+        return env_vars
+    return list(env_vars) + [{'name': 'TOOL_PROXY_URL', 'value': tool_proxy_url(tool_proxy)}]
+
+def _sdk(artifact):
+    """(key, runtime) of the SDK the agent container mounts, if any"""
+    if artifact is None or not artifact[2]:
+        return None
+    return artifact[:2]
+
+def build_artifact_fragments(artifact, sdk_keep=32, namespace=None, sdk_node_cache=True):
+    """(volumes, initContainers) of a pod, copying its cached artifact if it has one
+
+    `namespace` is only needed for artifacts with SDK packages, whose node
+    cache is kept per namespace.
+    """
+    if artifact is None:
+        return get_volume_config(), [create_init_container()]
+    key, runtime, has_sdk, version = artifact
+    volumes = get_volume_config() + get_artifact_volumes(configmap_name(key), has_sdk, namespace, sdk_node_cache)
+    init_container = create_artifact_init_container(key, runtime, WRAPPER_FILES[runtime], has_sdk, keep=sdk_keep, version=version)
+    return volumes, [init_container]
+
+def build_pod(name, namespace, spec, owner_ref, tool_proxy_image=DEFAULT_TOOL_PROXY_IMAGE):
+    """Build a pod manifest from scratch with the container builder functions"""
+    agent_spec = spec.get('agent', {})
+    artifact = artifact_params(spec)
+    env_vars = _agent_env(agent_spec.get('environment', {}).get('variables', []), spec.get('toolProxy'))
+    containers = [create_agent_container(agent_spec.get('image'), env_vars, _sdk(artifact))]
+    if spec.get('sidecar'):
+        containers.append(create_sidecar_container(spec['sidecar']))
+    if spec.get('toolProxy'):
+        containers.append(create_tool_proxy_container(spec['toolProxy'], tool_proxy_image))
+    volumes, init_containers = build_artifact_fragments(artifact, namespace=namespace)
+
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Pod',
+        'metadata': {
+            'name': f"{name}-pod",
+            'namespace': namespace,
+            'labels': {
+                'app': name,
+                'managed-by': 'agent-operator'
+            },
+            'ownerReferences': [owner_ref]
+        },
+        'spec': {
+            'volumes': volumes,
+            'initContainers': init_containers,
+            'containers': containers
+        }
+    }
+
+class PodTemplate:
+    """Pod renderer that precompiles invariant fragments and memoizes the rest
+
+    Container lists, and the volumes and init container of agents with a
+    cached artifact, are kept in LRUs keyed by `template_key`. Agents
+    without an artifact share one precompiled volume list and init
+    container. Only the per-agent metadata is rebuilt on each render.
+
+    Rendered pods share their fragments with the cache and with each other;
+    callers must treat `spec` as read-only and copy before mutating it.
+    """
+
+    def __init__(self, cache_size=1024, sdk_keep=32, tool_proxy_image=DEFAULT_TOOL_PROXY_IMAGE, sdk_node_cache=True):
+        self.sdk_keep = sdk_keep
+        self.sdk_node_cache = sdk_node_cache
+        self.tool_proxy_image = tool_proxy_image
+        self.volumes, self.init_containers = build_artifact_fragments(None)
+        self._containers = functools.lru_cache(maxsize=cache_size)(self._build_containers)
+        self._artifacts = functools.lru_cache(maxsize=cache_size)(self._build_artifact)
+
+    def _build_containers(self, image, env_items, sidecar_json, artifact, tool_proxy_json):
+        tool_proxy = json.loads(tool_proxy_json) if tool_proxy_json is not None else None
+        env_vars = _agent_env([{'name': name, 'value': value} for name, value in env_items], tool_proxy)
+        containers = [create_agent_container(image, env_vars, _sdk(artifact))]
+        if sidecar_json is not None:
+            containers.append(create_sidecar_container(json.loads(sidecar_json)))
+        if tool_proxy is not None:
+            containers.append(create_tool_proxy_container(tool_proxy, self.tool_proxy_image))
+        return containers
+
+    def _build_artifact(self, artifact, namespace):
+        return build_artifact_fragments(artifact, self.sdk_keep, namespace, self.sdk_node_cache)
+
+    def render(self, name, namespace, spec, owner_ref):
+        """Render the pod manifest for one AgentType"""
+        key = template_key(spec)
+        volumes, init_containers = self.volumes, self.init_containers
+        if key[3] is not None:
+            # Only SDK fragments differ per namespace
+            volumes, init_containers = self._artifacts(key[3], namespace if key[3][2] and self.sdk_node_cache else None)
+        return {
+            'apiVersion': 'v1',
+            'kind': 'Pod',
+            'metadata': {
+                'name': f"{name}-pod",
+                'namespace': namespace,
+                'labels': {
+                    'app': name,
+                    'managed-by': 'agent-operator'
+                },
+                'ownerReferences': [owner_ref]
+            },
+            'spec': {
+                'volumes': volumes,
+                'initContainers': init_containers,
+                'containers': self._containers(*key)
+            }
+        }
+
+    def cache_info(self):
+        """Hit/miss/size counters of the fragment cache"""
+        return self._containers.cache_info()
+
+    def cache_clear(self):
+        self._containers.cache_clear()
+        self._artifacts.cache_clear()
+
+_template = None
+
+async def operator_image(container='operator'):
+    """Image of the operator's own container, read from its pod named by POD_NAME/POD_NAMESPACE
+
+    Returns None outside a pod, or when the pod cannot be read.
+    """
+    name, namespace = env_str('POD_NAME'), env_str('POD_NAMESPACE')
+    if name is None or namespace is None:
+        return None
+    api = await clients.get_core_api()
+    try:
+        pod = await clients.call_json(api.read_namespaced_pod, name=name, namespace=namespace)
+    except ApiException as e:
+        logger.warning("Could not read the operator pod %s/%s for its image: %s", namespace, name, e.status)
+        return None
+    containers = pod['spec']['containers']
+    return next((c['image'] for c in containers if c['name'] == container), containers[0]['image'])
+
+def init_pod_template(tool_proxy_image=None):
+    """Create the process-wide pod template; tool-proxy sidecars run `tool_proxy_image`"""
+    global _template
+
+    _template = PodTemplate(
+        cache_size=env_int('TEMPLATE_CACHE_SIZE', 1024),
+        sdk_keep=env_int('SDK_CACHE_KEEP', 32),
+        tool_proxy_image=tool_proxy_image or env_str('TOOL_PROXY_IMAGE', DEFAULT_TOOL_PROXY_IMAGE),
+        sdk_node_cache=env_bool('SDK_NODE_CACHE', True)
+    )
+    return _template
+
+def get_pod_template():
+    """Get the process-wide pod template"""
+    global _template
+
+    if _template is None:
+        init_pod_template()
+    return _template
@@ -1,18 +1,4 @@
-from kubernetes.client import V1Volume, V1VolumeMount
-
-def create_shared_volume(name="shared-volume"):
-    """Create a shared volume configuration"""
-    return V1Volume(
-        name=name,
-        empty_dir={}
-    )
-
-def create_volume_mount(volume_name="shared-volume", mount_path="/shared"):
-    """Create a volume mount configuration"""
-    return V1VolumeMount(
-        name=volume_name,
-        mount_path=mount_path
-    )
+SDK_CACHE_HOST_PATH = '/var/cache/agent-operator/sdk'
 
 def get_volume_config():
     """Get the volume configuration for the pod"""
@@ -27,3 +13,36 @@ def get_volume_mounts():
         'name': 'shared-volume',
         'mountPath': '/shared'
     }]
+
+def get_artifact_volumes(configmap_name, sdk_cache, namespace, node_cache=True):
+    """Get the volumes holding a cached glue code/SDK artifact
+
+    Without `node_cache` the package set is installed into an emptyDir on
+    every pod start, for namespaces whose Pod Security level forbids hostPath.
+    """
+    volumes = [{
+        'name': 'artifact',
+        'configMap': {'name': configmap_name}
+    }]
+    if sdk_cache and not node_cache:
+        volumes.append({'name': 'sdk-cache', 'emptyDir': {}})
+        volumes.append({'name': 'sdk', 'emptyDir': {}})
+    elif sdk_cache:
+        # Node-local, so packages are installed once per node and content
+        # hash; kept per namespace, since installing runs package code and
+        # one tenant must not be able to change another tenant's packages
+        volumes.append({
+            'name': 'sdk-cache',
+            'hostPath': {'path': f"{SDK_CACHE_HOST_PATH}/{namespace}", 'type': 'DirectoryOrCreate'}
+        })
+        # The pod's own copy of its package set, filled by the init container
+        volumes.append({'name': 'sdk', 'emptyDir': {}})
+    return volumes
+
+def get_sdk_mount():
+    """Get the read-only mount of the pod's copy of its SDK package set"""
+    return {
+        'name': 'sdk',
+        'mountPath': '/sdk',
+        'readOnly': True
+    }
@@ -0,0 +1,424 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import math
+import time
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from . import clients
+from .artifacts import get_artifact_cache
+from .metrics import WARM_POOL_AVAILABLE, WARM_POOL_CLAIMS, WARM_POOL_CLAIM_SECONDS
+from .podcache import MANAGED_SELECTOR, POOL_LABEL, POOL_STATE_LABEL, get_pod_cache
+from .template import get_pod_template, template_key
+from .workqueue import PRIORITY_REFILL, get_work_queue
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock time of the last use of a pool, on its ConfigMap, so other
+# replicas and later processes do not expire a pool that is still used
+POOL_USED_ANNOTATION = 'agents.example.com/last-used'
+
+_pool = None
+_task = None
+
+def warm_start_enabled(spec):
+    """Whether an AgentType opted into claiming pre-warmed pods"""
+    return bool(spec.get('agent', {}).get('warmStart'))
+
+def pool_key(namespace, spec):
+    """Pool identity: pods are interchangeable when namespace, template and runtime match"""
+    runtime = spec.get('agent', {}).get('environment', {}).get('sdk', {}).get('runtime')
+    key = template_key(spec)
+    if key[4] is None:
+        # Same key as before pods could have a tool proxy, so existing standby pods are still claimed
+        key = key[:4]
+    encoded = json.dumps([namespace, key, runtime], separators=(',', ':')).encode()
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+def _pod_ready(pod):
+    for condition in (pod.get('status') or {}).get('conditions') or []:
+        if condition.get('type') == 'Ready':
+            return condition.get('status') == 'True'
+    return False
+
+def pool_object_name(key):
+    return f"agent-pool-{key}"
+
+def standby_selector(key=None):
+    """Label selector of the standby pods of one pool, or of every pool"""
+    selector = f"{MANAGED_SELECTOR},{POOL_STATE_LABEL}=standby"
+    return f"{selector},{POOL_LABEL}={key}" if key else selector
+
+def build_pool_configmap(key, namespace, used):
+    """The object owning a pool's standby pods; deleting it garbage-collects them"""
+    return {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {
+            'name': pool_object_name(key),
+            'namespace': namespace,
+            'labels': {'managed-by': 'agent-operator', POOL_LABEL: key},
+            'annotations': {POOL_USED_ANNOTATION: str(int(used))}
+        }
+    }
+
+def build_standby_pod(key, namespace, spec, owner_ref):
+    """Render a standby pod owned by its pool; claiming it only rewrites metadata"""
+    pod = get_pod_template().render('standby', namespace, spec, None)
+    pod['metadata'] = {
+        'generateName': f"agent-pool-{key[:8]}-",
+        'namespace': namespace,
+        'labels': {
+            'managed-by': 'agent-operator',
+            POOL_LABEL: key,
+            POOL_STATE_LABEL: 'standby'
+        },
+        'ownerReferences': [owner_ref]
+    }
+    return pod
+
+def claim_patch(pod, name, owner_ref):
+    """Merge patch that hands a standby pod to an AgentType
+
+    The resourceVersion makes the patch conditional, so two claims racing
+    for the same pod cannot both succeed.
+    """
+    return {
+        'metadata': {
+            'resourceVersion': pod['metadata']['resourceVersion'],
+            'labels': {'app': name, POOL_STATE_LABEL: 'claimed'},
+            'ownerReferences': [owner_ref]
+        }
+    }
+
+def _log_refill(key, future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Refilling warm pool %s failed: %s", key, future.exception())
+
+class WarmPool:
+    """Pre-started pods that AgentTypes claim instead of cold-starting
+
+    Standby pods are keyed by `pool_key` and found through the pod cache, so
+    a claim costs a single conditional PATCH. Pools are refilled in the
+    background through the work queue at the lowest priority. Each pool has
+    a ConfigMap owning its standby pods; a pool no AgentType used for
+    `idle_ttl` seconds is dropped together with its pods.
+    """
+
+    def __init__(self, size=1, refill_interval=30, idle_ttl=1800):
+        self.size = size
+        self.refill_interval = refill_interval
+        self.idle_ttl = idle_ttl
+        self.pools = {}
+        self.stats = {'hits': 0, 'misses': 0, 'conflicts': 0, 'created': 0, 'expired': 0}
+        self._claimed = set()
+        self._inflight = {}
+        self._starting = {}
+        self._used = {}
+        self._recorded = {}
+        self._owners = {}
+        self._seen = {}
+
+    def register(self, namespace, spec):
+        """Start keeping a pool for this spec, or mark it as still used; returns its key"""
+        key = pool_key(namespace, spec)
+        self.pools.setdefault(key, (namespace, spec))
+        self._used[key] = time.monotonic()
+        return key
+
+    def standby(self, key):
+        """Unclaimed standby pods of a pool, ready ones first"""
+        cache = get_pod_cache()
+        if cache is None:
+            return []
+        pods = cache.standby_pods(key)
+        names = {pod['metadata']['name'] for pod in pods}
+        # Claimed pods stay in the index until their watch event arrives
+        self._claimed &= names
+        pods = [pod for pod in pods if pod['metadata']['name'] not in self._claimed]
+        return sorted(pods, key=lambda pod: not _pod_ready(pod))
+
+    def _still_starting(self, key, namespace):
+        """Standby pods created by this process that the cache has not seen yet"""
+        cache = get_pod_cache()
+        starting = self._starting.get(key, set())
+        if cache is not None:
+            starting = {name for name in starting if cache.get_pod(namespace, name) is None}
+            self._starting[key] = starting
+        return len(starting)
+
+    def hit_rate(self):
+        claims = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / claims if claims else 0.0
+
+    async def claim(self, name, namespace, spec, owner_ref):
+        """Claim a standby pod for an AgentType; returns (pod or None, seconds taken)"""
+        key = self.register(namespace, spec)
+        started = time.monotonic()
+        api = await clients.get_core_api()
+
+        pod = None
+        for candidate in self.standby(key):
+            pod_name = candidate['metadata']['name']
+            self._claimed.add(pod_name)
+            try:
+                pod = await clients.call_json(
+                    api.patch_namespaced_pod,
+                    name=pod_name,
+                    namespace=namespace,
+                    body=claim_patch(candidate, name, owner_ref),
+                    _content_type='application/merge-patch+json'
+                )
+                break
+            except ApiException as e:
+                if e.status not in (404, 409):
+                    self._claimed.discard(pod_name)
+                    raise
+                # Someone else claimed or deleted it first; try the next one
+                self.stats['conflicts'] += 1
+
+        elapsed = time.monotonic() - started
+        if pod is None:
+            self.stats['misses'] += 1
+            WARM_POOL_CLAIMS.labels('miss').inc()
+        else:
+            self.stats['hits'] += 1
+            WARM_POOL_CLAIMS.labels('hit').inc()
+            WARM_POOL_CLAIM_SECONDS.observe(elapsed)
+        self.schedule_refill(key)
+        return pod, elapsed
+
+    def schedule_refill(self, key):
+        """Queue a background refill of one pool"""
+        future = get_work_queue().submit(f"pool/{key}", self.pools[key][0], PRIORITY_REFILL, lambda: self.refill(key))
+        future.add_done_callback(functools.partial(_log_refill, key))
+        return future
+
+    async def refill(self, key):
+        """Create standby pods until the pool is back at its target size"""
+        if key not in self.pools:
+            # Expired while the refill was queued
+            return 0
+        namespace, spec = self.pools[key]
+        available = len(self.standby(key))
+        WARM_POOL_AVAILABLE.labels(key).set(available)
+        missing = self.size - available - self._inflight.get(key, 0) - self._still_starting(key, namespace)
+        if missing <= 0:
+            return 0
+
+        api = await clients.get_core_api()
+        await get_artifact_cache().ensure(namespace, spec)
+        owner_ref = await self._owner(api, key, namespace)
+        self._inflight[key] = self._inflight.get(key, 0) + missing
+        try:
+            results = await asyncio.gather(
+                *(clients.call_json(api.create_namespaced_pod, namespace=namespace, body=build_standby_pod(key, namespace, spec, owner_ref))
+                  for _ in range(missing)),
+                return_exceptions=True
+            )
+        finally:
+            self._inflight[key] -= missing
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        created = [result['metadata']['name'] for result in results if not isinstance(result, Exception)]
+        self._starting.setdefault(key, set()).update(created)
+        self.stats['created'] += len(created)
+        if errors:
+            raise errors[0]
+        return len(results)
+
+    def _wall_clock(self, key):
+        return time.time() - (time.monotonic() - self._used[key])
+
+    async def _owner(self, api, key, namespace):
+        """Owner reference to the pool's ConfigMap, creating it on first use"""
+        owner_ref = self._owners.get(key)
+        if owner_ref is not None:
+            return owner_ref
+        try:
+            configmap = await clients.call_json(api.create_namespaced_config_map, namespace=namespace,
+                                                body=build_pool_configmap(key, namespace, self._wall_clock(key)))
+            self._recorded[key] = self._used[key]
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            # Kept by an earlier process or another replica; `_record_use` updates it
+            configmap = await clients.call_json(api.read_namespaced_config_map, name=pool_object_name(key), namespace=namespace)
+        owner_ref = self._owners[key] = {
+            'apiVersion': 'v1',
+            'kind': 'ConfigMap',
+            'name': pool_object_name(key),
+            'uid': configmap['metadata']['uid']
+        }
+        return owner_ref
+
+    def _claimed_from(self, key, namespace):
+        """Whether pods claimed from the pool still exist, i.e. their AgentTypes do"""
+        cache = get_pod_cache()
+        for pod in cache.pods_in_namespace(namespace) if cache is not None else []:
+            labels = pod['metadata'].get('labels') or {}
+            if labels.get(POOL_LABEL) == key and labels.get(POOL_STATE_LABEL) == 'claimed':
+                return True
+        return False
+
+    async def _record_use(self, api, key, namespace):
+        """Write the last use of a pool to its ConfigMap, at most every quarter TTL"""
+        if key not in self._owners:
+            await self._owner(api, key, namespace)
+        if self._used[key] - self._recorded.get(key, -math.inf) < self.idle_ttl / 4:
+            return
+        patch = {'metadata': {'annotations': {POOL_USED_ANNOTATION: str(int(self._wall_clock(key)))}}}
+        try:
+            await clients.call_json(api.patch_namespaced_config_map, name=pool_object_name(key), namespace=namespace,
+                                    body=patch, _content_type='application/merge-patch+json')
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            # Deleted under us: the next refill creates it again
+            del self._owners[key]
+        self._recorded[key] = self._used[key]
+
+    async def _expire(self, api, key, namespace):
+        """Drop an idle pool here, and delete its pods unless it was used elsewhere since"""
+        self.pools.pop(key, None)
+        for state in (self._used, self._recorded, self._owners, self._starting, self._seen):
+            state.pop(key, None)
+        try:
+            configmap = await clients.call_json(api.read_namespaced_config_map, name=pool_object_name(key), namespace=namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            configmap = None
+        if configmap is not None:
+            used = int((configmap['metadata'].get('annotations') or {}).get(POOL_USED_ANNOTATION, 0))
+            if time.time() - used < self.idle_ttl:
+                return False
+        await clients.call_json(api.delete_collection_namespaced_pod, namespace=namespace, label_selector=standby_selector(key))
+        if configmap is not None:
+            await _delete_pool_object(api, key, namespace)
+        try:
+            WARM_POOL_AVAILABLE.remove(key)
+        except KeyError:
+            pass
+        self.stats['expired'] += 1
+        logger.info("Expired warm pool %s in %s after %ss without use", key, namespace, self.idle_ttl)
+        return True
+
+    async def expire(self):
+        """Drop pools no AgentType registered with or claimed from for `idle_ttl`
+
+        Pools with standby pods but unknown to this process, e.g. kept by an
+        earlier one, get the same TTL from when they are first seen here.
+        Returns the number of pools whose standby pods were deleted.
+        """
+        now = time.monotonic()
+        api = await clients.get_core_api()
+        idle = {}
+        for key, (namespace, _) in list(self.pools.items()):
+            if self._claimed_from(key, namespace):
+                self._used[key] = now
+            if now - self._used[key] < self.idle_ttl:
+                await self._record_use(api, key, namespace)
+            else:
+                idle[key] = namespace
+
+        cache = get_pod_cache()
+        unknown = {
+            key: cache.standby_pods(key)[0]['metadata']['namespace']
+            for key in (cache.standby_pools() if cache is not None else [])
+            if key not in self.pools
+        }
+        self._seen = {key: self._seen.get(key, now) for key in unknown}
+        idle.update((key, namespace) for key, namespace in unknown.items() if now - self._seen[key] >= self.idle_ttl)
+
+        expired = 0
+        for key, namespace in idle.items():
+            if await self._expire(api, key, namespace):
+                expired += 1
+            elif key in unknown:
+                # Used by another replica; look again after another TTL
+                self._seen[key] = now
+        return expired
+
+    async def run(self):
+        """Periodically expire idle pools and top up the others, e.g. after standby pods were evicted"""
+        cache = get_pod_cache()
+        if cache is not None:
+            await cache.synced.wait()
+        while True:
+            try:
+                await self.expire()
+            except ApiException as e:
+                logger.warning("Expiring idle warm pools failed: %s", e)
+            for key in list(self.pools):
+                self.schedule_refill(key)
+            await asyncio.sleep(self.refill_interval)
+
+async def _delete_pool_object(api, key, namespace):
+    try:
+        await clients.call_json(api.delete_namespaced_config_map, name=pool_object_name(key), namespace=namespace)
+    except ApiException as e:
+        if e.status != 404:
+            raise
+
+async def delete_standby_pods():
+    """Delete the standby pods and pool ConfigMaps left behind once warm pools are turned off
+
+    Standby pods are found through the pod cache; each namespace holding any
+    takes one deletecollection on the pool state label. Returns the number
+    of namespaces cleaned up.
+    """
+    cache = get_pod_cache()
+    if cache is None:
+        return 0
+    await cache.synced.wait()
+    pools = {}
+    for key in cache.standby_pools():
+        for pod in cache.standby_pods(key):
+            pools.setdefault(pod['metadata']['namespace'], set()).add(key)
+
+    api = await clients.get_core_api()
+    for namespace, keys in pools.items():
+        try:
+            await clients.call_json(api.delete_collection_namespaced_pod, namespace=namespace, label_selector=standby_selector())
+            for key in keys:
+                await _delete_pool_object(api, key, namespace)
+        except ApiException as e:
+            logger.warning("Deleting standby pods in %s failed: %s", namespace, e)
+    if pools:
+        logger.info("Warm pools are off; deleted standby pods in %d namespaces", len(pools))
+    return len(pools)
+
+def start_warm_pool(size=1, refill_interval=30, idle_ttl=1800):
+    """Create the process-wide warm pool and start its refill task
+
+    With `size` 0 warm starts are off: no pool is created, and the standby
+    pods of earlier runs are deleted in the background instead.
+    """
+    global _pool, _task
+
+    if not size:
+        _task = asyncio.create_task(delete_standby_pods())
+        return None
+    _pool = WarmPool(size=size, refill_interval=refill_interval, idle_ttl=idle_ttl)
+    _task = asyncio.create_task(_pool.run())
+    return _pool
+
+async def stop_warm_pool():
+    """Stop the warm pool task; standby pods are left for the next start, which deletes them if pools were turned off"""
+    global _pool, _task
+
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _pool = _task = None
+
+def get_warm_pool():
+    """Get the process-wide warm pool, or None if warm starts are disabled"""
+    return _pool
@@ -0,0 +1,270 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+import kopf
+
+from .metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: deletes and status fixes go ahead of new work
+PRIORITY_DELETE = 0
+PRIORITY_STATUS = 1
+PRIORITY_UPDATE = 2
+PRIORITY_CREATE = 3
+# Warm pool refills only use capacity that real work leaves over
+PRIORITY_REFILL = 4
+
+_queue = None
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `burst` stored"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available (0 if one is available now)"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+class _Item:
+    __slots__ = ('key', 'namespace', 'priority', 'seq', 'func', 'future', 'failures')
+
+    def __init__(self, key, namespace, priority, seq, func, future):
+        self.key = key
+        self.namespace = namespace
+        self.priority = priority
+        self.seq = seq
+        self.func = func
+        self.future = future
+        self.failures = 0
+
+class WorkQueue:
+    """Deduplicating, rate-limited priority queue between kopf events and API work
+
+    Items are keyed by object and priority, which stands for the kind of
+    work: submitting a key that is still queued at the same priority merges
+    into the queued item (newest work wins) and shares its result. Work of
+    another kind, e.g. a delete while a create is queued, is queued on its
+    own, so every caller gets the result of the work it submitted.
+    Like a controller work queue, a key never runs twice at once: while
+    one of its items is in flight, the others are parked and queued again
+    when it finishes, so a create cannot race a delete of the same object.
+    Each namespace has its own token bucket in addition to the global one,
+    so one tenant's burst cannot starve the others. Failed items are retried
+    with per-item exponential backoff; kopf.PermanentError is not retried.
+    """
+
+    def __init__(self, workers=16, global_rate=50.0, global_burst=100, namespace_rate=10.0,
+                 namespace_burst=20, backoff_base=0.5, backoff_max=60.0, max_retries=5):
+        self.workers = workers
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.namespace_rate = namespace_rate
+        self.namespace_burst = namespace_burst
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries
+        self._buckets = {}
+        self._queues = {}
+        self._items = {}
+        # Keys with an item in flight, and their items waiting for it to finish
+        self._processing = set()
+        self._parked = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'processed': 0, 'retries': 0, 'failed': 0}
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for item in self._items.values():
+            if not item.future.done():
+                item.future.set_exception(kopf.TemporaryError("Operator is shutting down", delay=5))
+        self._items.clear()
+        self._processing.clear()
+        self._parked.clear()
+
+    def _bucket(self, namespace):
+        bucket = self._buckets.get(namespace)
+        if bucket is None:
+            bucket = self._buckets[namespace] = TokenBucket(self.namespace_rate, self.namespace_burst)
+        return bucket
+
+    def _push(self, item):
+        heapq.heappush(self._queues.setdefault(item.namespace, []), (item.priority, item.seq, item.key))
+        QUEUE_DEPTH.labels('work').set(len(self._items))
+        self._wakeup.set()
+
+    def submit(self, key, namespace, priority, func):
+        """Queue `func` (a coroutine function) for `key`; returns an awaitable of its result"""
+        self.stats['submitted'] += 1
+        ident = (key, priority)
+        item = self._items.get(ident)
+        if item is not None:
+            self.stats['deduplicated'] += 1
+            item.func = func
+            return item.future
+
+        future = asyncio.get_running_loop().create_future()
+        item = _Item(ident, namespace, priority, next(self._seq), func, future)
+        self._items[ident] = item
+        if key in self._processing:
+            self._parked.setdefault(key, []).append(item)
+        else:
+            self._push(item)
+        return future
+
+    def _head(self, namespace):
+        """Current head of a namespace queue, dropping stale entries and parking those of keys in flight"""
+        heap = self._queues[namespace]
+        while heap:
+            priority, seq, key = heap[0]
+            item = self._items.get(key)
+            if item is not None and item.seq == seq and item.namespace == namespace:
+                if key[0] not in self._processing:
+                    return heap[0]
+                self._parked.setdefault(key[0], []).append(item)
+            heapq.heappop(heap)
+        return None
+
+    def _done(self, item):
+        """Release the item's key and queue the work parked behind it"""
+        self._processing.discard(item.key[0])
+        for parked in self._parked.pop(item.key[0], ()):
+            if self._items.get(parked.key) is parked:
+                self._push(parked)
+
+    async def _next(self):
+        """Wait for the best item whose namespace and the global bucket have tokens"""
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            best = None
+            wait = None
+            for namespace in list(self._queues):
+                head = self._head(namespace)
+                if head is None:
+                    del self._queues[namespace]
+                    continue
+                bucket_wait = self._bucket(namespace).wait_time(now)
+                if bucket_wait > 0:
+                    wait = bucket_wait if wait is None else min(wait, bucket_wait)
+                elif best is None or head < best[0]:
+                    best = (head, namespace)
+
+            if best is not None:
+                global_wait = self.global_bucket.wait_time(now)
+                if global_wait > 0:
+                    await asyncio.sleep(global_wait)
+                    continue
+                (_, _, key), namespace = best
+                heapq.heappop(self._queues[namespace])
+                self.global_bucket.consume()
+                self._bucket(namespace).consume()
+                item = self._items.pop(key)
+                self._processing.add(key[0])
+                QUEUE_DEPTH.labels('work').set(len(self._items))
+                return item
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _requeue_later(self, item, delay):
+        def requeue():
+            existing = self._items.get(item.key)
+            if existing is not None:
+                # Newer work for the key arrived meanwhile; it supersedes the retry
+                existing.future.add_done_callback(lambda f: _copy_result(f, item.future))
+                return
+            item.seq = next(self._seq)
+            self._items[item.key] = item
+            self._push(item)
+        asyncio.get_running_loop().call_later(delay, requeue)
+
+    async def _worker(self):
+        while True:
+            item = await self._next()
+            try:
+                await self._run(item)
+            finally:
+                self._done(item)
+
+    async def _run(self, item):
+        try:
+            result = await item.func()
+        except kopf.PermanentError as e:
+            self.stats['failed'] += 1
+            item.future.set_exception(e)
+        except asyncio.CancelledError:
+            item.future.cancel()
+            raise
+        except Exception as e:
+            item.failures += 1
+            if item.failures > self.max_retries:
+                self.stats['failed'] += 1
+                item.future.set_exception(e)
+                return
+            self.stats['retries'] += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (item.failures - 1))
+            logger.warning("Work item %s failed (%s); retrying in %ss", item.key[0], e, delay)
+            self._requeue_later(item, delay)
+        else:
+            self.stats['processed'] += 1
+            item.future.set_result(result)
+
+def _copy_result(source, target):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+def init_work_queue(**kwargs):
+    """Create and start the process-wide work queue"""
+    global _queue
+
+    _queue = WorkQueue(**kwargs)
+    _queue.start()
+    return _queue
+
+def get_work_queue():
+    """Get the process-wide work queue, starting a default one on first use"""
+    if _queue is None:
+        init_work_queue()
+    return _queue
+
+async def close_work_queue():
+    """Stop the process-wide work queue"""
+    global _queue
+
+    if _queue is not None:
+        await _queue.stop()
+    _queue = None
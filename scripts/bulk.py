@@ -0,0 +1,20 @@
+"""Bulk-create or tear down AgentTypes: python scripts/bulk.py -f agents.yaml
+
+The operator sources live in a directory called `operator`, which collides
+with the standard library module of the same name, so neither
+`python -m operator.bulk` nor running operator/bulk.py directly works.
+This loads the directory as the `agent_operator` package and runs its CLI.
+"""
+import pathlib
+import sys
+import types
+
+OPERATOR_DIR = pathlib.Path(__file__).resolve().parents[1] / 'operator'
+
+if __name__ == "__main__":
+    package = types.ModuleType('agent_operator')
+    package.__path__ = [str(OPERATOR_DIR)]
+    sys.modules['agent_operator'] = package
+
+    from agent_operator.bulk import main
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Memory per tracked AgentType: compact registry records vs. plain dicts
+
+    python tests/benchmarks/bench_memory.py --agents 50000 --output memory.json
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+import uuid
+
+from common import load_operator, write_results
+
+load_operator()
+
+from agent_operator.utils.registry import AgentRegistry  # noqa: E402
+from agent_operator.utils.status import now  # noqa: E402
+
+PHASES = ('Pending', 'Running', 'Ready')
+
+def make_events(count, namespaces, images):
+    """Pod state as the operator sees it: every string freshly decoded from JSON, as from the API"""
+    rng = random.Random(0)
+    events = []
+    for i in range(count):
+        events.append(json.dumps({
+            'namespace': f"team-{i % namespaces}",
+            'name': f"agent-{i}",
+            'image': f"registry.local/agent-{i % images}:1.0",
+            'pod': {'metadata': {'name': f"agent-{i}-pod", 'uid': str(uuid.UUID(int=rng.getrandbits(128)))}},
+            'specHash': f"{rng.getrandbits(64):016x}",
+            'phase': rng.choice(PHASES)
+        }))
+    return events
+
+def as_dicts(events):
+    """The straightforward model: one dict per agent under a (namespace, name) key"""
+    agents = {}
+    for line in events:
+        event = json.loads(line)
+        agents[(event['namespace'], event['name'])] = {
+            'podName': event['pod']['metadata']['name'],
+            'podUid': event['pod']['metadata']['uid'],
+            'specHash': event['specHash'],
+            'image': event['image'],
+            'phase': event['phase'],
+            'lastTransitionTime': now()
+        }
+    return agents
+
+def as_registry(events):
+    registry = AgentRegistry()
+    for line in events:
+        event = json.loads(line)
+        registry.track(event['namespace'], event['name'], event['pod'], image=event['image'], spec_hash=event['specHash'])
+        registry.set_phase(event['namespace'], event['name'], event['phase'])
+    return registry
+
+def measure(build, events):
+    """Bytes retained by the model after building it, per agent"""
+    gc.collect()
+    tracemalloc.start()
+    model = build(events)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(model)
+    return {'agents': count, 'retained_bytes': current, 'bytes_per_agent': current / count, 'peak_bytes': peak}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', type=int, default=50000)
+    parser.add_argument('--namespaces', type=int, default=50)
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    events = make_events(args.agents, args.namespaces, args.images)
+    results = {
+        'agents': args.agents,
+        'dict': measure(as_dicts, events),
+        'registry': measure(as_registry, events)
+    }
+    results['ratio'] = results['dict']['bytes_per_agent'] / results['registry']['bytes_per_agent']
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Operator load test against the in-process fake apiserver
+
+Runs the create_agent handler (and create_agent_pod behind it) for N
+AgentTypes and reports creates/sec, handler p50/p99, peak RSS and API
+calls per AgentType. Every scale runs in its own subprocess so peak RSS
+and module state are not shared between runs.
+
+    python tests/benchmarks/bench_operator.py --scales 100 1000 10000 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import load_operator, summarize, write_results
+from fake_apiserver import FakeApiServer
+
+GROUP = 'agents.example.com'
+
+def make_agent(i, namespaces):
+    return {
+        'apiVersion': f"{GROUP}/v1",
+        'kind': 'AgentType',
+        'metadata': {'name': f"agent-{i}", 'namespace': f"tenant-{i % namespaces}"},
+        'spec': {'agent': {'image': f"registry.local/agent-{i % 20}:1.0"}}
+    }
+
+def configure_environment(server, args):
+    """Point the operator at the fake apiserver; must run before importing it"""
+    kubeconfig = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(server.kubeconfig(), kubeconfig)
+    kubeconfig.close()
+    os.environ['KUBECONFIG'] = kubeconfig.name
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['WORKQUEUE_QPS'] = str(args.qps)
+    os.environ['WORKQUEUE_BURST'] = str(int(args.qps))
+    os.environ['WORKQUEUE_NAMESPACE_QPS'] = str(args.qps)
+    os.environ['WORKQUEUE_NAMESPACE_BURST'] = str(int(args.qps))
+    os.environ['STATUS_PATCH_WINDOW'] = str(args.status_window)
+    return kubeconfig.name
+
+async def run_handlers(main, server, agents):
+    logger = logging.getLogger('bench.handler')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    await main.init_api_clients(logger=logger)
+    from agent_operator.utils.podcache import get_pod_cache
+    await get_pod_cache().synced.wait()
+    server.reset_counters()
+
+    durations = []
+    errors = 0
+
+    async def handle(agent):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await main.create_agent(
+                spec=agent['spec'],
+                name=agent['metadata']['name'],
+                namespace=agent['metadata']['namespace'],
+                logger=logger,
+                body=agent,
+                retry=0
+            )
+        except Exception:
+            errors += 1
+        durations.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(agent) for agent in agents))
+    elapsed = time.perf_counter() - started
+    await main.close_api_clients(logger=logger)
+    return durations, errors, elapsed
+
+def run_single(args):
+    """Run one scale in this process and print its results as JSON"""
+    faults = {409: args.fail_409, 429: args.fail_429, 500: args.fail_500}
+    server = FakeApiServer(latency=args.latency, jitter=args.jitter, faults={k: v for k, v in faults.items() if v}).start()
+    kubeconfig = configure_environment(server, args)
+    try:
+        load_operator()
+        from agent_operator import main
+
+        agents = [
+            json.loads(json.dumps(server.put('agenttypes', make_agent(i, args.namespaces), group=GROUP)))
+            for i in range(args.single)
+        ]
+
+        durations, errors, elapsed = asyncio.run(run_handlers(main, server, agents))
+        calls = {f"{verb} {plural}": count for (verb, plural), count in sorted(server.calls.items())}
+        summary = summarize(durations)
+        result = {
+            'agents': args.single,
+            'errors': errors,
+            'elapsed_seconds': elapsed,
+            'creates_per_second': args.single / elapsed,
+            'handler_p50_ms': summary['p50'] * 1000,
+            'handler_p99_ms': summary['p99'] * 1000,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'api_calls_per_agent': server.total_calls() / args.single,
+            'api_calls': calls,
+            'pods_created': len(server.list('pods'))
+        }
+    finally:
+        server.stop()
+        os.unlink(kubeconfig)
+    print(json.dumps(result))
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--namespaces', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.002, help="Injected apiserver latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.001)
+    parser.add_argument('--fail-409', type=float, default=0.0, help="Probability of an injected 409 per write")
+    parser.add_argument('--fail-429', type=float, default=0.0)
+    parser.add_argument('--fail-500', type=float, default=0.0)
+    parser.add_argument('--qps', type=float, default=100000, help="Work queue rate limit (global and per namespace)")
+    parser.add_argument('--status-window', type=float, default=0.2)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args)
+        return
+
+    runs = []
+    for scale in args.scales:
+        command = [sys.executable, __file__, '--single', str(scale)] + [
+            f"--{name.replace('_', '-')}={value}" for name, value in vars(args).items()
+            if name not in ('scales', 'output', 'single')
+        ]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    write_results({
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'single')},
+        'runs': runs
+    }, args.output)
+
+if __name__ == '__main__':
+    main()
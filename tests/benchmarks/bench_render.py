@@ -0,0 +1,75 @@
+"""Pod rendering micro-benchmark: builder functions vs. the memoized template
+
+    python tests/benchmarks/bench_render.py --agents 10000 --output render.json
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+from common import load_operator, write_results
+
+load_operator()
+
+from agent_operator.utils.template import PodTemplate, build_pod  # noqa: E402
+
+def make_specs(count, images, env_sets):
+    """AgentType specs sharing a realistic number of images and env sets"""
+    specs = []
+    for i in range(count):
+        spec = {
+            'agent': {
+                'image': f"registry.local/agent-{i % images}:1.0",
+                'environment': {
+                    'variables': [{'name': f"VAR_{j}", 'value': f"value-{i % env_sets}"} for j in range(4)]
+                }
+            }
+        }
+        if i % 2:
+            spec['sidecar'] = {'name': 'tool-manager', 'image': 'busybox:latest'}
+        specs.append(spec)
+    return specs
+
+def measure(render, specs):
+    """Time and allocations of rendering every spec, keeping the results alive"""
+    owner = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'x', 'uid': 'uid'}
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    started = time.perf_counter()
+    pods = [render(f"agent-{i}", 'default', spec, owner) for i, spec in enumerate(specs)]
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sys.getallocatedblocks() - blocks_before
+    count = len(pods)
+    return {
+        'renders': count,
+        'total_seconds': elapsed,
+        'us_per_render': elapsed / count * 1e6,
+        'allocated_blocks_per_render': blocks / count,
+        'retained_bytes_per_render': current / count
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', type=int, default=10000)
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--env-sets', type=int, default=10)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    specs = make_specs(args.agents, args.images, args.env_sets)
+    template = PodTemplate()
+    results = {
+        'agents': args.agents,
+        'builder': measure(build_pod, specs),
+        'template': measure(template.render, specs),
+        'template_cache': template.cache_info()._asdict()
+    }
+    results['speedup'] = results['builder']['total_seconds'] / results['template']['total_seconds']
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Operator cold-start benchmark against the in-process fake apiserver
+
+Starts a fresh interpreter per run that imports the operator, runs its
+startup hooks and handles one AgentType create event. Reports the time
+from process exec to the first handled event, broken down by startup
+phase, as p50/p99 over the runs.
+
+    python tests/benchmarks/bench_startup.py --runs 10 --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import load_operator, summarize, write_results
+from fake_apiserver import FakeApiServer
+
+GROUP = 'agents.example.com'
+AGENT = {
+    'apiVersion': f"{GROUP}/v1",
+    'kind': 'AgentType',
+    'metadata': {'name': 'startup-agent', 'namespace': 'default', 'uid': 'startup-uid'},
+    'spec': {'agent': {'image': 'registry.local/agent:1.0'}}
+}
+
+async def first_event(main, kopf):
+    logger = logging.getLogger('bench.startup')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    await main.configure_operator(settings=kopf.OperatorSettings())
+    await main.init_api_clients(logger=logger)
+    await main.create_agent(
+        spec=AGENT['spec'],
+        name=AGENT['metadata']['name'],
+        namespace=AGENT['metadata']['namespace'],
+        logger=logger,
+        body=AGENT,
+        retry=0
+    )
+    await main.close_api_clients(logger=logger)
+
+def run_single():
+    """Cold-start the operator in this process and print its startup phases as JSON"""
+    load_operator()
+    from agent_operator import main
+    from agent_operator.utils.startup import timer
+    import kopf
+
+    asyncio.run(first_event(main, kopf))
+    print(json.dumps({'phases': timer.phases, 'first_event': timer.first_event}))
+
+def measure(server, runs):
+    kubeconfig = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(server.kubeconfig(), kubeconfig)
+    kubeconfig.close()
+    env = dict(os.environ, KUBECONFIG=kubeconfig.name, METRICS_PORT='0')
+
+    results = []
+    try:
+        for _ in range(runs):
+            # The pod from the previous run would make the handler a no-op
+            for pod in server.list('pods'):
+                server.call(server._store, 'pods', '', pod, 'DELETED')
+            started = time.perf_counter()
+            output = subprocess.check_output([sys.executable, __file__, '--single'], env=env, text=True)
+            result = json.loads(output.strip().splitlines()[-1])
+            result['wall'] = time.perf_counter() - started
+            results.append(result)
+    finally:
+        os.unlink(kubeconfig.name)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.002, help="Injected apiserver latency in seconds")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single()
+        return
+
+    server = FakeApiServer(latency=args.latency).start()
+    try:
+        server.put('agenttypes', AGENT, group=GROUP)
+        results = measure(server, args.runs)
+    finally:
+        server.stop()
+
+    phases = {}
+    for result in results:
+        for phase, seconds in result['phases'].items():
+            phases.setdefault(phase, []).append(seconds)
+    to_ms = lambda summary: {key: value * 1000 for key, value in summary.items()}
+    write_results({
+        'runs': args.runs,
+        'exec_to_first_event_ms': to_ms(summarize([result['first_event'] for result in results])),
+        'process_wall_ms': to_ms(summarize([result['wall'] for result in results])),
+        'phases_ms': {phase: to_ms(summarize(values)) for phase, values in phases.items()},
+        'config': vars(args)
+    }, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Spec validation micro-benchmark: compiled schema checks, with and without the result cache
+
+    python tests/benchmarks/bench_validate.py --agents 10000 --output validate.json
+"""
+import argparse
+import pathlib
+import time
+
+from common import load_operator, write_results
+
+load_operator()
+
+from agent_operator.utils.schema import InvalidSpec, SpecValidator, crd_spec_schema, load_crd  # noqa: E402
+
+CRD_PATH = pathlib.Path(__file__).resolve().parents[2] / 'base' / 'crd' / 'agenttype.yaml'
+
+def make_specs(count, distinct, invalid_every):
+    """AgentType specs, `distinct` of them different; every `invalid_every`-th lacks its image"""
+    specs = []
+    for i in range(count):
+        spec = {
+            'agent': {
+                'image': f"registry.local/agent-{i % distinct}:1.0",
+                'environment': {
+                    'variables': [{'name': f"VAR_{j}", 'value': f"value-{i % distinct}"} for j in range(4)],
+                    'sdk': {'runtime': 'python', 'packages': ['requests']}
+                }
+            },
+            'toolProxy': {'upstream': 'http://tools:8000', 'cache': {'ttlSeconds': 60}}
+        }
+        if i % 2:
+            spec['sidecar'] = {'image': 'busybox:latest', 'ports': [{'containerPort': 8080}]}
+        if invalid_every and i % invalid_every == 0:
+            del spec['agent']['image']
+        specs.append(spec)
+    return specs
+
+def measure(validator, specs):
+    """Time of validating every spec, and how many were rejected"""
+    invalid = 0
+    started = time.perf_counter()
+    for spec in specs:
+        try:
+            validator.validate(spec)
+        except InvalidSpec:
+            invalid += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'specs': len(specs),
+        'invalid': invalid,
+        'total_seconds': elapsed,
+        'us_per_spec': elapsed / len(specs) * 1e6,
+        'specs_per_second': len(specs) / elapsed,
+        'cache': dict(validator.stats)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', type=int, default=10000)
+    parser.add_argument('--distinct', type=int, default=100, help="Different specs among the agents")
+    parser.add_argument('--invalid-every', type=int, default=10, help="Every n-th spec is invalid, 0 for none")
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    crd = load_crd(CRD_PATH)
+    compile_times = []
+    for _ in range(5):
+        started = time.perf_counter()
+        SpecValidator(crd_spec_schema(crd))
+        compile_times.append(time.perf_counter() - started)
+
+    specs = make_specs(args.agents, args.distinct, args.invalid_every)
+    invalid = [spec for spec in specs if 'image' not in spec['agent']]
+    results = {
+        'agents': args.agents,
+        'distinct': args.distinct,
+        # The best of a few runs; the first pays for one-time interpreter warm-up
+        'compile_seconds': min(compile_times),
+        # cache_size=0 evicts every result at once, so each spec is checked
+        'uncached': measure(SpecValidator(crd_spec_schema(crd), cache_size=0), specs),
+        'cached': measure(SpecValidator(crd_spec_schema(crd)), specs),
+        'invalid_uncached': measure(SpecValidator(crd_spec_schema(crd), cache_size=0), invalid) if invalid else None
+    }
+    results['cache_speedup'] = results['uncached']['total_seconds'] / results['cached']['total_seconds']
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import json
+import pathlib
+import statistics
+import sys
+import types
+
+OPERATOR_DIR = pathlib.Path(__file__).resolve().parents[2] / 'operator'
+
+def load_operator():
+    """Make the operator sources importable as `agent_operator`
+
+    The sources live in a directory called `operator`, which collides with
+    the standard library module of the same name.
+    """
+    if 'agent_operator' not in sys.modules:
+        package = types.ModuleType('agent_operator')
+        package.__path__ = [str(OPERATOR_DIR)]
+        sys.modules['agent_operator'] = package
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(values):
+    """p50/p99/mean of a list of durations"""
+    return {
+        'p50': percentile(values, 50),
+        'p99': percentile(values, 99),
+        'mean': statistics.fmean(values) if values else None
+    }
+
+def write_results(results, output=None):
+    """Print results and optionally write them as JSON"""
+    text = json.dumps(results, indent=2, sort_keys=True)
+    print(text)
+    if output:
+        pathlib.Path(output).write_text(text + '\n')
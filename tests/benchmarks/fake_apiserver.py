@@ -0,0 +1,346 @@
+"""In-process stand-in for the Kubernetes API used by benchmarks and tests
+
+Serves a generic object store over the real REST paths (core and custom
+resources, namespaced and cluster-scoped) including LIST, WATCH with
+bookmarks, create/get/patch/replace/delete, deletecollection and the
+status subresource. Latency and error responses (409/429/500) can be
+injected, API calls are counted per verb and resource, and pods can be
+marked Ready after a delay to stand in for the kubelet.
+"""
+import asyncio
+import copy
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+def _labels_match(obj, selector):
+    if not selector:
+        return True
+    labels = obj['metadata'].get('labels') or {}
+    for term in re.split(r',(?![^(]*\))', selector):
+        term = term.strip()
+        match = re.match(r'^(\S+)\s+(in|notin)\s+\((.*)\)$', term)
+        if match:
+            key, operator, values = match.groups()
+            if (labels.get(key) in {value.strip() for value in values.split(',')}) != (operator == 'in'):
+                return False
+        elif '!=' in term:
+            key, value = term.split('!=', 1)
+            if labels.get(key) == value:
+                return False
+        elif '=' in term:
+            key, value = term.replace('==', '=').split('=', 1)
+            if labels.get(key) != value:
+                return False
+        elif term.startswith('!'):
+            if term[1:] in labels:
+                return False
+        elif term not in labels:
+            return False
+    return True
+
+def _merge(target, patch):
+    """JSON merge patch (RFC 7386)"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = _merge(result.get(key), value)
+    return result
+
+def _status(code, reason, message):
+    return web.json_response(
+        {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'code': code, 'reason': reason, 'message': message},
+        status=code
+    )
+
+class FakeApiServer:
+    """Threaded aiohttp app emulating the apiserver endpoints the operator uses"""
+
+    def __init__(self, latency=0.0, jitter=0.0, faults=None, pod_ready_delay=None, bookmark_interval=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        # {status_code: probability}, applied to mutating requests
+        self.faults = dict(faults or {})
+        self.pod_ready_delay = pod_ready_delay
+        self.bookmark_interval = bookmark_interval
+        self.objects = {}
+        self.calls = {}
+        self.bytes_sent = 0
+        self._rv = itertools.count(1)
+        self._history = []
+        self._watchers = []
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self.port = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    # -- lifecycle --------------------------------------------------------
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    async def _start(self):
+        app = web.Application(client_max_size=2**24)
+        app.router.add_route('*', '/{path:.*}', self._dispatch)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        async def shutdown():
+            for watcher in list(self._watchers):
+                watcher[3].put_nowait(None)
+            await self._runner.cleanup()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+
+    def call(self, func, *args):
+        """Run a function on the server loop and wait for its result"""
+        async def run():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(run(), self._loop).result(10)
+
+    def kubeconfig(self):
+        """A kubeconfig document pointing at this server"""
+        return {
+            'apiVersion': 'v1',
+            'kind': 'Config',
+            'clusters': [{'name': 'fake', 'cluster': {'server': self.url}}],
+            'users': [{'name': 'fake', 'user': {'token': 'fake'}}],
+            'contexts': [{'name': 'fake', 'context': {'cluster': 'fake', 'user': 'fake'}}],
+            'current-context': 'fake'
+        }
+
+    # -- store ------------------------------------------------------------
+
+    def put(self, plural, obj, group=''):
+        """Insert an object directly, bypassing the API"""
+        return self.call(self._store, plural, group, obj, 'ADDED')
+
+    def list(self, plural, namespace=None, group=''):
+        return [copy.deepcopy(obj) for (g, p, ns, _), obj in list(self.objects.items())
+                if g == group and p == plural and (namespace is None or ns == namespace)]
+
+    def total_calls(self, verbs=None):
+        return sum(count for (verb, _), count in self.calls.items() if verbs is None or verb in verbs)
+
+    def reset_counters(self):
+        self.calls.clear()
+        self.bytes_sent = 0
+
+    def _store(self, plural, group, obj, event_type):
+        metadata = obj['metadata']
+        metadata['resourceVersion'] = str(next(self._rv))
+        metadata.setdefault('uid', str(uuid.uuid4()))
+        metadata.setdefault('creationTimestamp', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        key = (group, plural, metadata.get('namespace'), metadata['name'])
+        if event_type == 'DELETED':
+            self.objects.pop(key, None)
+        else:
+            self.objects[key] = obj
+        self._history.append((int(metadata['resourceVersion']), group, plural, event_type, copy.deepcopy(obj)))
+        for watcher in self._watchers:
+            w_group, w_plural, w_namespace, queue, selector = watcher
+            if w_group == group and w_plural == plural and (w_namespace is None or w_namespace == metadata.get('namespace')):
+                if _labels_match(obj, selector):
+                    queue.put_nowait({'type': event_type, 'object': copy.deepcopy(obj)})
+        if plural == 'pods' and event_type == 'ADDED' and self.pod_ready_delay is not None:
+            self._loop.call_later(self.pod_ready_delay, self._make_ready, key)
+        return obj
+
+    def _make_ready(self, key):
+        pod = self.objects.get(key)
+        if pod is None:
+            return
+        pod = copy.deepcopy(pod)
+        pod['status'] = {'phase': 'Running', 'conditions': [{'type': 'Ready', 'status': 'True'}]}
+        self._store(key[1], key[0], pod, 'MODIFIED')
+
+    # -- HTTP -------------------------------------------------------------
+
+    def _parse(self, path):
+        """Split a REST path into (group, plural, namespace, name, subresource)"""
+        parts = [part for part in path.split('/') if part]
+        if parts[:2] == ['api', 'v1']:
+            group, rest = '', parts[2:]
+        elif parts[:1] == ['apis'] and len(parts) >= 3:
+            group, rest = parts[1], parts[3:]
+        else:
+            return None
+        namespace = None
+        if len(rest) >= 3 and rest[0] == 'namespaces':
+            namespace, rest = rest[1], rest[2:]
+        if not rest:
+            return None
+        plural = rest[0]
+        name = rest[1] if len(rest) > 1 else None
+        subresource = rest[2] if len(rest) > 2 else None
+        return group, plural, namespace, name, subresource
+
+    def _json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.bytes_sent += len(body)
+        return web.Response(body=body, status=status, content_type='application/json')
+
+    async def _dispatch(self, request):
+        if request.path in ('/version', '/version/'):
+            return self._json({'major': '1', 'minor': '30', 'gitVersion': 'v1.30.0'})
+        parsed = self._parse(request.path)
+        if parsed is None:
+            return _status(404, 'NotFound', f"unknown path {request.path}")
+        group, plural, namespace, name, subresource = parsed
+        query = request.query
+        watching = query.get('watch', '').lower() in ('true', '1')
+        verb = {
+            'GET': 'watch' if watching else ('get' if name else 'list'),
+            'POST': 'create',
+            'PUT': 'update',
+            'PATCH': 'patch',
+            'DELETE': 'delete' if name else 'deletecollection'
+        }[request.method]
+        self.calls[(verb, plural)] = self.calls.get((verb, plural), 0) + 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if request.method != 'GET':
+            for code, probability in self.faults.items():
+                if random.random() < probability:
+                    response = _status(code, 'Injected', f"injected {code}")
+                    if code == 429:
+                        response.headers['Retry-After'] = '0'
+                    return response
+
+        if verb == 'watch':
+            return await self._watch(request, group, plural, namespace)
+        if verb == 'list':
+            return self._list(group, plural, namespace, query)
+        if verb == 'deletecollection':
+            return self._delete_collection(group, plural, namespace, query)
+
+        body = await request.json() if request.can_read_body else None
+        if verb == 'create':
+            return self._create(group, plural, namespace, body)
+        key = (group, plural, namespace, name)
+        current = self.objects.get(key)
+        if current is None:
+            return _status(404, 'NotFound', f"{plural} \"{name}\" not found")
+        if verb == 'get':
+            return self._json(current)
+        if verb == 'delete':
+            self._store(plural, group, copy.deepcopy(current), 'DELETED')
+            return self._json(current)
+        if verb == 'update':
+            if subresource == 'status':
+                body = dict(current, status=body.get('status'))
+            updated = dict(body, metadata=dict(body['metadata'], uid=current['metadata']['uid']))
+            return self._json(self._store(plural, group, updated, 'MODIFIED'))
+        # patch: merge, apply and strategic patches are all treated as merge patches;
+        # a JSON Patch must be a list of operations, which the operator never sends
+        if request.content_type == 'application/json-patch+json' and not isinstance(body, list):
+            return _status(400, 'BadRequest', "json patch must be a list of operations")
+        if subresource == 'status':
+            body = {'status': body.get('status')}
+        updated = _merge(current, body)
+        updated['metadata'] = dict(updated['metadata'], uid=current['metadata']['uid'], name=name)
+        return self._json(self._store(plural, group, updated, 'MODIFIED'))
+
+    def _create(self, group, plural, namespace, body):
+        metadata = body.setdefault('metadata', {})
+        if namespace:
+            metadata['namespace'] = namespace
+        if not metadata.get('name') and metadata.get('generateName'):
+            metadata['name'] = metadata['generateName'] + uuid.uuid4().hex[:5]
+        if (group, plural, namespace, metadata.get('name')) in self.objects:
+            return _status(409, 'AlreadyExists', f"{plural} \"{metadata['name']}\" already exists")
+        if plural == 'pods':
+            body.setdefault('status', {'phase': 'Pending'})
+        return self._json(self._store(plural, group, body, 'ADDED'), status=201)
+
+    def _matching(self, group, plural, namespace, selector):
+        return [obj for (g, p, ns, _), obj in self.objects.items()
+                if g == group and p == plural and (namespace is None or ns == namespace) and _labels_match(obj, selector)]
+
+    def _list(self, group, plural, namespace, query):
+        items = self._matching(group, plural, namespace, query.get('labelSelector'))
+        limit = int(query.get('limit') or 0)
+        offset = int(query.get('continue') or 0)
+        metadata = {'resourceVersion': str(next(self._rv))}
+        if limit:
+            page = items[offset:offset + limit]
+            if offset + limit < len(items):
+                metadata['continue'] = str(offset + limit)
+            items = page
+        return self._json({'kind': 'List', 'apiVersion': 'v1', 'metadata': metadata, 'items': items})
+
+    def _delete_collection(self, group, plural, namespace, query):
+        items = self._matching(group, plural, namespace, query.get('labelSelector'))
+        for obj in items:
+            self._store(plural, group, copy.deepcopy(obj), 'DELETED')
+        return self._json({'kind': 'List', 'apiVersion': 'v1', 'metadata': {}, 'items': items})
+
+    async def _watch(self, request, group, plural, namespace):
+        selector = request.query.get('labelSelector')
+        since = request.query.get('resourceVersion')
+        timeout = float(request.query.get('timeoutSeconds') or 300)
+        bookmarks = request.query.get('allowWatchBookmarks', '').lower() in ('true', '1')
+
+        response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+        await response.prepare(request)
+        queue = asyncio.Queue()
+        watcher = (group, plural, namespace, queue, selector)
+        if since:
+            for rv, g, p, event_type, obj in self._history:
+                if rv > int(since) and g == group and p == plural and (namespace is None or obj['metadata'].get('namespace') == namespace) and _labels_match(obj, selector):
+                    queue.put_nowait({'type': event_type, 'object': copy.deepcopy(obj)})
+        self._watchers.append(watcher)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), min(remaining, self.bookmark_interval))
+                except asyncio.TimeoutError:
+                    if not bookmarks:
+                        continue
+                    event = {'type': 'BOOKMARK', 'object': {'kind': 'Bookmark', 'metadata': {'resourceVersion': str(next(self._rv))}}}
+                if event is None:
+                    break
+                line = json.dumps(event).encode() + b'\n'
+                self.bytes_sent += len(line)
+                await response.write(line)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._watchers.remove(watcher)
+        return response
@@ -1,5 +1,5 @@
 import pytest
-from kubernetes import client, config
+from kubernetes import client, config, watch
 import time
 
 @pytest.fixture
@@ -54,36 +54,39 @@ def create_agent_resource(k8s_client, delete_agent_resource):
 
 @pytest.fixture
 def delete_agent_resource(k8s_core_client, k8s_client):
-    def _delete_agent(name, namespace="default"):
+    def _delete_agent(name, namespace="default", timeout=30):
+        # Foreground propagation lets the operator delete the pods right away
         try:
-            # Delete the AgentType resource
             k8s_client.delete_namespaced_custom_object(
                 group="agents.example.com",
                 version="v1",
                 namespace=namespace,
                 plural="agenttypes",
-                name=name
+                name=name,
+                propagation_policy="Foreground"
             )
-            
-            # Wait for pod deletion with a more robust check
-            max_retries = 30
-            retry_interval = 1
-            for _ in range(max_retries):
-                try:
-                    k8s_core_client.read_namespaced_pod(
-                        name=f"{name}-pod",
-                        namespace=namespace
-                    )
-                    time.sleep(retry_interval)
-                except client.exceptions.ApiException as e:
-                    if e.status == 404:  # Pod is gone
-                        return
-                    raise
-            
-            raise Exception("Timeout while waiting for pod deletion")
-            
         except client.exceptions.ApiException as e:
             if e.status != 404:  # Ignore 404 errors
                 raise
 
-    return _delete_agent
\ No newline at end of file
+        # Follow the pods through a watch instead of polling each one
+        selector = f"managed-by=agent-operator,app={name}"
+        pods = k8s_core_client.list_namespaced_pod(namespace, label_selector=selector)
+        remaining = {pod.metadata.name for pod in pods.items}
+        if not remaining:
+            return
+        for event in watch.Watch().stream(
+            k8s_core_client.list_namespaced_pod,
+            namespace,
+            label_selector=selector,
+            resource_version=pods.metadata.resource_version,
+            timeout_seconds=timeout
+        ):
+            if event["type"] == "DELETED":
+                remaining.discard(event["object"].metadata.name)
+                if not remaining:
+                    return
+
+        raise Exception("Timeout while waiting for pod deletion")
+
+    return _delete_agent
@@ -0,0 +1,23 @@
+import importlib
+import pathlib
+import sys
+import types
+
+import pytest
+
+OPERATOR_DIR = pathlib.Path(__file__).resolve().parents[2] / 'operator'
+
+# The operator sources live in a directory called `operator`, which collides
+# with the standard library module of the same name. Register the directory
+# as a package under a different name so its relative imports resolve.
+if 'agent_operator' not in sys.modules:
+    package = types.ModuleType('agent_operator')
+    package.__path__ = [str(OPERATOR_DIR)]
+    sys.modules['agent_operator'] = package
+
+
+@pytest.fixture
+def operator_module():
+    def _import(name):
+        return importlib.import_module(f'agent_operator.{name}')
+    return _import
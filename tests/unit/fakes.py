@@ -0,0 +1,270 @@
+import asyncio
+import itertools
+import json
+from typing import NamedTuple
+
+from agent_operator.utils import clients
+from agent_operator.utils.workqueue import WorkQueue
+
+
+class FakeResponse:
+    """Stand-in for the raw aiohttp response returned with _preload_content=False"""
+
+    def __init__(self, payload=None, lines=(), status=200, reason='OK'):
+        self.status = status
+        self.reason = reason
+        self.headers = {}
+        self.payload = payload
+        self.lines = [json.dumps(line).encode() + b'\n' for line in lines]
+
+    async def json(self):
+        return self.payload
+
+    async def text(self):
+        return json.dumps(self.payload)
+
+    async def read(self):
+        return json.dumps(self.payload).encode()
+
+    def release(self):
+        pass
+
+    @property
+    def content(self):
+        async def stream():
+            for line in self.lines:
+                yield line
+        return stream()
+
+
+class Request(NamedTuple):
+    verb: str
+    kind: str
+    name: str
+    body: object
+    kwargs: dict
+
+
+def _named(items):
+    return isinstance(items, list) and all(isinstance(item, dict) and 'name' in item for item in items)
+
+
+def merge_patch(target, patch):
+    """Apply a patch: dicts merge, None deletes, lists of named objects merge by name, anything else replaces"""
+    if _named(target) and _named(patch) and patch:
+        by_name = {item['name']: item for item in target}
+        for item in patch:
+            by_name[item['name']] = merge_patch(by_name.get(item['name']), item)
+        return list(by_name.values())
+    if not isinstance(patch, dict) or not isinstance(target, dict):
+        return patch
+    merged = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = merge_patch(merged.get(key), value)
+    return merged
+
+
+class FakeCoreApi:
+    """In-memory CoreV1Api for the pods, ConfigMaps, Events, Nodes, quotas and LimitRanges the operator uses
+
+    Objects are kept per kind under (namespace, name); creating an existing
+    name, or patching a name in `conflicts`, answers 409. Every call is
+    recorded in `requests`. `script` queues raw list and watch responses for
+    informer tests; without a script, lists serve the store and watches end
+    at once.
+    """
+
+    def __init__(self, pods=(), configmaps=(), events=(), nodes=(), quotas=(), limit_ranges=(), conflicts=()):
+        self.store = {kind: {} for kind in ('pods', 'configmaps', 'events', 'nodes', 'quotas', 'limitranges')}
+        for kind, objects in (('pods', pods), ('configmaps', configmaps), ('events', events),
+                              ('nodes', nodes), ('quotas', quotas), ('limitranges', limit_ranges)):
+            for obj in objects:
+                self.put(kind, obj)
+        self.conflicts = set(conflicts)
+        self.requests = []
+        self.scripted = {}
+        self.uids = itertools.count()
+
+    def put(self, kind, obj):
+        metadata = obj['metadata']
+        self.store[kind][(metadata.get('namespace'), metadata['name'])] = obj
+
+    def get(self, kind, namespace, name):
+        return self.store[kind].get((namespace, name))
+
+    def script(self, kind, lists=(), watches=()):
+        self.scripted[kind] = (list(lists), list(watches))
+
+    def verbs(self, kind=None):
+        """The verbs called, in order, optionally for one kind"""
+        return [request.verb for request in self.requests if kind in (None, request.kind)]
+
+    def bodies(self, verb, kind):
+        return [request.body for request in self.requests if request.verb == verb and request.kind == kind]
+
+    async def _record(self, verb, kind, name=None, body=None, **kwargs):
+        self.requests.append(Request(verb, kind, name, body, kwargs))
+        # Yield like a real request, so concurrent callers interleave
+        await asyncio.sleep(0)
+
+    async def _list(self, kind, namespace=None, **kwargs):
+        watch = kwargs.get('watch')
+        await self._record('watch' if watch else 'list', kind, **kwargs)
+        lists, watches = self.scripted.get(kind, ([], []))
+        if watch:
+            return watches.pop(0) if watches else FakeResponse(lines=())
+        if lists:
+            return lists.pop(0)
+        items = [obj for (ns, _), obj in self.store[kind].items() if namespace in (None, ns)]
+        return FakeResponse({'items': items, 'metadata': {'resourceVersion': '1'}})
+
+    async def _read(self, kind, name, namespace, **kwargs):
+        await self._record('read', kind, name, **kwargs)
+        obj = self.get(kind, namespace, name)
+        if obj is None:
+            return FakeResponse({'message': 'not found'}, status=404, reason='Not Found')
+        return FakeResponse(obj)
+
+    async def _create(self, kind, namespace, body, **kwargs):
+        metadata = dict(body['metadata'])
+        uid = next(self.uids)
+        metadata.setdefault('name', f"{metadata.get('generateName', '')}{uid}")
+        await self._record('create', kind, metadata['name'], body, **kwargs)
+        if self.get(kind, namespace, metadata['name']) is not None or metadata['name'] in self.conflicts:
+            return FakeResponse({'message': 'exists'}, status=409, reason='Conflict')
+        metadata.setdefault('namespace', namespace)
+        metadata.setdefault('uid', f"uid-new-{uid}")
+        obj = dict(body, metadata=metadata)
+        self.put(kind, obj)
+        return FakeResponse(obj, status=201)
+
+    async def _patch(self, kind, name, namespace, body, **kwargs):
+        await self._record('patch', kind, name, body, **kwargs)
+        obj = self.get(kind, namespace, name)
+        if obj is None:
+            return FakeResponse({'message': 'not found'}, status=404, reason='Not Found')
+        if name in self.conflicts:
+            return FakeResponse({'message': 'conflict'}, status=409, reason='Conflict')
+        obj = merge_patch(obj, body)
+        self.put(kind, obj)
+        return FakeResponse(obj)
+
+    async def _delete(self, kind, name, namespace, body=None, **kwargs):
+        await self._record('delete', kind, name, body, **kwargs)
+        obj = self.store[kind].pop((namespace, name), None)
+        if obj is None:
+            return FakeResponse({'message': 'not found'}, status=404, reason='Not Found')
+        return FakeResponse(obj)
+
+    async def _delete_collection(self, kind, namespace, label_selector, **kwargs):
+        await self._record('deletecollection', kind, label_selector=label_selector, **kwargs)
+        wanted = dict(term.split('=', 1) for term in label_selector.split(','))
+        deleted = [
+            self.store[kind].pop(key) for key, obj in list(self.store[kind].items())
+            if key[0] == namespace and wanted.items() <= (obj['metadata'].get('labels') or {}).items()
+        ]
+        return FakeResponse({'items': deleted})
+
+    async def list_pod_for_all_namespaces(self, **kwargs):
+        return await self._list('pods', **kwargs)
+
+    async def read_namespaced_pod(self, name, namespace, **kwargs):
+        return await self._read('pods', name, namespace, **kwargs)
+
+    async def create_namespaced_pod(self, namespace, body, **kwargs):
+        return await self._create('pods', namespace, body, **kwargs)
+
+    async def patch_namespaced_pod(self, name, namespace, body, **kwargs):
+        return await self._patch('pods', name, namespace, body, **kwargs)
+
+    async def delete_namespaced_pod(self, name, namespace, **kwargs):
+        return await self._delete('pods', name, namespace, **kwargs)
+
+    async def delete_collection_namespaced_pod(self, namespace, label_selector, **kwargs):
+        return await self._delete_collection('pods', namespace, label_selector, **kwargs)
+
+    async def list_config_map_for_all_namespaces(self, **kwargs):
+        return await self._list('configmaps', **kwargs)
+
+    async def create_namespaced_config_map(self, namespace, body, **kwargs):
+        return await self._create('configmaps', namespace, body, **kwargs)
+
+    async def read_namespaced_config_map(self, name, namespace, **kwargs):
+        return await self._read('configmaps', name, namespace, **kwargs)
+
+    async def patch_namespaced_config_map(self, name, namespace, body, **kwargs):
+        return await self._patch('configmaps', name, namespace, body, **kwargs)
+
+    async def delete_namespaced_config_map(self, name, namespace, **kwargs):
+        return await self._delete('configmaps', name, namespace, **kwargs)
+
+    async def create_namespaced_event(self, namespace, body, **kwargs):
+        return await self._create('events', namespace, body, **kwargs)
+
+    async def patch_namespaced_event(self, name, namespace, body, **kwargs):
+        return await self._patch('events', name, namespace, body, **kwargs)
+
+    async def list_node(self, **kwargs):
+        return await self._list('nodes', **kwargs)
+
+    async def list_resource_quota_for_all_namespaces(self, **kwargs):
+        return await self._list('quotas', **kwargs)
+
+    async def list_limit_range_for_all_namespaces(self, **kwargs):
+        return await self._list('limitranges', **kwargs)
+
+
+def install_core_api(monkeypatch, api, *modules):
+    """Serve `api` from clients.get_core_api and from `get_core_api` imported into `modules`"""
+    async def get_core_api():
+        return api
+
+    monkeypatch.setattr(clients, 'get_core_api', get_core_api)
+    for module in modules:
+        monkeypatch.setattr(module, 'get_core_api', get_core_api)
+    return api
+
+
+def provide(monkeypatch, getter, value, *modules):
+    """Make the process-wide `getter` (e.g. 'get_pod_cache') of each module return `value`"""
+    for module in modules:
+        monkeypatch.setattr(module, getter, lambda: value)
+
+
+def run_queued(monkeypatch, test, *modules):
+    """Run `test(queue)` with a started one-worker WorkQueue served by `get_work_queue` of `modules`"""
+    async def run():
+        queue = WorkQueue(workers=1)
+        queue.start()
+        provide(monkeypatch, 'get_work_queue', queue, *modules)
+        try:
+            return await test(queue)
+        finally:
+            await queue.stop()
+
+    return asyncio.run(run())
+
+
+class FakePodCache:
+    """Synced stand-in for the pod cache, answering index lookups from a list of pods"""
+
+    def __init__(self, pods=()):
+        self.pods = list(pods)
+        self.synced = asyncio.Event()
+        self.synced.set()
+
+    def pods_for_owner(self, uid):
+        return [pod for pod in self.pods if any(ref['uid'] == uid for ref in pod['metadata'].get('ownerReferences') or [])]
+
+    def pods_for_app(self, app):
+        return [pod for pod in self.pods if (pod['metadata'].get('labels') or {}).get('app') == app]
+
+    def pods_mounting(self, namespace, configmap):
+        return [
+            pod for pod in self.pods
+            if pod['metadata']['namespace'] == namespace
+            and any((volume.get('configMap') or {}).get('name') == configmap for volume in pod['spec'].get('volumes') or [])
+        ]
@@ -0,0 +1,169 @@
+import asyncio
+
+from agent_operator.utils import artifacts
+from agent_operator.utils.artifacts import ARTIFACT_LABEL, ArtifactCache, artifact_params, configmap_name
+from agent_operator.utils.template import PodTemplate, build_pod
+
+from .fakes import FakeCoreApi, FakePodCache, install_core_api, provide
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+
+
+def sdk_spec(packages=('requests',), source='print("hi")'):
+    return {
+        'agent': {
+            'image': 'python:3.11',
+            'environment': {
+                'sdk': {'runtime': 'python', 'packages': list(packages)},
+                'glueCode': {'source': source}
+            }
+        }
+    }
+
+
+def install(monkeypatch, api, pods=()):
+    provide(monkeypatch, 'get_pod_cache', FakePodCache(pods), artifacts)
+    return install_core_api(monkeypatch, api)
+
+
+def artifact_configmap(key):
+    return {'metadata': {'name': configmap_name(key), 'namespace': 'default', 'labels': {ARTIFACT_LABEL: key}}}
+
+
+def test_identical_specs_share_one_artifact():
+    """The key only depends on glue code and SDK content, not on the agent"""
+    spec = sdk_spec()
+    other = dict(spec, agent=dict(spec['agent'], image='python:3.12'))
+
+    assert artifact_params(spec) == artifact_params(other)
+    assert artifact_params(spec) != artifact_params(sdk_spec(packages=('httpx',)))
+    assert artifact_params({'agent': {'image': 'nginx'}}) is None
+
+
+def test_ensure_builds_once_and_reports_hits(monkeypatch):
+    """Concurrent and repeated lookups of one artifact write a single ConfigMap"""
+    api = install(monkeypatch, FakeCoreApi())
+    cache = ArtifactCache()
+
+    async def run():
+        return await asyncio.gather(*(cache.ensure('default', sdk_spec()) for _ in range(3)))
+
+    results = asyncio.run(run())
+    key = artifact_params(sdk_spec())[0]
+
+    assert sorted(hit for _, hit in results) == [False, True, True]
+    assert api.verbs() == ['create']
+    configmap = api.get('configmaps', 'default', configmap_name(key))
+    assert configmap['data'] == {'wrapper.py': 'print("hi")', 'packages.txt': 'requests\n'}
+    assert configmap['metadata']['labels'][ARTIFACT_LABEL] == key
+    assert cache.stats == {'hits': 2, 'misses': 1, 'evictions': 0}
+
+
+def test_existing_configmap_is_reused(monkeypatch):
+    """An artifact written before a restart or by another replica is not an error"""
+    key = artifact_params(sdk_spec())[0]
+    install(monkeypatch, FakeCoreApi(configmaps=[artifact_configmap(key)]))
+
+    assert asyncio.run(ArtifactCache().ensure('default', sdk_spec())) == (key, False)
+
+
+def test_least_recently_used_artifacts_are_evicted(monkeypatch):
+    """Beyond its size the cache deletes the artifact not used for longest"""
+    api = install(monkeypatch, FakeCoreApi())
+    cache = ArtifactCache(size=2)
+    specs = [sdk_spec(packages=(f"pkg-{i}",)) for i in range(3)]
+
+    async def run():
+        await cache.ensure('default', specs[0])
+        await cache.ensure('default', specs[1])
+        await cache.ensure('default', specs[0])
+        await cache.ensure('default', specs[2])
+
+    asyncio.run(run())
+
+    assert api.requests[-1][:3] == ('delete', 'configmaps', configmap_name(artifact_params(specs[1])[0]))
+    assert [key for _, key in cache.entries] == [artifact_params(specs[0])[0], artifact_params(specs[2])[0]]
+    assert cache.stats['evictions'] == 1
+
+
+def test_mounted_artifacts_are_not_evicted(monkeypatch):
+    """An artifact a live pod mounts is skipped; the next least recently used one goes"""
+    specs = [sdk_spec(packages=(f"pkg-{i}",)) for i in range(3)]
+    mounted = configmap_name(artifact_params(specs[0])[0])
+    pod = {'metadata': {'namespace': 'default'}, 'spec': {'volumes': [{'name': 'artifact', 'configMap': {'name': mounted}}]}}
+    api = install(monkeypatch, FakeCoreApi(), pods=[pod])
+    cache = ArtifactCache(size=2)
+
+    async def run():
+        for spec in specs:
+            await cache.ensure('default', spec)
+
+    asyncio.run(run())
+
+    assert api.requests[-1][:3] == ('delete', 'configmaps', configmap_name(artifact_params(specs[1])[0]))
+    assert (('default', artifact_params(specs[0])[0])) in cache.entries
+
+
+def test_nothing_is_evicted_without_a_pod_cache(monkeypatch):
+    """Whether a pod still mounts an artifact cannot be known without the pod cache"""
+    api = install(monkeypatch, FakeCoreApi())
+    monkeypatch.setattr(artifacts, 'get_pod_cache', lambda: None)
+    cache = ArtifactCache(size=1)
+
+    async def run():
+        for i in range(3):
+            await cache.ensure('default', sdk_spec(packages=(f"pkg-{i}",)))
+
+    asyncio.run(run())
+
+    assert api.verbs() == ['create'] * 3
+    assert len(cache.entries) == 3
+
+
+def test_load_seeds_entries_from_configmaps(monkeypatch):
+    """Artifacts already in the cluster are hits after a restart"""
+    api = install(monkeypatch, FakeCoreApi())
+    asyncio.run(ArtifactCache().ensure('default', sdk_spec()))
+    cache = ArtifactCache()
+
+    assert asyncio.run(cache.load()) == 1
+    assert asyncio.run(cache.ensure('default', sdk_spec()))[1] is True
+    assert api.verbs() == ['create', 'list']
+
+
+def test_pod_copies_cached_artifact():
+    """Pods with an artifact mount it read-only instead of generating the wrapper"""
+    key = artifact_params(sdk_spec())[0]
+    pod = PodTemplate().render('a', 'default', sdk_spec(), OWNER)
+
+    assert pod == build_pod('a', 'default', sdk_spec(), OWNER)
+    assert {'name': 'artifact', 'configMap': {'name': configmap_name(key)}} in pod['spec']['volumes']
+    init = pod['spec']['initContainers'][0]
+    assert f"sdk cache hit {key}" in init['args'][0]
+    agent = pod['spec']['containers'][0]
+    assert {'name': 'sdk', 'mountPath': '/sdk', 'readOnly': True} in agent['volumeMounts']
+    assert all(mount['name'] != 'sdk-cache' for mount in agent['volumeMounts'])
+    assert {'name': 'sdk-cache', 'hostPath': {'path': '/var/cache/agent-operator/sdk/default', 'type': 'DirectoryOrCreate'}} in pod['spec']['volumes']
+    other = PodTemplate().render('a', 'other', sdk_spec(), OWNER)
+    assert {'name': 'sdk-cache', 'hostPath': {'path': '/var/cache/agent-operator/sdk/other', 'type': 'DirectoryOrCreate'}} in other['spec']['volumes']
+    assert {'name': 'PYTHONPATH', 'value': '/sdk'} in agent['env']
+
+
+def test_sdk_is_installed_with_the_spec_runtime_version():
+    """spec.agent.environment.sdk.version picks the installer image and its own artifact"""
+    pinned = sdk_spec()
+    pinned['agent']['environment']['sdk']['version'] = '3.12'
+    init = PodTemplate().render('a', 'default', pinned, OWNER)['spec']['initContainers'][0]
+    default = PodTemplate().render('a', 'default', sdk_spec(), OWNER)['spec']['initContainers'][0]
+
+    assert init['image'] == 'python:3.12-slim'
+    assert default['image'] == 'python:3.11-slim'
+    assert artifact_params(pinned)[0] != artifact_params(sdk_spec())[0]
+
+
+def test_sdk_node_cache_can_be_turned_off():
+    """Without the node cache, pods use no hostPath and install into an emptyDir"""
+    pod = PodTemplate(sdk_node_cache=False).render('a', 'default', sdk_spec(), OWNER)
+
+    assert {'name': 'sdk-cache', 'emptyDir': {}} in pod['spec']['volumes']
+    assert all('hostPath' not in volume for volume in pod['spec']['volumes'])
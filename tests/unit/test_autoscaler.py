@@ -0,0 +1,199 @@
+from agent_operator.handlers import create, podstatus, scale
+from agent_operator.handlers.create import SPEC_HASH_ANNOTATION, build_agent_pod, pod_spec_hash
+from agent_operator.utils import autoscaler as autoscaler_module
+from agent_operator.utils.autoscaler import Autoscaler, desired_replicas, scaling_policy
+from agent_operator.utils.podcache import REPLICA_LABEL, PodCache, replica_index
+from agent_operator.utils.status import StatusWriter
+
+from .fakes import FakeCoreApi, install_core_api, provide, run_queued
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+SPEC = {
+    'agent': {'image': 'agent:1'},
+    'toolProxy': {'upstream': 'http://tools:8000'},
+    'scaling': {'minReplicas': 0, 'maxReplicas': 4, 'target': 10}
+}
+POLICY = scaling_policy(SPEC)
+
+
+def running_pod(spec, replica=0):
+    pod = build_agent_pod('a', 'default', spec, OWNER, replica)
+    pod['metadata']['annotations'] = {SPEC_HASH_ANNOTATION: pod_spec_hash(pod)}
+    pod['metadata']['uid'] = f"uid-pod-{replica}"
+    pod['status'] = {'phase': 'Running', 'podIP': f"10.0.0.{replica + 1}"}
+    return pod
+
+
+def run_scaling(monkeypatch, api, test):
+    """Run `test(cache, writer)` with a pod cache listed from `api` and a queue serving the autoscaler"""
+    install_core_api(monkeypatch, api, create)
+
+    async def run(queue):
+        cache = PodCache(api)
+        await cache.relist()
+        provide(monkeypatch, 'get_pod_cache', cache, scale, autoscaler_module)
+        provide(monkeypatch, 'get_pod_cache', None, create)
+        writer = StatusWriter(window=60)
+        provide(monkeypatch, 'get_status_writer', writer, create, autoscaler_module)
+        try:
+            await test(cache, writer)
+        finally:
+            for key in list(writer._timers):
+                writer.forget(*key)
+
+    run_queued(monkeypatch, run, autoscaler_module)
+
+
+def test_load_within_tolerance_keeps_replicas():
+    """Loads near the per-replica target do not change the count in either direction"""
+    assert desired_replicas(POLICY, 2, 21, elapsed=1000, idle=0) == 2
+    assert desired_replicas(POLICY, 2, 19, elapsed=1000, idle=0) == 2
+    assert desired_replicas(POLICY, 2, 35, elapsed=1000, idle=0) == 4
+    assert desired_replicas(POLICY, 2, 5, elapsed=1000, idle=0) == 1
+
+
+def test_cooldowns_and_bounds_limit_scaling():
+    """Each direction waits out its cooldown, and counts stay within min and max replicas"""
+    assert desired_replicas(POLICY, 1, 30, elapsed=10, idle=0) == 1
+    assert desired_replicas(POLICY, 1, 30, elapsed=30, idle=0) == 3
+    assert desired_replicas(POLICY, 3, 10, elapsed=60, idle=0) == 3
+    assert desired_replicas(POLICY, 3, 10, elapsed=300, idle=0) == 1
+    assert desired_replicas(POLICY, 1, 500, elapsed=1000, idle=0) == 4
+    assert desired_replicas(POLICY, 2, None, elapsed=1000, idle=0) == 2
+
+
+def test_idle_agent_scales_to_zero_only_when_allowed():
+    """minReplicas 0 lets an idle AgentType go to zero after idleSeconds; otherwise it keeps one pod"""
+    assert desired_replicas(POLICY, 1, 0, elapsed=1000, idle=599) == 1
+    assert desired_replicas(POLICY, 1, 0, elapsed=1000, idle=600) == 0
+    assert desired_replicas(POLICY, 0, None, elapsed=1000, idle=0) == 0
+    assert desired_replicas(dict(POLICY, minReplicas=1), 1, 0, elapsed=1000, idle=10**6) == 1
+
+
+def test_scale_creates_and_deletes_replicas(monkeypatch):
+    """Missing replicas are created, the extra ones deleted from the highest index down"""
+    api = FakeCoreApi(pods=[running_pod(SPEC), running_pod(SPEC, 1)])
+
+    async def test(cache, writer):
+        assert await scale.scale_agent_pods('a', 'default', SPEC, OWNER, 3) == (1, 0)
+        assert [pod['metadata']['labels'][REPLICA_LABEL] for pod in api.bodies('create', 'pods')] == ['2']
+
+        await cache.relist()
+        assert await scale.scale_agent_pods('a', 'default', SPEC, OWNER, 0) == (0, 3)
+        assert [request.name for request in api.requests if request.verb == 'delete'] == ['a-pod-2', 'a-pod-1', 'a-pod']
+
+    run_scaling(monkeypatch, api, test)
+
+
+def test_resync_replaces_stale_replicas(monkeypatch):
+    """One resync after a spec update replaces the extra replicas; the first pod is left to the spec rollout"""
+    old = dict(SPEC, agent={'image': 'agent:0'})
+    api = FakeCoreApi(pods=[running_pod(old), running_pod(old, 1)])
+
+    async def test(cache, writer):
+        autoscaler = Autoscaler()
+        autoscaler.track('default', 'a', SPEC, OWNER, replicas=2)
+
+        assert await autoscaler.resync('default', 'a') == (1, 1)
+        assert api.get('pods', 'default', 'a-pod')['spec']['containers'][0]['image'] == 'agent:0'
+        assert api.get('pods', 'default', 'a-pod-1')['spec']['containers'][0]['image'] == 'agent:1'
+
+    run_scaling(monkeypatch, api, test)
+
+
+def test_evaluate_recreates_missing_replicas(monkeypatch):
+    """A replica deleted from outside is recreated although the count stays"""
+    api = FakeCoreApi(pods=[running_pod(SPEC), running_pod(SPEC, 1)])
+
+    async def test(cache, writer):
+        autoscaler = Autoscaler()
+
+        async def scrape(pod):
+            return None
+        autoscaler.scrape = scrape
+        autoscaler.track('default', 'a', SPEC, OWNER, replicas=2)
+        agent = autoscaler.agents[('default', 'a')]
+        assert await autoscaler.evaluate(agent, at=1000) is None
+
+        del api.store['pods'][('default', 'a-pod-1')]
+        await cache.relist()
+        assert await (await autoscaler.evaluate(agent, at=1001)) == (1, 0)
+        assert agent.replicas == 2
+        assert api.get('pods', 'default', 'a-pod-1') is not None
+
+    run_scaling(monkeypatch, api, test)
+
+
+def test_evaluate_scales_on_reported_load(monkeypatch):
+    """Calls in flight across replicas drive the count, and the decision is written to status"""
+    api = FakeCoreApi(pods=[running_pod(SPEC)])
+
+    async def test(cache, writer):
+        autoscaler = Autoscaler()
+
+        async def scrape(pod):
+            return 25, 100
+        autoscaler.scrape = scrape
+        autoscaler.track('default', 'a', SPEC, OWNER)
+        agent = autoscaler.agents[('default', 'a')]
+
+        await (await autoscaler.evaluate(agent, at=1000))
+        assert agent.replicas == 3
+        assert writer._pending_fields[('default', 'a')]['scaling']['replicas'] == 3
+        assert sorted(replica_index(pod) for pod in api.store['pods'].values()) == [0, 1, 2]
+        await cache.relist()
+        assert await autoscaler.evaluate(agent, at=1001) is None
+
+    run_scaling(monkeypatch, api, test)
+
+
+def test_request_rate_is_derived_from_counters(monkeypatch):
+    """The requestRate metric is the per-second increase of each pod's call count"""
+    spec = dict(SPEC, scaling=dict(SPEC['scaling'], metric='requestRate', target=5))
+    api = FakeCoreApi(pods=[running_pod(spec)])
+
+    async def test(cache, writer):
+        autoscaler = Autoscaler()
+        counts = iter([(0, 100), (0, 300)])
+
+        async def scrape(pod):
+            return next(counts)
+        autoscaler.scrape = scrape
+        autoscaler.track('default', 'a', spec, OWNER)
+        agent = autoscaler.agents[('default', 'a')]
+
+        assert await autoscaler.load(agent, cache.pods_for_owner('uid-a'), 0) is None
+        assert await autoscaler.load(agent, cache.pods_for_owner('uid-a'), 10) == 20
+
+    run_scaling(monkeypatch, api, test)
+
+
+def test_idle_agent_scales_to_zero_and_wakes(monkeypatch):
+    """An idle AgentType loses its last pod, reports ScaledToZero, and gets it back when woken"""
+    api = FakeCoreApi(pods=[running_pod(SPEC)])
+
+    async def test(cache, writer):
+        autoscaler = Autoscaler()
+
+        async def scrape(pod):
+            return 0, 5
+        autoscaler.scrape = scrape
+        autoscaler.track('default', 'a', SPEC, OWNER)
+        agent = autoscaler.agents[('default', 'a')]
+
+        assert await autoscaler.evaluate(agent, at=1000) is None
+        await (await autoscaler.evaluate(agent, at=1600))
+        assert autoscaler.is_scaled_to_zero('default', 'a')
+        assert api.store['pods'] == {}
+
+        provide(monkeypatch, 'get_autoscaler', autoscaler, podstatus)
+        provide(monkeypatch, 'get_status_writer', writer, podstatus)
+        podstatus.reconcile_pod_status('DELETED', running_pod(SPEC))
+        assert writer._pending_fields[('default', 'a')]['phase'] == 'ScaledToZero'
+
+        await cache.relist()
+        await autoscaler.wake('default', 'a')
+        assert agent.replicas == 1
+        assert list(api.store['pods']) == [('default', 'a-pod')]
+
+    run_scaling(monkeypatch, api, test)
@@ -0,0 +1,205 @@
+import asyncio
+import io
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from kubernetes_asyncio import client
+
+from agent_operator import bulk
+from agent_operator.utils import clients
+
+from benchmarks.fake_apiserver import FakeApiServer
+
+from .fakes import FakeResponse
+
+
+def test_load_yaml_and_jsonl_documents():
+    """Both multi-document YAML and JSONL streams are accepted"""
+    yaml_docs = bulk.load_documents(io.StringIO(
+        "metadata: {name: a}\nspec: {agent: {image: nginx}}\n---\nmetadata: {name: b}\nspec: {agent: {image: nginx}}\n"
+    ))
+    jsonl_docs = bulk.load_documents(io.StringIO(
+        '{"metadata": {"name": "a"}, "spec": {"agent": {"image": "nginx"}}}\n'
+        '{"metadata": {"name": "b"}, "spec": {"agent": {"image": "nginx"}}}\n'
+    ))
+
+    assert [d['metadata']['name'] for d in yaml_docs] == ['a', 'b']
+    assert yaml_docs == jsonl_docs
+    assert yaml_docs[0]['kind'] == 'AgentType'
+
+
+class ThrottlingCustomApi:
+    def __init__(self, throttled):
+        self.throttled = throttled
+        self.created = []
+
+    async def create_namespaced_custom_object(self, body, **kwargs):
+        if self.throttled:
+            self.throttled -= 1
+            return FakeResponse({'message': 'slow down'}, status=429, reason='Too Many Requests')
+        self.created.append(body['metadata']['name'])
+        return FakeResponse(body, status=201)
+
+
+@pytest.fixture
+def custom_api(monkeypatch):
+    api = ThrottlingCustomApi(throttled=2)
+
+    async def get_api():
+        return api
+
+    monkeypatch.setattr(clients, 'get_custom_api', get_api)
+    monkeypatch.setattr(clients, 'get_core_api', get_api)
+    return api
+
+
+def test_submit_batch_retries_throttled_creates(custom_api):
+    """429 responses are retried with backoff instead of failing the batch"""
+    docs = [{'metadata': {'name': f"agent-{i}"}, 'spec': {'agent': {'image': 'nginx'}}} for i in range(5)]
+    report = asyncio.run(bulk.submit_batch(docs, concurrency=2, backoff=0.001, wait=False))
+
+    assert sorted(custom_api.created) == [f"agent-{i}" for i in range(5)]
+    assert report['created'] == 5
+    assert report['failed'] == 0
+    assert report['retries'] == 2
+
+
+def test_main_submits_file_and_prints_report(custom_api, monkeypatch, tmp_path, capsys):
+    """The CLI loads the file, submits it and prints the JSON report"""
+    async def noop(**kwargs):
+        pass
+
+    monkeypatch.setattr(clients, 'init_clients', noop)
+    monkeypatch.setattr(clients, 'close_clients', noop)
+    custom_api.throttled = 0
+    path = tmp_path / 'agents.yaml'
+    path.write_text("metadata: {name: a}\nspec: {agent: {image: nginx}}\n---\nmetadata: {name: b}\nspec: {agent: {image: nginx}}\n")
+
+    assert bulk.main(['-f', str(path), '--no-wait']) == 0
+    assert json.loads(capsys.readouterr().out)['created'] == 2
+    assert sorted(custom_api.created) == ['a', 'b']
+
+
+def test_main_requires_a_file_unless_tearing_down(capsys):
+    """Creating without -f is a usage error"""
+    with pytest.raises(SystemExit) as exc:
+        bulk.main([])
+    assert exc.value.code == 2
+
+
+def test_script_runs_the_cli():
+    """scripts/bulk.py starts the CLI despite the `operator` directory name"""
+    script = pathlib.Path(__file__).resolve().parents[2] / 'scripts' / 'bulk.py'
+    result = subprocess.run([sys.executable, str(script), '--help'], capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert '--teardown' in result.stdout
+
+
+def test_tracker_reports_time_to_ready():
+    """A batch is done once every pod reported Ready through the watch"""
+    async def test():
+        tracker = bulk.BatchTracker(['a', 'b'])
+        for name in ('a', 'b'):
+            tracker.submitted(name)
+        pod = {'metadata': {'labels': {'app': 'a'}}, 'status': {'conditions': [{'type': 'Ready', 'status': 'True'}]}}
+        tracker.on_pod_event('MODIFIED', pod)
+        assert not tracker.all_ready.is_set()
+
+        pod['metadata']['labels']['app'] = 'b'
+        tracker.on_pod_event('MODIFIED', pod)
+        assert tracker.all_ready.is_set()
+        assert len(tracker.times_to_ready()) == 2
+
+    asyncio.run(test())
+
+
+@pytest.fixture
+def apiserver(monkeypatch):
+    server = FakeApiServer().start()
+
+    async def load_kube_config():
+        client.Configuration.set_default(client.Configuration(host=server.url))
+
+    monkeypatch.setattr(clients, 'load_kube_config', load_kube_config)
+    for i in range(50):
+        name = f"agent-{i}"
+        server.put('agenttypes', {
+            'apiVersion': f"{bulk.GROUP}/v1",
+            'kind': 'AgentType',
+            'metadata': {'name': name, 'namespace': 'default', 'labels': {'team': 'a' if i < 10 else 'b'}},
+            'spec': {'agent': {'image': 'nginx'}}
+        }, group=bulk.GROUP)
+        server.put('pods', {'metadata': {
+            'name': f"{name}-pod", 'namespace': 'default', 'labels': {'app': name, 'managed-by': 'agent-operator'}
+        }})
+    server.put('pods', {'metadata': {
+        'name': 'standby-1', 'namespace': 'default', 'labels': {'managed-by': 'agent-operator'}
+    }})
+    yield server
+    server.stop()
+
+
+def run_teardown(**kwargs):
+    async def run():
+        await clients.init_clients()
+        try:
+            return await bulk.teardown(timeout=5, **kwargs)
+        finally:
+            await clients.close_clients()
+
+    return asyncio.run(run())
+
+
+def test_teardown_deletes_everything_in_two_calls(apiserver):
+    """All AgentTypes and their pods go in one deletecollection each; standby pods stay"""
+    report = run_teardown()
+
+    assert report['agenttypes'] == 50
+    assert report['pods'] == 50
+    assert report['api_calls'] == 2
+    assert not report['timed_out']
+    assert apiserver.list('agenttypes', group=bulk.GROUP) == []
+    assert [p['metadata']['name'] for p in apiserver.list('pods')] == ['standby-1']
+    assert apiserver.total_calls(verbs=('get',)) == 0
+
+
+def test_teardown_by_selector_only_deletes_matching_agents(apiserver):
+    """A label selector limits both the AgentTypes and the pods deleted"""
+    report = run_teardown(selector='team=a')
+
+    assert report['agenttypes'] == 10
+    assert report['pods'] == 10
+    assert len(apiserver.list('agenttypes', group=bulk.GROUP)) == 40
+    remaining = {p['metadata']['name'] for p in apiserver.list('pods')}
+    assert 'agent-0-pod' not in remaining and 'agent-10-pod' in remaining
+
+
+def test_teardown_selectors_are_chunked():
+    """Pod selectors for many AgentTypes are split into bounded set-based selectors"""
+    selectors = bulk.teardown_selectors([f"a{i:04}" for i in range(bulk.TEARDOWN_CHUNK + 1)])
+
+    assert len(selectors) == 2
+    assert selectors[1] == f"managed-by=agent-operator,app in (a{bulk.TEARDOWN_CHUNK:04})"
+    assert bulk.teardown_selectors() == ['managed-by=agent-operator,app']
+
+
+def test_main_does_not_submit_invalid_specs(custom_api, monkeypatch, tmp_path, capsys):
+    """Specs failing the CRD schema are reported without a create request"""
+    async def noop(**kwargs):
+        pass
+
+    monkeypatch.setattr(clients, 'init_clients', noop)
+    monkeypatch.setattr(clients, 'close_clients', noop)
+    custom_api.throttled = 0
+    path = tmp_path / 'agents.yaml'
+    path.write_text("metadata: {name: a}\nspec: {agent: {image: nginx}}\n---\nmetadata: {name: b}\nspec: {agent: {}}\n")
+
+    assert bulk.main(['-f', str(path), '--no-wait', '--schema', str(bulk.CRD_PATH)]) == 1
+    report = json.loads(capsys.readouterr().out)
+    assert (report['created'], report['invalid']) == (1, 1)
+    assert custom_api.created == ['a']
@@ -0,0 +1,78 @@
+import asyncio
+
+from aiohttp import web
+from kubernetes_asyncio import client
+
+from agent_operator.utils import clients
+
+VERSION = {
+    'major': '1', 'minor': '30', 'gitVersion': 'v1.30.0', 'gitCommit': '',
+    'gitTreeState': 'clean', 'buildDate': '', 'goVersion': 'go1.22',
+    'compiler': 'gc', 'platform': 'linux/amd64'
+}
+
+
+async def _with_local_apiserver(test):
+    async def version(request):
+        return web.json_response(VERSION)
+
+    app = web.Application()
+    app.router.add_get('/version/', version)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        await clients.init_clients(configuration=client.Configuration(host=f'http://127.0.0.1:{port}'))
+        await test()
+    finally:
+        await clients.close_clients()
+        await runner.cleanup()
+
+
+def test_clients_are_shared():
+    """The same API objects are returned to every caller"""
+    async def test():
+        assert await clients.get_core_api() is await clients.get_core_api()
+        core_api = await clients.get_core_api()
+        custom_api = await clients.get_custom_api()
+        assert core_api.api_client is custom_api.api_client
+
+    asyncio.run(_with_local_apiserver(test))
+
+
+def test_pool_stats_count_reused_connections():
+    """Requests after the first one reuse the pooled keep-alive connection"""
+    async def test():
+        api = client.VersionApi(await clients.get_api_client())
+        for _ in range(3):
+            await api.get_code()
+
+        stats = clients.pool_stats()
+        assert stats['requests'] == 3
+        assert stats['misses'] == 1
+        assert stats['hits'] == 2
+
+    asyncio.run(_with_local_apiserver(test))
+
+
+def test_concurrency_is_bounded():
+    """Reconciles beyond the semaphore size wait for a free slot"""
+    async def test():
+        await clients.close_clients()
+        await clients.init_clients(max_concurrency=2, configuration=client.Configuration(host='http://127.0.0.1:1'))
+        running = []
+        peak = []
+
+        async def reconcile():
+            async with clients.concurrency():
+                running.append(1)
+                peak.append(len(running))
+                await asyncio.sleep(0.01)
+                running.pop()
+
+        await asyncio.gather(*(reconcile() for _ in range(10)))
+        assert max(peak) == 2
+
+    asyncio.run(_with_local_apiserver(test))
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from agent_operator.handlers import create
+from agent_operator.handlers.create import SPEC_HASH_ANNOTATION, build_agent_pod, pod_spec_hash
+
+from .fakes import FakeCoreApi, install_core_api, provide
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+SPEC = {'agent': {'image': 'nginx:latest'}}
+
+
+@pytest.fixture
+def core_api(monkeypatch):
+    def install(live=None):
+        provide(monkeypatch, 'get_pod_cache', None, create)
+        return install_core_api(monkeypatch, FakeCoreApi(pods=[live] if live else []), create)
+    return install
+
+
+def live_pod(spec):
+    pod = build_agent_pod('a', 'default', spec, OWNER)
+    pod['metadata']['annotations'] = {SPEC_HASH_ANNOTATION: pod_spec_hash(pod)}
+    return pod
+
+
+def test_new_pod_is_created(core_api):
+    """A missing pod is created with its spec hash annotation"""
+    api = core_api()
+    pod, action = asyncio.run(create.create_agent_pod('a', 'default', SPEC, OWNER))
+
+    assert action == 'created'
+    assert api.verbs() == ['read', 'create']
+    assert pod['metadata']['annotations'][SPEC_HASH_ANNOTATION] == pod_spec_hash(pod)
+
+
+def test_unchanged_pod_skips_writes(core_api):
+    """A retry or restart over an up-to-date pod issues no writes"""
+    api = core_api(live=live_pod(SPEC))
+    _, action = asyncio.run(create.create_agent_pod('a', 'default', SPEC, OWNER))
+
+    assert action == 'unchanged'
+    assert api.verbs() == ['read']
+
+
+def test_drift_is_server_side_applied(core_api):
+    """A changed spec is reconciled with a server-side apply patch"""
+    api = core_api(live=live_pod({'agent': {'image': 'nginx:1.25'}}))
+    _, action = asyncio.run(create.create_agent_pod('a', 'default', SPEC, OWNER))
+
+    assert action == 'patched'
+    assert api.verbs() == ['read', 'patch']
+    assert api.requests[-1].kwargs['_content_type'] == 'application/apply-patch+yaml'
+
+
+def test_immutable_drift_is_not_applied(core_api):
+    """Drift outside container images is reported for replacement, never applied"""
+    drifted = {'agent': {'image': 'nginx:latest', 'environment': {'variables': [{'name': 'A', 'value': '1'}]}}}
+    live = live_pod(drifted)
+    api = core_api(live=live)
+    pod, action = asyncio.run(create.create_agent_pod('a', 'default', SPEC, OWNER))
+
+    assert action == 'drifted'
+    assert pod == live
+    assert api.verbs() == ['read']
+
+
+def test_server_defaults_are_not_drift():
+    """Defaulted fields and the injected service account volume do not block an image patch"""
+    pod = build_agent_pod('a', 'default', SPEC, OWNER)
+    live = build_agent_pod('a', 'default', {'agent': {'image': 'nginx:1.25'}}, OWNER)
+    live['spec']['dnsPolicy'] = 'ClusterFirst'
+    live['spec']['volumes'] = (live['spec'].get('volumes') or []) + [{'name': 'kube-api-access-x1', 'projected': {}}]
+    for container in live['spec']['containers']:
+        container['terminationMessagePath'] = '/dev/termination-log'
+        container['volumeMounts'] = (container.get('volumeMounts') or []) + [{'name': 'kube-api-access-x1', 'mountPath': '/var/run/secrets'}]
+
+    assert create.drift_is_mutable(live, pod)
+
+
+def test_hash_ignores_key_order():
+    """The spec hash does not depend on dict ordering"""
+    pod = build_agent_pod('a', 'default', SPEC, OWNER)
+    reordered = dict(reversed(list(pod.items())))
+    assert pod_spec_hash(pod) == pod_spec_hash(reordered)
@@ -0,0 +1,64 @@
+import asyncio
+
+from agent_operator.utils.events import EventRecorder, event_name
+
+from .fakes import FakeCoreApi, install_core_api
+
+REF = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'namespace': 'default', 'uid': 'uid-a'}
+
+
+def run_recorder(monkeypatch, api, test):
+    install_core_api(monkeypatch, api)
+    recorder = EventRecorder(window=60)
+
+    async def run():
+        await test(recorder)
+        await recorder.close()
+
+    asyncio.run(run())
+    return recorder
+
+
+def test_repeated_reasons_are_aggregated(monkeypatch):
+    """Repeats within a window become one Event with a count"""
+    api = FakeCoreApi()
+
+    async def test(recorder):
+        for i in range(5):
+            recorder.record(REF, 'Warning', 'PodCreationFailed', f"attempt {i}")
+        recorder.record(REF, 'Normal', 'PodCreated', 'Created pod a-pod')
+
+    recorder = run_recorder(monkeypatch, api, test)
+
+    assert sorted((body['reason'], body['count']) for body in api.bodies('create', 'events')) == [('PodCreated', 1), ('PodCreationFailed', 5)]
+    assert api.verbs() == ['create', 'create']
+    assert recorder.stats == {'recorded': 6, 'aggregated': 4, 'written': 2, 'errors': 0}
+
+
+def test_later_windows_patch_the_count(monkeypatch):
+    """An Event already written is only patched with the running count"""
+    api = FakeCoreApi()
+
+    async def test(recorder):
+        recorder.record(REF, 'Warning', 'PodCreationFailed', 'boom')
+        await recorder.flush()
+        recorder.record(REF, 'Warning', 'PodCreationFailed', 'boom')
+        recorder.record(REF, 'Warning', 'PodCreationFailed', 'boom')
+
+    run_recorder(monkeypatch, api, test)
+
+    name = event_name(('default', 'AgentType', 'a', 'uid-a', 'Warning', 'PodCreationFailed'))
+    assert [(verb, name, body['count']) for verb, _, name, body, _ in api.requests] == [('create', name, 1), ('patch', name, 3)]
+
+
+def test_event_from_before_restart_is_patched(monkeypatch):
+    """A create conflict falls back to patching the existing Event"""
+    name = event_name(('default', 'AgentType', 'a', 'uid-a', 'Normal', 'PodCreated'))
+    api = FakeCoreApi(events=[{'metadata': {'name': name, 'namespace': 'default'}, 'count': 4}])
+
+    async def test(recorder):
+        recorder.record(REF, 'Normal', 'PodCreated', 'Created pod a-pod')
+
+    run_recorder(monkeypatch, api, test)
+
+    assert [(verb, body['count']) for verb, _, _, body, _ in api.requests] == [('create', 1), ('patch', 1)]
@@ -0,0 +1,40 @@
+import sys
+
+from agent_operator.utils.lazyimport import LazyPackage, defer_imports
+
+
+def test_deferred_package_imports_exports_on_first_use(tmp_path, monkeypatch):
+    """A deferred package only imports the submodule of an export once it is read"""
+    package = tmp_path / 'lazypkg'
+    package.mkdir()
+    (package / '__init__.py').write_text(
+        '"""docs"""\n__version__ = "1.0"\nfrom lazypkg.heavy import Heavy\nfrom lazypkg.light import light\n')
+    (package / 'heavy.py').write_text('class Heavy:\n    pass\n')
+    (package / 'light.py').write_text('light = 1\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ('lazypkg', 'lazypkg.heavy', 'lazypkg.light'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    assert defer_imports('lazypkg') == ['lazypkg']
+    import lazypkg
+    assert isinstance(lazypkg, LazyPackage)
+    assert lazypkg.__version__ == '1.0'
+    assert 'lazypkg.heavy' not in sys.modules
+
+    from lazypkg.light import light
+    assert light == 1
+    assert 'lazypkg.heavy' not in sys.modules
+    assert lazypkg.Heavy.__name__ == 'Heavy'
+    assert 'lazypkg.heavy' in sys.modules
+
+
+def test_packages_that_run_code_are_imported_as_they_are(tmp_path, monkeypatch):
+    """An __init__ doing more than imports and constants is left alone"""
+    package = tmp_path / 'eagerpkg'
+    package.mkdir()
+    (package / '__init__.py').write_text('import os\nVALUE = os.sep\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'eagerpkg', raising=False)
+
+    assert defer_imports('eagerpkg') == []
+    assert 'eagerpkg' not in sys.modules
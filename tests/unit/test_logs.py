@@ -0,0 +1,63 @@
+import ast
+import json
+import logging
+import pathlib
+
+from agent_operator.utils.logs import RateLimitFilter, StructuredFormatter
+
+
+def record(msg, level=logging.INFO, **extra):
+    entry = logging.LogRecord('test', level, __file__, 1, msg, ('a-pod',), None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def test_rate_limit_is_per_reason():
+    """Each message template has its own budget; warnings always pass"""
+    limit = RateLimitFilter(rate=0.001, burst=2)
+
+    assert [limit.filter(record("Pod %s created")) for _ in range(4)] == [True, True, False, False]
+    assert limit.filter(record("Pod %s patched")) is True
+    assert limit.filter(record("Pod %s created", level=logging.WARNING)) is True
+
+
+def test_explicit_reason_overrides_template():
+    """Records sharing a `reason` extra share its budget"""
+    limit = RateLimitFilter(rate=0.001, burst=1)
+
+    assert limit.filter(record("first %s", reason='PodCreated')) is True
+    assert limit.filter(record("second %s", reason='PodCreated')) is False
+
+
+def test_suppressed_count_is_reported():
+    """The next record let through says how many were dropped before it"""
+    limit = RateLimitFilter(rate=0.001, burst=1)
+    limit.filter(record("Pod %s created"))
+    limit.filter(record("Pod %s created"))
+    # Simulate the bucket refilling
+    limit._buckets["Pod %s created"].tokens = 1
+
+    passed = record("Pod %s created")
+    assert limit.filter(passed) is True
+    assert passed.suppressed == 1
+
+
+def test_structured_formatter_includes_extras():
+    """Records render as JSON with their extra fields"""
+    line = json.loads(StructuredFormatter().format(record("Pod %s created", reason='PodCreated')))
+
+    assert line['message'] == 'Pod a-pod created'
+    assert line['reason'] == 'PodCreated'
+    assert line['level'] == 'INFO'
+
+
+def test_operator_logs_with_constant_templates():
+    """No log call formats its message eagerly, so rate limits key on the call site"""
+    eager = []
+    for path in (pathlib.Path(__file__).resolve().parents[2] / 'operator').rglob('*.py'):
+        for node in ast.walk(ast.parse(path.read_text())):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and isinstance(node.func.value, ast.Name) and node.func.value.id == 'logger'
+                    and node.args and not isinstance(node.args[0], ast.Constant)):
+                eager.append(f"{path.name}:{node.lineno}")
+    assert eager == []
@@ -0,0 +1,79 @@
+import asyncio
+import urllib.request
+
+import kopf
+import pytest
+
+from agent_operator.utils import metrics
+
+
+@pytest.fixture
+def scrape():
+    port = metrics.start_metrics_server(0, addr='127.0.0.1')
+
+    def _scrape():
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            return response.read().decode()
+
+    yield _scrape
+    metrics.stop_metrics_server()
+
+
+def test_handler_duration_and_outcome_are_exported(scrape):
+    """Handler timings are labelled by handler, resource and outcome"""
+    @metrics.timed_handler('test_handler', 'agenttypes')
+    async def handler(**kwargs):
+        if kwargs.get('fail'):
+            raise kopf.PermanentError("boom")
+
+    asyncio.run(handler(retry=0))
+    with pytest.raises(kopf.PermanentError):
+        asyncio.run(handler(retry=1, fail=True))
+
+    text = scrape()
+    assert 'agent_operator_handler_duration_seconds_count{handler="test_handler",outcome="success",resource="agenttypes"} 1.0' in text
+    assert 'agent_operator_handler_duration_seconds_count{handler="test_handler",outcome="permanent_error",resource="agenttypes"} 1.0' in text
+    assert 'agent_operator_handler_retries_total{handler="test_handler",resource="agenttypes"} 1.0' in text
+
+
+def test_api_call_latency_is_labelled_by_verb_and_resource(scrape):
+    """API calls are recorded per verb, resource and status code"""
+    async def create_namespaced_pod():
+        pass
+
+    with metrics.observe_api_call(*metrics.api_call_labels(create_namespaced_pod)):
+        pass
+
+    assert 'agent_operator_api_call_duration_seconds_count{code="200",resource="pod",verb="create"}' in scrape()
+
+
+def test_stats_collector_exports_counters(scrape):
+    """Dict-based counters such as the pool stats are exposed as one metric"""
+    metrics.register_stats('agent_operator_test_pool', 'test counters', lambda: {'hits': 3, 'misses': 1})
+
+    text = scrape()
+    assert 'agent_operator_test_pool_total{kind="hits"} 3.0' in text
+    assert 'agent_operator_test_pool_total{kind="misses"} 1.0' in text
+
+
+def test_kopf_lists_are_counted_as_relists(monkeypatch):
+    """kopf's first LIST of a resource counts as initial, each later one as expired"""
+    from kopf._cogs.clients import fetching
+
+    calls = []
+
+    def fetch_objs(*, resource, namespace, **kwargs):
+        calls.append((resource.plural, namespace))
+        return 'listing'
+
+    monkeypatch.setattr(fetching, 'fetch_objs', fetch_objs, raising=False)
+    monkeypatch.delattr(fetching, 'list_objs', raising=False)
+    assert metrics.count_kopf_relists()
+    resource = kopf.Resource('agents.example.com', 'v1', 'widgets')
+    count = metrics.REGISTRY.get_sample_value
+
+    assert fetching.fetch_objs(resource=resource, namespace=None, settings=None) == 'listing'
+    fetching.fetch_objs(resource=resource, namespace=None, settings=None)
+    assert calls == [('widgets', None)] * 2
+    assert count('agent_operator_informer_relists_total', {'resource': 'widgets', 'cause': 'initial'}) == 1
+    assert count('agent_operator_informer_relists_total', {'resource': 'widgets', 'cause': 'expired'}) == 1
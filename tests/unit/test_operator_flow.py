@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import pathlib
+
+import pytest
+from kubernetes_asyncio import client
+
+from agent_operator import main
+from agent_operator.utils import clients, podcache, quota, rollout, schema
+from agent_operator.utils.schema import InvalidSpec
+
+from benchmarks.fake_apiserver import FakeApiServer
+
+GROUP = 'agents.example.com'
+
+
+@pytest.fixture
+def apiserver(monkeypatch):
+    server = FakeApiServer().start()
+
+    async def load_kube_config():
+        client.Configuration.set_default(client.Configuration(host=server.url))
+
+    monkeypatch.setattr(clients, 'load_kube_config', load_kube_config)
+    monkeypatch.setenv('METRICS_PORT', '0')
+    monkeypatch.setenv('STATUS_PATCH_WINDOW', '0.01')
+    monkeypatch.setenv('EVENT_FLUSH_WINDOW', '0.01')
+    # Restored on teardown, so a failed test leaves no process-wide cache behind
+    for module, name in ((podcache, '_cache'), (podcache, '_task'), (quota, '_cache'), (rollout, '_rollout'), (schema, '_validator')):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def run_operator(test):
+    """Run `test(logger)` between the operator's startup and cleanup hooks"""
+    async def run():
+        logger = logging.getLogger('test')
+        await main.init_api_clients(logger=logger)
+        try:
+            await podcache.get_pod_cache().synced.wait()
+            await test(logger)
+        finally:
+            await main.close_api_clients(logger=logger)
+
+    asyncio.run(run())
+
+
+def agent(server, name):
+    return server.put('agenttypes', {
+        'apiVersion': f"{GROUP}/v1",
+        'kind': 'AgentType',
+        'metadata': {'name': name, 'namespace': 'default'},
+        'spec': {'agent': {'image': 'nginx:latest'}}
+    }, group=GROUP)
+
+
+async def handle(body):
+    return await main.create_agent(
+        spec=body['spec'], name=body['metadata']['name'], namespace='default',
+        logger=logging.getLogger('test'), body=body, retry=0
+    )
+
+
+def test_create_and_resume_against_apiserver(apiserver):
+    """The handler creates the pod once; a resume issues no further writes"""
+    body = agent(apiserver, 'flow')
+
+    async def test(logger):
+        assert (await handle(body))['status'] == 'created'
+        await asyncio.sleep(0.1)
+        apiserver.reset_counters()
+
+        assert (await handle(body))['status'] == 'unchanged'
+
+    run_operator(test)
+
+    pods = apiserver.list('pods')
+    assert [p['metadata']['name'] for p in pods] == ['flow-pod']
+    assert pods[0]['metadata']['ownerReferences'][0]['name'] == 'flow'
+    assert apiserver.total_calls(verbs=('create', 'patch', 'update', 'delete')) == 0
+    stored = apiserver.list('agenttypes', group=GROUP)[0]
+    assert any(c['reason'] == 'PodCreated' for c in stored['status']['conditions'])
+    events = apiserver.list('events', namespace='default')
+    assert [(e['reason'], e['count']) for e in events] == [('PodCreated', 1)]
+
+
+def test_invalid_spec_fails_before_any_write(apiserver):
+    """With the CRD served, an invalid spec is rejected locally and no pod is created"""
+    crd = schema.load_crd(pathlib.Path(__file__).resolve().parents[2] / 'base' / 'crd' / 'agenttype.yaml')
+    apiserver.put('customresourcedefinitions', crd, group='apiextensions.k8s.io')
+    body = agent(apiserver, 'broken')
+    body['spec'] = {'agent': {'environment': {}}}
+
+    async def test(logger):
+        apiserver.reset_counters()
+        with pytest.raises(InvalidSpec, match='spec.agent.image: Required value'):
+            await handle(body)
+
+    run_operator(test)
+
+    assert apiserver.list('pods') == []
+    assert ('create', 'pods') not in apiserver.calls
+
+
+def test_delete_removes_pods_in_one_call(apiserver):
+    """The delete handler removes the pods with one deletecollection and writes no status afterwards"""
+    body = agent(apiserver, 'gone')
+
+    async def test(logger):
+        await handle(body)
+        await asyncio.sleep(0.1)
+        apiserver.reset_counters()
+
+        await main.delete_agent(name='gone', namespace='default', logger=logger, retry=0)
+        await asyncio.sleep(0.1)
+        assert podcache.get_pod_cache().pods_for_app('gone') == []
+
+    run_operator(test)
+
+    assert apiserver.list('pods') == []
+    # The pod DELETED event must not patch the status of the deleted AgentType
+    assert apiserver.total_calls() == apiserver.total_calls(verbs=('deletecollection',)) == 1
+
+
+def test_delete_is_skipped_only_when_all_pods_are_terminating(monkeypatch):
+    """An empty cache is no proof the pods are gone; terminating pods are"""
+    from agent_operator.handlers import delete
+
+    class Cache:
+        synced = asyncio.Event()
+
+        def __init__(self, pods):
+            self.pods = pods
+
+        def pods_for_app(self, app):
+            return self.pods
+
+    Cache.synced.set()
+    terminating = {'metadata': {'namespace': 'default', 'deletionTimestamp': '2026-01-01T00:00:00Z'}}
+    running = {'metadata': {'namespace': 'default'}}
+    for pods, pending in (([], True), ([terminating], False), ([terminating, running], True)):
+        monkeypatch.setattr(delete, 'get_pod_cache', lambda: Cache(pods))
+        assert delete._pods_pending_deletion('default', 'a') is pending
+
+
+def test_adopted_agents_are_reconciled_like_created_ones(apiserver, monkeypatch):
+    """Shard adoption packs opted-in AgentTypes and leaves scaled-to-zero ones without a pod"""
+    from agent_operator.handlers import shard
+    from agent_operator.utils.sharding import HashRing
+
+    monkeypatch.setenv('PACKING_MAX_AGENTS', '4')
+    monkeypatch.setenv('PACKING_WINDOW', '0.01')
+    monkeypatch.setattr(shard, 'get_membership', lambda: type('Membership', (), {'identity': 'me'}))
+    packed = agent(apiserver, 'packed')
+    packed['spec']['packing'] = {'enabled': True}
+    apiserver.put('agenttypes', packed, group=GROUP)
+    idle = agent(apiserver, 'idle')
+    idle['spec']['scaling'] = {'minReplicas': 0, 'maxReplicas': 2, 'target': 10}
+    idle['status'] = {'scaling': {'replicas': 0}}
+    apiserver.put('agenttypes', idle, group=GROUP)
+
+    async def test(logger):
+        await shard.adopt_shard(HashRing(['other']), HashRing(['me']))
+        await asyncio.sleep(0.1)
+
+    run_operator(test)
+
+    pods = apiserver.list('pods')
+    assert len(pods) == 1
+    assert podcache.is_packed(pods[0])
+    assert pods[0]['metadata']['ownerReferences'][0]['name'] == 'packed'
@@ -0,0 +1,178 @@
+import asyncio
+
+from agent_operator.handlers import podstatus
+from agent_operator.utils import packing
+from agent_operator.utils.packing import (
+    PAUSE_IMAGE, PodPacker, build_packed_pod, member_container, member_container_name, packing_class, pod_members
+)
+from agent_operator.utils.podcache import PodCache, is_packed
+from agent_operator.utils.status import StatusWriter
+
+from .fakes import FakeCoreApi, install_core_api, provide, run_queued
+
+SPEC = {'agent': {'image': 'agent:1'}, 'packing': {'enabled': True}}
+KEY = ('default', '', 'default')
+
+
+def owner(name):
+    return {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': name, 'uid': f"uid-{name}"}
+
+
+def run_packing(monkeypatch, api, test, cache=None):
+    """Run `test()` with packing talking to `api` through a one-worker queue"""
+    install_core_api(monkeypatch, api)
+    provide(monkeypatch, 'get_pod_cache', cache, packing)
+
+    async def run(queue):
+        await test()
+
+    run_queued(monkeypatch, run, packing)
+
+
+async def settle():
+    """Let batch timers, queued pod changes and repacks finish"""
+    for _ in range(10):
+        await asyncio.sleep(0.01)
+
+
+def live_pods(api):
+    return sorted(api.store['pods'].values(), key=lambda pod: pod['metadata']['name'])
+
+
+def test_packing_class_needs_opt_in_and_nothing_pod_wide():
+    """Opted-in agents are grouped by namespace, runtime and resource class; pod-wide features opt out"""
+    assert packing_class('default', SPEC) == KEY
+    assert packing_class('default', {'agent': {'image': 'agent:1'}}) is None
+    assert packing_class('team', dict(SPEC, packing={'enabled': True, 'resourceClass': 'large'})) == ('team', '', 'large')
+    runtime = {'agent': {'image': 'agent:1', 'environment': {'sdk': {'runtime': 'python'}}}}
+    assert packing_class('default', dict(SPEC, **runtime)) == ('default', 'python', 'default')
+    assert packing_class('default', dict(SPEC, toolProxy={'upstream': 'http://tools:8000'})) is None
+    assert packing_class('default', dict(SPEC, agent={'image': 'agent:1', 'warmStart': True})) is None
+
+
+def test_packed_pod_isolates_members():
+    """Each member gets its own container, volume subPath and ownerReference"""
+    members = [(name, member_container(name, SPEC), owner(name)) for name in ('a', 'b')]
+    pod = build_packed_pod('default', KEY, members)
+
+    assert is_packed(pod)
+    assert [container['name'] for container in pod['spec']['containers']] == ['agent-a', 'agent-b']
+    assert {mount['subPath'] for mount in pod['spec']['containers'][1]['volumeMounts']} == {'b'}
+    assert [ref['name'] for ref in pod['metadata']['ownerReferences']] == ['a', 'b']
+    assert sorted(pod_members(pod)) == ['a', 'b']
+    assert 'mkdir -p /shared/b' in pod['spec']['initContainers'][0]['args'][0]
+    assert len(member_container_name('x' * 63)) <= 63
+
+
+def test_burst_of_agents_shares_pods(monkeypatch):
+    """Agents arriving together fill one pod up to max_agents; the rest start the next"""
+    api = FakeCoreApi()
+
+    async def test():
+        packer = PodPacker(max_agents=3, window=0.01)
+        results = await asyncio.gather(*(packer.assign(name, 'default', SPEC, owner(name)) for name in 'abcd'))
+        assert {action for _, action in results} == {'packed'}
+        assert [len(pod['spec']['containers']) for pod in live_pods(api)] == [3, 1]
+        assert results[0][0] is results[2][0]
+        assert await packer.assign('a', 'default', SPEC, owner('a')) == (results[0][0], 'unchanged')
+
+    run_packing(monkeypatch, api, test)
+
+
+def test_release_pauses_member_and_deletes_empty_pod(monkeypatch):
+    """A departing member's container is paused; the pod goes with its last member"""
+    api = FakeCoreApi()
+
+    async def test():
+        packer = PodPacker(max_agents=2, window=0.01, min_fill=0)
+        (pod, _), _ = await asyncio.gather(*(packer.assign(name, 'default', SPEC, owner(name)) for name in 'ab'))
+
+        assert await packer.release('default', 'a')
+        images = {c['name']: c['image'] for c in api.get('pods', 'default', pod['metadata']['name'])['spec']['containers']}
+        assert images == {'agent-a': PAUSE_IMAGE, 'agent-b': 'agent:1'}
+
+        assert await packer.release('default', 'b')
+        assert not await packer.release('default', 'b')
+        assert api.store['pods'] == {}
+
+    run_packing(monkeypatch, api, test)
+
+
+def test_changed_agent_is_repacked(monkeypatch):
+    """A member whose container changed leaves its pod and joins a new one"""
+    api = FakeCoreApi()
+
+    async def test():
+        packer = PodPacker(max_agents=2, window=0.01, min_fill=0)
+        await asyncio.gather(*(packer.assign(name, 'default', SPEC, owner(name)) for name in 'ab'))
+
+        pod, action = await packer.assign('a', 'default', dict(SPEC, agent={'image': 'agent:2'}), owner('a'))
+        assert action == 'repacked'
+        assert pod['spec']['containers'][0]['image'] == 'agent:2'
+        assert packer.member_pod('default', 'a') is pod
+
+    run_packing(monkeypatch, api, test)
+
+
+def test_underfilled_pods_are_merged(monkeypatch):
+    """Two pods left mostly empty have their members moved into one new pod"""
+    api = FakeCoreApi()
+
+    async def test():
+        packer = PodPacker(max_agents=4, window=0.01, min_fill=0.5)
+        await asyncio.gather(*(packer.assign(name, 'default', SPEC, owner(name)) for name in ('a1', 'a2')))
+        await asyncio.gather(*(packer.assign(name, 'default', SPEC, owner(name)) for name in ('b1', 'b2')))
+        assert len(api.store['pods']) == 2
+
+        await packer.release('default', 'a1')
+        await packer.release('default', 'b1')
+        await settle()
+
+        pods = live_pods(api)
+        assert len(pods) == 1
+        assert sorted(pod_members(pods[0])) == ['a2', 'b2']
+        assert packer.member_pod('default', 'a2') is packer.member_pod('default', 'b2')
+        assert packer.stats['repacked'] == 2
+
+    run_packing(monkeypatch, api, test)
+
+
+def test_restarted_packer_adopts_its_pods(monkeypatch):
+    """Membership is read back from cached packed pods, with paused members counted as gone"""
+    pod = build_packed_pod('default', KEY, [(name, member_container(name, SPEC), owner(name)) for name in 'ab'])
+    pod['metadata'].update(name='agents-packed-0', uid='uid-packed')
+    pod['spec']['containers'][0]['image'] = PAUSE_IMAGE
+    api = FakeCoreApi(pods=[pod])
+
+    async def test():
+        cache = PodCache(api)
+        await cache.relist()
+        provide(monkeypatch, 'get_pod_cache', cache, packing)
+        packer = PodPacker(max_agents=2, window=0.01)
+
+        assert (await packer.assign('b', 'default', SPEC, owner('b')))[1] == 'unchanged'
+        assert packer.pods[('default', 'agents-packed-0')].live() == ['b']
+        assert api.verbs('pods') == ['list']
+
+    run_packing(monkeypatch, api, test)
+
+
+def test_packed_pod_status_is_mirrored_per_member(monkeypatch):
+    """Each live member's AgentType reports its own container's readiness"""
+    pod = build_packed_pod('default', KEY, [(name, member_container(name, SPEC), owner(name)) for name in 'abc'])
+    pod['metadata'].update(name='agents-packed-0', uid='uid-packed')
+    pod['spec']['containers'][2]['image'] = PAUSE_IMAGE
+    pod['status'] = {'phase': 'Running', 'containerStatuses': [
+        {'name': 'agent-a', 'ready': True}, {'name': 'agent-b', 'ready': False}, {'name': 'agent-c', 'ready': True}
+    ]}
+
+    async def test():
+        writer = StatusWriter(window=60)
+        provide(monkeypatch, 'get_status_writer', writer, podstatus)
+        podstatus.reconcile_pod_status('MODIFIED', pod)
+        phases = {name: fields['phase'] for (_, name), fields in writer._pending_fields.items()}
+        for key in list(writer._timers):
+            writer.forget(*key)
+        assert phases == {'a': 'Ready', 'b': 'Running'}
+
+    asyncio.run(test())
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from agent_operator.handlers import create
+from agent_operator.utils import placement
+from agent_operator.utils.placement import ImageLocality, normalize_image
+
+from .fakes import FakeCoreApi, install_core_api, provide
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+GB = 2**30
+
+
+def node(name, images, unschedulable=False):
+    return {
+        'metadata': {'name': name, 'resourceVersion': '1'},
+        'spec': {'unschedulable': unschedulable},
+        'status': {'images': [{'names': names, 'sizeBytes': size} for names, size in images]}
+    }
+
+
+def synced_locality(api, **kwargs):
+    async def run():
+        locality = ImageLocality(api, **kwargs)
+        await locality.nodes.relist()
+        return locality
+    return asyncio.run(run())
+
+
+def test_normalize_image():
+    """Short image names match the fully qualified names nodes report"""
+    assert normalize_image('nginx') == 'docker.io/library/nginx:latest'
+    assert normalize_image('team/agent:1.0') == 'docker.io/team/agent:1.0'
+    assert normalize_image('registry.local:5000/agent') == 'registry.local:5000/agent:latest'
+    assert normalize_image('ghcr.io/org/agent@sha256:abc') == 'ghcr.io/org/agent@sha256:abc'
+
+
+def test_affinity_prefers_nodes_with_large_images():
+    """Nodes holding the large image are preferred; small and unschedulable-node images are ignored"""
+    api = FakeCoreApi(nodes=[
+        node('n1', [(['docker.io/team/agent:1.0'], 2 * GB), (['docker.io/library/busybox:latest'], GB // 1000)]),
+        node('n2', [(['team/agent:1.0'], 2 * GB)]),
+        node('n3', [(['docker.io/team/agent:1.0'], 2 * GB)], unschedulable=True),
+        node('n4', [(['docker.io/library/busybox:latest'], GB // 1000)])
+    ])
+    locality = synced_locality(api)
+    pod = {'spec': {'initContainers': [{'image': 'busybox'}], 'containers': [{'image': 'team/agent:1.0'}]}}
+
+    report = locality.place(pod)
+
+    terms = pod['spec']['affinity']['nodeAffinity']['preferredDuringSchedulingIgnoredDuringExecution']
+    assert terms == [{'weight': 100, 'preference': {'matchExpressions': [{'key': 'kubernetes.io/hostname', 'operator': 'In', 'values': ['n1', 'n2']}]}}]
+    assert report['preferredNodes'] == 2
+    assert report['estimatedPullSavingsBytes'] == 2 * GB
+
+
+def test_no_affinity_when_no_node_holds_the_image():
+    """Pods whose images are nowhere yet are left to the scheduler"""
+    locality = synced_locality(FakeCoreApi(nodes=[node('n1', [(['docker.io/other:1'], GB)])]))
+    pod = {'spec': {'containers': [{'image': 'team/agent:1.0'}]}}
+
+    assert locality.place(pod) is None
+    assert 'affinity' not in pod['spec']
+    assert locality.stats == {'local': 0, 'none': 1}
+
+
+def test_created_pod_keeps_spec_hash_without_affinity(monkeypatch):
+    """Affinity is added after hashing, so a later node change never looks like drift"""
+    api = FakeCoreApi(nodes=[node('n1', [(['docker.io/team/agent:1.0'], 2 * GB)])])
+    locality = synced_locality(api)
+
+    install_core_api(monkeypatch, api, create)
+    provide(monkeypatch, 'get_pod_cache', None, create)
+    monkeypatch.setattr(placement, '_placement', locality)
+    spec = {'agent': {'image': 'team/agent:1.0'}}
+
+    pod, action = asyncio.run(create.create_agent_pod('a', 'default', spec, OWNER))
+
+    assert action == 'created'
+    assert pod['spec']['affinity']['nodeAffinity']
+    assert create.stored_spec_hash(pod) == create.pod_spec_hash(create.build_agent_pod('a', 'default', spec, OWNER))
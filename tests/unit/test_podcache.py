@@ -0,0 +1,163 @@
+import asyncio
+
+from agent_operator.handlers import podstatus
+from agent_operator.utils.checkpoint import Checkpoint
+from agent_operator.utils.informer import Expired
+from agent_operator.utils.podcache import PodCache
+
+from .fakes import FakeCoreApi, FakeResponse
+
+
+def make_pod(name, owner_uid, app, namespace='default', rv='1', phase='Pending'):
+    return {
+        'metadata': {
+            'name': name,
+            'namespace': namespace,
+            'resourceVersion': rv,
+            'labels': {'app': app, 'managed-by': 'agent-operator'},
+            'ownerReferences': [{'kind': 'AgentType', 'name': app, 'uid': owner_uid}]
+        },
+        'status': {'phase': phase}
+    }
+
+
+def scripted_api(lists, watches):
+    api = FakeCoreApi()
+    api.script('pods', lists, watches)
+    return api
+
+
+def pod_list(pods, rv):
+    return FakeResponse({'items': pods, 'metadata': {'resourceVersion': rv}})
+
+
+def test_cache_indexes_pods():
+    """Pods can be looked up by owner UID, app label and namespace"""
+    async def test():
+        api = scripted_api([pod_list([make_pod('a-pod', 'uid-a', 'a'), make_pod('b-pod', 'uid-b', 'b', namespace='other')], '10')], [])
+        cache = PodCache(api)
+        await cache.relist()
+
+        assert cache.get_pod('default', 'a-pod')['metadata']['name'] == 'a-pod'
+        assert [p['metadata']['name'] for p in cache.pods_for_owner('uid-b')] == ['b-pod']
+        assert [p['metadata']['name'] for p in cache.pods_for_app('a')] == ['a-pod']
+        assert [p['metadata']['name'] for p in cache.pods_in_namespace('other')] == ['b-pod']
+        assert api.requests[0].kwargs['label_selector'] == 'managed-by=agent-operator'
+        assert cache.resource_version == '10'
+
+    asyncio.run(test())
+
+
+def test_watch_applies_events_and_bookmarks():
+    """Watch events update the indexes; bookmarks only advance the resourceVersion"""
+    async def test():
+        events = [
+            {'type': 'ADDED', 'object': make_pod('c-pod', 'uid-c', 'c', rv='11')},
+            {'type': 'DELETED', 'object': make_pod('a-pod', 'uid-a', 'a', rv='12')},
+            {'type': 'BOOKMARK', 'object': {'metadata': {'resourceVersion': '15'}}},
+        ]
+        api = scripted_api([pod_list([make_pod('a-pod', 'uid-a', 'a')], '10')], [FakeResponse(lines=events)])
+        cache = PodCache(api)
+        await cache.relist()
+        await cache.watch()
+
+        assert cache.pods_for_owner('uid-a') == []
+        assert len(cache.pods_for_owner('uid-c')) == 1
+        assert cache.resource_version == '15'
+        assert cache.stats['bookmarks'] == 1
+        assert api.requests[1].kwargs['allow_watch_bookmarks'] is True
+        assert api.requests[1].kwargs['resource_version'] == '10'
+
+    asyncio.run(test())
+
+
+def test_expired_watch_triggers_resync():
+    """A 410 from the watch makes the informer relist and emit the differences"""
+    async def test():
+        gone = [{'type': 'ERROR', 'object': {'code': 410, 'message': 'too old'}}]
+        api = scripted_api(
+            [pod_list([make_pod('a-pod', 'uid-a', 'a')], '10'), pod_list([make_pod('b-pod', 'uid-b', 'b')], '20')],
+            [FakeResponse(lines=gone)]
+        )
+        cache = PodCache(api)
+        seen = []
+        cache.add_listener(lambda event_type, pod: seen.append((event_type, pod['metadata']['name'])))
+        await cache.relist()
+        try:
+            await cache.watch()
+        except Expired:
+            await cache.relist()
+
+        assert ('DELETED', 'a-pod') in seen
+        assert ('ADDED', 'b-pod') in seen
+        assert cache.resource_version == '20'
+
+    asyncio.run(test())
+
+
+def test_restart_resumes_from_checkpoint(tmp_path):
+    """A cache restored from its checkpoint watches from the saved version instead of listing"""
+    async def test():
+        path = str(tmp_path / 'pods.json.gz')
+        first = PodCache(scripted_api([pod_list([make_pod('a-pod', 'uid-a', 'a'), make_pod('b-pod', 'uid-b', 'b')], '10')], []),
+                         checkpoint=Checkpoint(path))
+        await first.relist()
+        await first.save()
+
+        events = [{'type': 'DELETED', 'object': make_pod('b-pod', 'uid-b', 'b', rv='11')}]
+        api = scripted_api([], [FakeResponse(lines=events)])
+        cache = PodCache(api, checkpoint=Checkpoint(path))
+        assert await cache.restore()
+        await cache.watch()
+
+        assert api.verbs() == ['watch']
+        assert api.requests[0].kwargs['resource_version'] == '10'
+        assert [pod['metadata']['name'] for pod in cache.store.values()] == ['a-pod']
+        assert cache.synced.is_set()
+        assert cache.stats['restored'] == 2
+
+    asyncio.run(test())
+
+
+def test_unreadable_checkpoint_falls_back_to_listing(tmp_path):
+    """A missing or corrupt checkpoint is ignored, and list and watch bytes are counted"""
+    async def test():
+        path = tmp_path / 'pods.json.gz'
+        path.write_bytes(b'not gzip')
+        api = scripted_api([pod_list([make_pod('a-pod', 'uid-a', 'a')], '10')], [])
+        cache = PodCache(api, checkpoint=Checkpoint(str(path)))
+
+        assert not await cache.restore()
+        assert cache.checkpoint.stats['errors'] == 1
+        await cache.relist()
+        assert cache.stats['relists'] == 1
+        assert cache.stats['list_bytes'] > 0
+
+    asyncio.run(test())
+
+
+def test_pod_status_reconciler_updates_owner(monkeypatch):
+    """Pod events are mirrored onto the owning AgentType status"""
+    class Writer:
+        def __init__(self):
+            self.fields = {}
+            self.conditions = []
+
+        def set_fields(self, namespace, name, **fields):
+            self.fields[(namespace, name)] = fields
+
+        def update(self, namespace, name, condition):
+            self.conditions.append(condition)
+
+        def is_deleted(self, namespace, name):
+            return False
+
+    writer = Writer()
+    monkeypatch.setattr(podstatus, 'get_status_writer', lambda: writer)
+    pod = make_pod('a-pod', 'uid-a', 'a', phase='Running')
+    pod['status']['conditions'] = [{'type': 'Ready', 'status': 'True'}]
+
+    podstatus.reconcile_pod_status('MODIFIED', pod)
+
+    assert writer.fields[('default', 'a')] == {'phase': 'Ready'}
+    assert writer.conditions[0]['status'] == 'True'
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from agent_operator.handlers import create
+from agent_operator.handlers.create import build_agent_pod
+from agent_operator.utils.quota import QuotaCache, QuotaExceeded, parse_quantity, pod_usage
+
+from .fakes import FakeCoreApi, install_core_api, provide
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+SPEC = {
+    'agent': {'image': 'nginx:latest'},
+    'sidecar': {'image': 'busybox:latest', 'resources': {'requests': {'cpu': '250m', 'memory': '64Mi'}, 'limits': {'memory': '128Mi'}}}
+}
+
+
+def quota(hard, used, name='compute'):
+    return {'metadata': {'name': name, 'namespace': 'default', 'resourceVersion': '1'}, 'spec': {'hard': hard}, 'status': {'hard': hard, 'used': used}}
+
+
+def limit_range(default_request):
+    return {
+        'metadata': {'name': 'defaults', 'namespace': 'default', 'resourceVersion': '1'},
+        'spec': {'limits': [{'type': 'Container', 'defaultRequest': default_request}]}
+    }
+
+
+def synced_cache(api):
+    async def run():
+        cache = QuotaCache(api)
+        await cache.quotas.relist()
+        await cache.limit_ranges.relist()
+        return cache
+    return asyncio.run(run())
+
+
+def test_parse_quantity():
+    assert parse_quantity('250m') == 0.25
+    assert parse_quantity('64Mi') == 64 * 2**20
+    assert parse_quantity('1k') == 1000
+    assert parse_quantity(2) == 2
+    with pytest.raises(ValueError):
+        parse_quantity('1Xi')
+
+
+def test_pod_usage_applies_limit_range_defaults():
+    """Containers without requests are charged the LimitRange defaults"""
+    pod = build_agent_pod('a', 'default', SPEC, OWNER)
+    usage = pod_usage(pod, [limit_range({'cpu': '100m'})])
+
+    # agent 100m + sidecar 250m; the init container's 100m is smaller
+    assert usage['requests.cpu'] == pytest.approx(0.35)
+    assert usage['cpu'] == usage['requests.cpu']
+    assert usage['limits.memory'] == 128 * 2**20
+    assert usage['pods'] == 1
+
+
+def test_check_rejects_pods_over_quota():
+    """A pod that would exceed a hard limit is refused locally"""
+    cache = synced_cache(FakeCoreApi(quotas=[quota({'requests.cpu': '1', 'pods': '10'}, {'requests.cpu': '900m', 'pods': '3'})]))
+    pod = build_agent_pod('a', 'default', SPEC, OWNER)
+
+    with pytest.raises(QuotaExceeded, match='requests.cpu'):
+        cache.check('default', pod)
+    cache.check('other', pod)
+
+
+def test_reservations_count_until_quota_status_updates():
+    """Pods created since the last quota status are charged against it"""
+    cache = synced_cache(FakeCoreApi(quotas=[quota({'pods': '2'}, {'pods': '1'})]))
+    pod = build_agent_pod('a', 'default', SPEC, OWNER)
+
+    cache.check('default', pod)
+    cache.reserve('default', pod)
+    with pytest.raises(QuotaExceeded):
+        cache.check('default', pod)
+
+    cache._on_quota_change('MODIFIED', quota({'pods': '2'}, {'pods': '1'}))
+    cache.check('default', pod)
+
+
+def test_create_over_quota_skips_the_api_write(monkeypatch):
+    """create_agent_pod raises before calling create when the pod cannot fit"""
+    api = FakeCoreApi(quotas=[quota({'pods': '1'}, {'pods': '1'})])
+    cache = synced_cache(api)
+
+    install_core_api(monkeypatch, api, create)
+    provide(monkeypatch, 'get_pod_cache', None, create)
+    provide(monkeypatch, 'get_quota_cache', cache, create)
+
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(create.create_agent_pod('a', 'default', SPEC, OWNER))
+    assert api.verbs('pods') == ['read']
+
+
+def test_wait_for_change_wakes_on_quota_event():
+    """Waiters for a namespace are released by its next quota event"""
+    cache = synced_cache(FakeCoreApi())
+
+    async def run():
+        waiter = asyncio.ensure_future(cache.wait_for_change('default', timeout=5))
+        await asyncio.sleep(0)
+        cache._on_quota_change('MODIFIED', quota({'pods': '5'}, {'pods': '0'}))
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(run())
+    assert cache.stats['waits'] == 1
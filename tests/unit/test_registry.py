@@ -0,0 +1,59 @@
+from agent_operator.utils.registry import AgentRecord, AgentRegistry
+
+UID = '0b7e8f2a-1c3d-4e5f-8a9b-0c1d2e3f4a5b'
+
+
+def pod(name, uid=UID):
+    return {'metadata': {'name': name, 'uid': uid}}
+
+
+def test_track_round_trips_packed_fields():
+    """Packed UID, spec hash and default pod name read back as the original strings"""
+    registry = AgentRegistry()
+    record = registry.track('default', 'a', pod('a-pod'), image='nginx:latest', spec_hash='00ab34cd56ef7890')
+
+    assert record.as_dict() == {
+        'namespace': 'default', 'name': 'a', 'image': 'nginx:latest', 'podName': 'a-pod', 'podUid': UID,
+        'specHash': '00ab34cd56ef7890', 'phase': None, 'lastTransitionTime': None
+    }
+    assert record._pod_name is None
+    assert registry.track('default', 'a', pod('pool-x7k2', uid='not-a-uuid')).pod_name == 'pool-x7k2'
+    assert registry.get('default', 'a').pod_uid == 'not-a-uuid'
+    assert len(registry) == 1
+
+
+def test_repeated_strings_are_shared():
+    """Namespaces, images and phases decoded separately end up as one object each"""
+    registry = AgentRegistry()
+    first = registry.track(''.join(['de', 'fault']), 'a', pod('a-pod'), image=''.join(['nginx', ':1']))
+    second = registry.track(''.join(['def', 'ault']), 'b', pod('b-pod'), image=''.join(['ngi', 'nx:1']))
+
+    assert first.namespace is second.namespace
+    assert first.image is second.image
+    assert not hasattr(first, '__dict__')
+    assert AgentRecord.__slots__
+
+
+def test_transition_time_moves_only_on_phase_change():
+    """Repeating a phase keeps its transition time"""
+    registry = AgentRegistry()
+    record = registry.set_phase('default', 'a', 'Pending')
+    first = record.transition
+    registry.set_phase('default', 'a', 'Pending')
+
+    assert record.transition == first
+    registry.set_phase('default', 'a', 'Ready')
+    assert record.phase == 'Ready'
+    assert registry.stats['transitions'] == 2
+
+
+def test_forget_drops_empty_namespaces():
+    """Forgetting the last agent of a namespace leaves nothing behind"""
+    registry = AgentRegistry()
+    registry.track('default', 'a', pod('a-pod'))
+    registry.forget('default', 'a')
+    registry.forget('default', 'a')
+
+    assert registry.get('default', 'a') is None
+    assert registry._namespaces == {}
+    assert registry.stats['forgotten'] == 1
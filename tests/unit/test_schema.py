@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import pathlib
+
+import pytest
+
+from agent_operator import main
+from agent_operator.handlers import reconcile
+from agent_operator.utils import schema
+from agent_operator.utils.schema import InvalidSpec, SpecValidator, compile_schema, crd_spec_schema, load_crd
+
+CRD = load_crd(pathlib.Path(__file__).resolve().parents[2] / 'base' / 'crd' / 'agenttype.yaml')
+
+
+def validator():
+    return SpecValidator(crd_spec_schema(CRD))
+
+
+def errors_of(spec):
+    with pytest.raises(InvalidSpec) as excinfo:
+        validator().validate(spec)
+    return excinfo.value.errors
+
+
+def test_valid_spec_gets_crd_defaults():
+    """Defaults from the schema are applied, nested ones included, without changing the input"""
+    spec = {'agent': {'image': 'agent:1'}, 'toolProxy': {'upstream': 'http://tools:8000'}, 'packing': {}}
+    defaulted = validator().validate(spec)
+
+    assert defaulted['agent'] == {'image': 'agent:1', 'name': 'agent'}
+    assert defaulted['toolProxy']['port'] == 8080
+    assert defaulted['packing'] == {'enabled': False, 'resourceClass': 'default'}
+    assert 'sidecar' not in defaulted
+    assert spec == {'agent': {'image': 'agent:1'}, 'toolProxy': {'upstream': 'http://tools:8000'}, 'packing': {}}
+
+
+def test_invalid_specs_report_every_error():
+    """Missing, mistyped, out-of-range and unsupported values are reported like the apiserver does"""
+    assert errors_of({'agent': {}}) == ['spec.agent.image: Required value']
+    assert errors_of({'agent': {'image': 'agent:1', 'environment': {'sdk': {'runtime': 'ruby'}}}}) == [
+        'spec.agent.environment.sdk.runtime: Unsupported value: "ruby": supported values: "python", "nodejs"'
+    ]
+    assert errors_of({'agent': {'image': 3}, 'toolProxy': {'upstream': 'http://tools', 'port': 70000}}) == [
+        'spec.agent.image: Invalid value: "integer": spec.agent.image in body must be of type string',
+        'spec.toolProxy.port: Invalid value: 70000: spec.toolProxy.port in body should be less than or equal to 65535'
+    ]
+    assert errors_of({'agent': {'image': 'a', 'environment': {'variables': [{'name': 'A', 'value': 'x'}, {'name': 'B'}]}}}) == [
+        'spec.agent.environment.variables[1].value: Required value'
+    ]
+
+
+def test_unknown_fields_are_pruned_unless_preserved():
+    """Fields the schema does not describe are dropped, as the apiserver stores them"""
+    check = compile_schema({'type': 'object', 'properties': {
+        'a': {'type': 'string'},
+        'free': {'type': 'object', 'x-kubernetes-preserve-unknown-fields': True},
+        'limits': {'type': 'object', 'additionalProperties': {'x-kubernetes-int-or-string': True}}
+    }})
+    errors = []
+    value = check({'a': 'x', 'b': 1, 'free': {'c': 2}, 'limits': {'cpu': '1', 'pods': 2}}, 'spec', errors)
+
+    assert value == {'a': 'x', 'free': {'c': 2}, 'limits': {'cpu': '1', 'pods': 2}}
+    assert errors == []
+
+
+def test_results_are_cached_by_spec_hash():
+    """Equal specs are checked once; the cache is bounded"""
+    checker = SpecValidator(crd_spec_schema(CRD), cache_size=2)
+    for image in ('a', 'b', 'a', 'c', 'b'):
+        checker.validate({'agent': {'image': image}})
+    with pytest.raises(InvalidSpec):
+        checker.validate({'agent': {}})
+    with pytest.raises(InvalidSpec):
+        checker.validate({'agent': {}})
+
+    assert checker.stats == {'hits': 2, 'misses': 5, 'invalid': 2}
+    assert len(checker.cache) == 2
+
+
+def test_invalid_spec_fails_create_without_api_calls(monkeypatch):
+    """create_agent rejects an invalid spec before it reaches the work queue"""
+    monkeypatch.setattr(schema, '_validator', validator())
+
+    def unexpected():
+        raise AssertionError("no pod work expected")
+    monkeypatch.setattr(reconcile, 'get_work_queue', unexpected)
+
+    class Writer:
+        def seed(self, *args):
+            pass
+
+        def update(self, *args):
+            pass
+
+    class Recorder:
+        events = []
+
+        def record(self, ref, event_type, reason, message):
+            self.events.append(reason)
+    monkeypatch.setattr(reconcile, 'get_status_writer', Writer)
+    monkeypatch.setattr(reconcile, 'get_event_recorder', Recorder)
+
+    body = {'metadata': {'name': 'a', 'namespace': 'default', 'uid': 'uid-a'}}
+    with pytest.raises(InvalidSpec):
+        asyncio.run(main.create_agent(spec={'agent': {}}, name='a', namespace='default', logger=logging.getLogger('test'), body=body, retry=0))
+    assert Recorder.events == ['InvalidSpec']
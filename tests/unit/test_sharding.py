@@ -0,0 +1,100 @@
+import asyncio
+import datetime
+from datetime import timezone
+
+from agent_operator.utils import clients
+from agent_operator.utils.sharding import HashRing, ShardMembership
+
+from .fakes import FakeResponse
+
+KEYS = [f"ns-{i % 7}/agent-{i}" for i in range(5000)]
+
+
+def test_ring_spreads_keys_evenly():
+    """Every member owns roughly 1/N of the keys"""
+    ring = HashRing([f"replica-{i}" for i in range(4)])
+    counts = {}
+    for key in KEYS:
+        counts[ring.owner(key)] = counts.get(ring.owner(key), 0) + 1
+
+    assert len(counts) == 4
+    assert all(800 < count < 1700 for count in counts.values())
+
+
+def test_adding_a_member_moves_about_one_nth():
+    """Only keys that now hash to the new member change owner"""
+    before = HashRing([f"replica-{i}" for i in range(4)])
+    after = HashRing([f"replica-{i}" for i in range(5)])
+    moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+
+    assert all(after.owner(key) == 'replica-4' for key in moved)
+    assert 0.1 < len(moved) / len(KEYS) < 0.3
+
+
+class FakeCoordinationApi:
+    def __init__(self, leases):
+        self.leases = leases
+
+    async def list_namespaced_lease(self, **kwargs):
+        return FakeResponse({'items': self.leases})
+
+
+def lease(identity, age):
+    renewed = datetime.datetime.now(timezone.utc) - datetime.timedelta(seconds=age)
+    return {'spec': {
+        'holderIdentity': identity,
+        'leaseDurationSeconds': 30,
+        'renewTime': renewed.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    }}
+
+
+def test_membership_ignores_expired_leases(monkeypatch):
+    """Replicas whose Lease was not renewed in time drop out of the ring"""
+    api = FakeCoordinationApi([lease('a', 1), lease('b', 5), lease('c', 120)])
+
+    async def get_api():
+        return api
+
+    monkeypatch.setattr(clients, 'get_coordination_api', get_api)
+
+    async def test():
+        membership = ShardMembership('default', 'a')
+        changes = []
+        membership.add_listener(lambda old, new: changes.append(new.members))
+
+        assert await membership.refresh() is True
+        assert membership.ring.members == ['a', 'b']
+        assert await membership.refresh() is False
+        assert changes == [['a', 'b']]
+
+    asyncio.run(test())
+
+
+def test_renewal_survives_listener_failures(monkeypatch):
+    """A failing membership listener does not stop the Lease from being renewed"""
+    api = FakeCoordinationApi([lease('a', 1), lease('b', 1)])
+
+    async def get_api():
+        return api
+
+    monkeypatch.setattr(clients, 'get_coordination_api', get_api)
+
+    async def test():
+        membership = ShardMembership('default', 'a', renew_interval=0.01)
+        renewals = []
+
+        async def renew():
+            renewals.append(1)
+
+        def fail(old, new):
+            raise RuntimeError("adoption failed")
+
+        membership.renew = renew
+        membership.add_listener(fail)
+        task = asyncio.create_task(membership.run())
+        await asyncio.sleep(0.1)
+        assert not task.done()
+        assert len(renewals) > 1
+        task.cancel()
+
+    asyncio.run(test())
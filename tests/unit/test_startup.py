@@ -0,0 +1,28 @@
+from agent_operator.utils.startup import StartupTimer, process_age
+
+
+def test_phases_are_consecutive():
+    """Each mark records the time since the previous one"""
+    timer = StartupTimer()
+    timer.mark('imports')
+    timer.mark('api_clients')
+
+    assert list(timer.phases)[-2:] == ['imports', 'api_clients']
+    assert all(seconds >= 0 for seconds in timer.phases.values())
+
+
+def test_first_event_is_recorded_once():
+    """Only the first handled event ends the startup measurement"""
+    timer = StartupTimer()
+
+    assert timer.event_handled() is True
+    first = timer.first_event
+    assert timer.event_handled() is False
+    assert timer.first_event == first
+    assert first >= timer.phases['first_event']
+
+
+def test_process_age_is_since_exec():
+    """The interpreter has been running for a non-negative time"""
+    age = process_age()
+    assert age is None or age >= 0
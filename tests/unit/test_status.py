@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from agent_operator.utils import clients
+from agent_operator.utils.status import StatusWriter, make_condition
+
+from .fakes import FakeResponse
+
+
+class FakeCustomApi:
+    def __init__(self):
+        self.patches = []
+
+    async def patch_namespaced_custom_object_status(self, **kwargs):
+        self.patches.append(kwargs)
+        return FakeResponse({})
+
+
+@pytest.fixture
+def custom_api(monkeypatch):
+    api = FakeCustomApi()
+
+    async def get_custom_api():
+        return api
+
+    monkeypatch.setattr(clients, 'get_custom_api', get_custom_api)
+    return api
+
+
+def test_updates_within_window_are_coalesced(custom_api):
+    """Several phase transitions produce a single status patch"""
+    async def test():
+        writer = StatusWriter(window=0.05)
+        writer.update('default', 'agent', make_condition('Created', 'False', 'Pending'))
+        writer.update('default', 'agent', make_condition('Created', 'True', 'PodCreated'))
+        writer.update('default', 'agent', make_condition('Ready', 'True', 'PodReady'))
+        await asyncio.sleep(0.1)
+
+        assert len(custom_api.patches) == 1
+        conditions = custom_api.patches[0]['body']['status']['conditions']
+        assert {c['type']: c['reason'] for c in conditions} == {'Created': 'PodCreated', 'Ready': 'PodReady'}
+
+    asyncio.run(test())
+
+
+def test_unchanged_status_is_not_patched(custom_api):
+    """Patches that would not change the stored conditions are skipped"""
+    async def test():
+        writer = StatusWriter(window=0.01)
+        writer.seed('default', 'agent', [make_condition('Created', 'True', 'PodCreated')])
+        writer.update('default', 'agent', make_condition('Created', 'True', 'PodCreated'))
+        await asyncio.sleep(0.05)
+
+        assert custom_api.patches == []
+        assert writer.stats['skipped'] == 1
+
+    asyncio.run(test())
+
+
+def test_close_flushes_pending_updates(custom_api):
+    """Shutdown writes pending updates without waiting for the window"""
+    async def test():
+        writer = StatusWriter(window=60)
+        writer.update('default', 'a', make_condition('Created', 'True'))
+        writer.update('default', 'b', make_condition('Created', 'True'))
+        await writer.close()
+
+        assert sorted(p['name'] for p in custom_api.patches) == ['a', 'b']
+
+    asyncio.run(test())
+
+
+def test_deleted_objects_get_no_status_patches(custom_api):
+    """Updates for an object marked as deleted are dropped until it is created again"""
+    async def test():
+        writer = StatusWriter(window=0.01)
+        writer.update('default', 'agent', make_condition('Created', 'True', 'PodCreated'))
+        writer.mark_deleted('default', 'agent')
+        writer.set_fields('default', 'agent', phase='Terminated')
+        await asyncio.sleep(0.05)
+        assert custom_api.patches == []
+
+        writer.seed('default', 'agent', [])
+        writer.set_fields('default', 'agent', phase='Pending')
+        await asyncio.sleep(0.05)
+        assert len(custom_api.patches) == 1
+
+    asyncio.run(test())
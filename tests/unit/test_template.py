@@ -0,0 +1,49 @@
+import pathlib
+
+import yaml
+
+from agent_operator.containers.sidecar import SIDECAR_FIELDS
+from agent_operator.utils.template import PodTemplate, build_pod
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+SPEC = {
+    'agent': {
+        'image': 'nginx:latest',
+        'environment': {'variables': [{'name': 'TEST_VAR', 'value': 'test_value'}]}
+    },
+    'sidecar': {'name': 'tool-manager', 'image': 'busybox:latest', 'command': ['sh']}
+}
+
+
+def test_render_matches_builder_functions():
+    """The memoized renderer produces the same manifest as the builders"""
+    assert PodTemplate().render('a', 'default', SPEC, OWNER) == build_pod('a', 'default', SPEC, OWNER)
+
+
+def test_fragments_are_cached_per_template_key():
+    """Agents with the same image, env and sidecar share rendered containers"""
+    template = PodTemplate(cache_size=8)
+    first = template.render('a', 'default', SPEC, OWNER)
+    second = template.render('b', 'other', SPEC, OWNER)
+
+    assert first['spec']['containers'] is second['spec']['containers']
+    assert second['metadata']['name'] == 'b-pod'
+    assert second['metadata']['namespace'] == 'other'
+    assert template.cache_info().hits == 1
+    assert template.cache_info().misses == 1
+
+
+def test_cache_size_is_bounded():
+    """The fragment cache evicts least recently used entries"""
+    template = PodTemplate(cache_size=2)
+    for i in range(5):
+        template.render('a', 'default', {'agent': {'image': f"image-{i}"}}, OWNER)
+
+    assert template.cache_info().currsize == 2
+
+
+def test_crd_keeps_every_sidecar_field():
+    """Every sidecar field the builder reads is in the CRD schema, so the apiserver does not prune it"""
+    crd = yaml.safe_load((pathlib.Path(__file__).parents[2] / 'base/crd/agenttype.yaml').read_text())
+    spec = crd['spec']['versions'][0]['schema']['openAPIV3Schema']['properties']['spec']['properties']
+    assert set(SIDECAR_FIELDS) | {'name', 'image', 'env'} <= set(spec['sidecar']['properties'])
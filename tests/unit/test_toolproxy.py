@@ -0,0 +1,175 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from agent_operator import toolproxy
+from agent_operator.toolproxy import CachedResponse, ResponseCache, ToolProxy
+from agent_operator.utils.template import PodTemplate, build_pod, operator_image
+
+from .fakes import FakeCoreApi, install_core_api
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+
+
+class StubUpstream:
+    """Tool API that counts calls and the connections they arrived on"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.connections = set()
+
+    async def handle(self, request):
+        self.calls.append((request.method, request.path_qs))
+        self.connections.add(request.transport.get_extra_info('peername'))
+        await asyncio.sleep(self.delay)
+        if request.path == '/private':
+            return web.json_response({'secret': 1}, headers={'Cache-Control': 'no-store'})
+        return web.json_response({'path': request.path_qs, 'call': len(self.calls)})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        return app
+
+
+def run_proxy(test, delay=0.0, **cache_kwargs):
+    """Run `test(client, upstream)` against a proxy in front of a stub upstream"""
+    async def run():
+        upstream = StubUpstream(delay)
+        async with TestServer(upstream.app()) as server:
+            proxy = ToolProxy(str(server.make_url('/')), ResponseCache(**cache_kwargs))
+            async with TestClient(TestServer(toolproxy.make_app(proxy))) as client:
+                await test(client, upstream, proxy)
+
+    asyncio.run(run())
+
+
+def test_repeated_calls_are_served_from_cache():
+    """The second identical GET never reaches the upstream"""
+    async def test(client, upstream, proxy):
+        first = await client.get('/tools/search?q=x')
+        second = await client.get('/tools/search?q=x')
+
+        assert first.headers['X-Cache'] == 'MISS'
+        assert second.headers['X-Cache'] == 'HIT'
+        assert await second.json() == await first.json()
+        assert upstream.calls == [('GET', '/tools/search?q=x')]
+
+    run_proxy(test)
+
+
+def test_identical_concurrent_calls_are_coalesced():
+    """Calls arriving while the same call is in flight share its response"""
+    async def test(client, upstream, proxy):
+        responses = await asyncio.gather(*(client.get('/tools/slow') for _ in range(5)))
+
+        assert sorted(r.headers['X-Cache'] for r in responses) == ['COALESCED'] * 4 + ['MISS']
+        assert len(upstream.calls) == 1
+        assert proxy.cache.stats['coalesced'] == 4
+
+    run_proxy(test, delay=0.05)
+
+
+def test_non_idempotent_and_no_store_calls_are_not_cached():
+    """POSTs always go upstream, and so do responses the upstream marks no-store"""
+    async def test(client, upstream, proxy):
+        for _ in range(2):
+            assert (await client.post('/tools/run', json={'x': 1})).headers['X-Cache'] == 'BYPASS'
+            await client.get('/private')
+
+        assert upstream.calls == [('POST', '/tools/run'), ('GET', '/private')] * 2
+
+    run_proxy(test)
+
+
+def test_upstream_connections_are_reused():
+    """Sequential calls to different tools share one pooled keep-alive connection"""
+    async def test(client, upstream, proxy):
+        for i in range(10):
+            await client.get(f"/tools/{i}")
+
+        assert len(upstream.calls) == 10
+        assert len(upstream.connections) == 1
+
+    run_proxy(test)
+
+
+def test_unreachable_upstream_is_a_bad_gateway():
+    """Connection failures become 502 responses, which are not cached"""
+    async def run():
+        proxy = ToolProxy('http://127.0.0.1:9')
+        async with TestClient(TestServer(toolproxy.make_app(proxy))) as client:
+            response = await client.get('/tools/x')
+            assert response.status == 502
+            assert len(proxy.cache) == 0
+
+    asyncio.run(run())
+
+
+def test_cache_evicts_least_recently_used_and_expired_entries():
+    """Entries leave the cache beyond its size or once their TTL passed"""
+    cache = ResponseCache(max_entries=2, ttl=10)
+    for key in (b'a', b'b'):
+        cache.put(key, CachedResponse(200, toolproxy._Headers(), b'x'), now=0)
+    cache.get(b'a', now=1)
+    cache.put(b'c', CachedResponse(200, toolproxy._Headers([('Cache-Control', 'max-age=2')]), b'x'), now=1)
+
+    assert cache.get(b'b', now=1) is None
+    assert cache.get(b'a', now=5) is not None
+    assert cache.get(b'c', now=5) is None
+    assert cache.stats['evictions'] == 1
+    assert cache.stats['expired'] == 1
+
+
+def test_tool_proxy_is_injected_with_cache_settings():
+    """spec.toolProxy adds the proxy container and points the agent at it"""
+    spec = {
+        'agent': {'image': 'agent:1'},
+        'toolProxy': {'upstream': 'http://tools:8000', 'port': 9000, 'cache': {'ttlSeconds': 30, 'maxEntries': 100}}
+    }
+    pod = PodTemplate(tool_proxy_image='registry.local/agent-operator:1').render('a', 'default', spec, OWNER)
+
+    assert pod == build_pod('a', 'default', spec, OWNER, tool_proxy_image='registry.local/agent-operator:1')
+    agent, proxy = pod['spec']['containers']
+    assert {'name': 'TOOL_PROXY_URL', 'value': 'http://127.0.0.1:9000'} in agent['env']
+    assert proxy['image'] == 'registry.local/agent-operator:1'
+    assert proxy['command'] == ['python', '/app/toolproxy.py']
+    assert proxy['imagePullPolicy'] == 'IfNotPresent'
+    assert {(var['name'], var['value']) for var in proxy['env']} == {
+        ('TOOL_PROXY_UPSTREAM', 'http://tools:8000'), ('TOOL_PROXY_PORT', '9000'), ('TOOL_PROXY_LOAD_PORT', '9091'),
+        ('TOOL_PROXY_CACHE_TTL', '30'), ('TOOL_PROXY_CACHE_SIZE', '100')
+    }
+
+
+
+def test_tool_proxy_image_is_the_operators_own(monkeypatch):
+    """The operator finds its own image through the downward API's pod name"""
+    api = FakeCoreApi(pods=[{
+        'metadata': {'name': 'agent-operator-0', 'namespace': 'system'},
+        'spec': {'containers': [{'name': 'log-shipper', 'image': 'fluent-bit:3'},
+                                {'name': 'operator', 'image': 'registry.local/agent-operator:1.4.2'}]}
+    }])
+    install_core_api(monkeypatch, api)
+
+    assert asyncio.run(operator_image()) is None
+    monkeypatch.setenv('POD_NAME', 'agent-operator-0')
+    monkeypatch.setenv('POD_NAMESPACE', 'system')
+    assert asyncio.run(operator_image()) == 'registry.local/agent-operator:1.4.2'
+    monkeypatch.setenv('POD_NAME', 'gone')
+    assert asyncio.run(operator_image()) is None
+
+def test_load_reports_calls_in_flight():
+    """The autoscaler's load signal counts calls in flight and calls handled"""
+    async def test(client, upstream, proxy):
+        slow = asyncio.ensure_future(client.get('/tools/slow'))
+        await asyncio.sleep(0.02)
+        during = await (await client.get('/_proxy/load')).json()
+        await slow
+        after = await (await client.get('/_proxy/load')).json()
+
+        assert during == {'inflight': 1, 'requests': 1}
+        assert after == {'inflight': 0, 'requests': 1}
+
+    run_proxy(test, delay=0.1)
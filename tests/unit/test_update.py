@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from agent_operator.handlers import create, update
+from agent_operator.handlers.create import SPEC_HASH_ANNOTATION, build_agent_pod, pod_spec_hash
+from agent_operator.handlers.update import image_patch, plan_update, spec_diff
+from agent_operator.utils import rollout as rollout_module
+from agent_operator.utils.rollout import Rollout
+
+from .fakes import FakeCoreApi, install_core_api, provide, run_queued
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+OLD = {
+    'agent': {'image': 'agent:1', 'environment': {'variables': [{'name': 'A', 'value': '1'}]}},
+    'sidecar': {'name': 'tools', 'image': 'tools:1'}
+}
+
+
+def with_image(spec, image):
+    return dict(spec, agent=dict(spec['agent'], image=image))
+
+
+def live_pod(spec, name='a'):
+    pod = build_agent_pod(name, 'default', spec, OWNER)
+    pod = dict(pod, metadata=dict(pod['metadata'], uid=f"uid-{name}", annotations={SPEC_HASH_ANNOTATION: pod_spec_hash(pod)}))
+    return pod
+
+
+@pytest.fixture
+def core_api(monkeypatch):
+    def install(pods):
+        # Without a cache, Rollout.wait returns at once instead of waiting for pod events
+        provide(monkeypatch, 'get_pod_cache', None, create, update, rollout_module)
+        return install_core_api(monkeypatch, FakeCoreApi(pods=pods), create)
+    return install
+
+
+def run_handler(monkeypatch, handler, rollout=None):
+    provide(monkeypatch, 'get_rollout', rollout or Rollout(), update)
+    return run_queued(monkeypatch, lambda queue: handler(), update)
+
+
+def run_update(monkeypatch, old, new, rollout=None):
+    return run_handler(monkeypatch, lambda: update.update_agent_pod('a', 'default', old, new, OWNER), rollout)
+
+
+def test_spec_diff_reports_changed_leaves():
+    """Nested dicts are diffed field by field; lists compare as a whole"""
+    new = dict(with_image(OLD, 'agent:2'), sidecar=None)
+
+    assert spec_diff(OLD, new) == [
+        (('agent', 'image'), 'agent:1', 'agent:2'),
+        (('sidecar',), OLD['sidecar'], None)
+    ]
+    assert spec_diff(OLD, OLD) == []
+
+
+def test_plan_picks_least_disruptive_change():
+    """Images are patched in place, immutable fields force a replacement"""
+    env = dict(OLD, agent=dict(OLD['agent'], environment={'variables': []}))
+
+    assert plan_update(OLD, with_image(OLD, 'agent:2')) == 'patch'
+    assert plan_update(OLD, dict(OLD, sidecar=dict(OLD['sidecar'], image='tools:2'))) == 'patch'
+    assert plan_update(OLD, env) == 'replace'
+    assert plan_update(OLD, dict(OLD, agent=dict(OLD['agent'], warmStart=True))) == 'none'
+    assert plan_update(OLD, dict(OLD, scaling={'maxReplicas': 3, 'target': 5})) == 'none'
+
+
+def test_image_patch_only_carries_changed_fields():
+    """The apply body names the changed container and nothing else"""
+    new = with_image(OLD, 'agent:2')
+    body = image_patch(live_pod(OLD), build_agent_pod('a', 'default', OLD, OWNER), build_agent_pod('a', 'default', new, OWNER), 'hash')
+
+    assert body['spec'] == {'containers': [{'name': 'agent', 'image': 'agent:2'}]}
+    assert body['metadata']['annotations'] == {SPEC_HASH_ANNOTATION: 'hash'}
+
+
+def test_image_change_is_patched_in_place(monkeypatch, core_api):
+    """An image update is one server-side apply under the rollout field manager"""
+    api = core_api([live_pod(OLD)])
+    pod, action = run_update(monkeypatch, OLD, with_image(OLD, 'agent:2'))
+
+    assert action == 'patched'
+    assert api.verbs() == ['read', 'patch']
+    assert api.requests[-1].kwargs['field_manager'] == update.ROLLOUT_FIELD_MANAGER
+
+
+def test_immutable_change_replaces_pod(monkeypatch, core_api):
+    """Changing the environment deletes the pod and creates it again"""
+    api = core_api([live_pod(OLD)])
+    new = dict(OLD, agent=dict(OLD['agent'], environment={'variables': [{'name': 'A', 'value': '2'}]}))
+    pod, action = run_update(monkeypatch, OLD, new)
+
+    assert action == 'replaced'
+    assert api.verbs() == ['read', 'delete', 'read', 'create']
+    assert pod['metadata']['annotations'][SPEC_HASH_ANNOTATION] == pod_spec_hash(build_agent_pod('a', 'default', new, OWNER))
+
+
+def test_drifted_pod_is_replaced(monkeypatch, core_api):
+    """A pod found drifted in immutable fields on resume is deleted and created again"""
+    live = live_pod(OLD)
+    api = core_api([live])
+    new = dict(OLD, agent=dict(OLD['agent'], environment={'variables': []}))
+    pod, action = run_handler(monkeypatch, lambda: update.replace_agent_pod('a', 'default', new, OWNER, live))
+
+    assert action == 'replaced'
+    assert api.verbs() == ['delete', 'read', 'create']
+    assert pod['metadata']['uid'] != live['metadata']['uid']
+
+
+def test_rollout_bounds_concurrent_updates():
+    """No more than max_unavailable updates hold a slot at once"""
+    rollout = Rollout(max_unavailable=2)
+    active = []
+    peak = []
+
+    async def one():
+        async with rollout.slot():
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.pop()
+
+    async def run():
+        await asyncio.gather(*(one() for _ in range(10)))
+
+    asyncio.run(run())
+    assert max(peak) == 2
+    assert rollout.stats['updates'] == 10
+
+
+def test_rollout_wait_wakes_on_pod_event(monkeypatch):
+    """Waiters are released by the pod cache event that satisfies them"""
+    class Cache:
+        def get_pod(self, namespace, name):
+            return None
+
+    monkeypatch.setattr('agent_operator.utils.rollout.get_pod_cache', lambda: Cache())
+    rollout = Rollout(timeout=1)
+    pod = live_pod(OLD)
+
+    async def run():
+        waiter = asyncio.ensure_future(rollout.wait('default', 'a-pod', lambda current: current is not None))
+        await asyncio.sleep(0)
+        rollout.on_pod_event('ADDED', pod)
+        return await waiter
+
+    assert asyncio.run(run()) is True
+    assert rollout.stats['timeouts'] == 0
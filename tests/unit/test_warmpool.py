@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+from agent_operator.handlers import create
+from agent_operator.utils import warmpool
+from agent_operator.utils.podcache import POOL_LABEL, POOL_STATE_LABEL, PodCache
+from agent_operator.utils.status import StatusWriter
+
+from .fakes import FakeCoreApi, install_core_api, provide, run_queued
+
+OWNER = {'apiVersion': 'agents.example.com/v1', 'kind': 'AgentType', 'name': 'a', 'uid': 'uid-a'}
+SPEC = {'agent': {'image': 'nginx:latest', 'warmStart': True}}
+KEY = warmpool.pool_key('default', SPEC)
+
+
+def standby_pod(name, rv, ready=False):
+    return {
+        'metadata': {
+            'name': name,
+            'namespace': 'default',
+            'resourceVersion': rv,
+            'labels': {'managed-by': 'agent-operator', POOL_LABEL: KEY, POOL_STATE_LABEL: 'standby'}
+        },
+        'status': {'conditions': [{'type': 'Ready', 'status': 'True' if ready else 'False'}]}
+    }
+
+
+def run_with_pool(monkeypatch, api, test, size=2):
+    install_core_api(monkeypatch, api)
+
+    async def run(queue):
+        cache = PodCache(api)
+        await cache.relist()
+        provide(monkeypatch, 'get_pod_cache', cache, warmpool, create)
+        writer = StatusWriter(window=60)
+        provide(monkeypatch, 'get_status_writer', writer, create)
+        pool = warmpool.WarmPool(size=size)
+        provide(monkeypatch, 'get_warm_pool', pool, create)
+        try:
+            await test(pool, writer)
+        finally:
+            for key in list(writer._timers):
+                writer.forget(*key)
+
+    run_queued(monkeypatch, run, warmpool)
+
+
+def test_claim_relabels_ready_standby_pod(monkeypatch):
+    """A claim adopts a ready standby pod with one conditional patch and refills the pool"""
+    api = FakeCoreApi(pods=[standby_pod('p-0', '5'), standby_pod('p-1', '6', ready=True)])
+
+    async def test(pool, writer):
+        pod, action = await create.claim_agent_pod('a', 'default', SPEC, OWNER)
+        await pool.schedule_refill(KEY)
+
+        assert action == 'claimed'
+        assert pod['metadata']['name'] == 'p-1'
+        patch = next(request for request in api.requests if request.verb == 'patch')
+        body = patch.body
+        assert body['metadata']['resourceVersion'] == '6'
+        assert body['metadata']['ownerReferences'] == [OWNER]
+        assert body['metadata']['labels'] == {'app': 'a', POOL_STATE_LABEL: 'claimed'}
+        assert patch.kwargs['_content_type'] == 'application/merge-patch+json'
+        # p-0 is still standby, so one new pod brings the pool back to two
+        created = api.bodies('create', 'pods')
+        assert len(created) == 1
+        assert created[0]['metadata']['labels'][POOL_STATE_LABEL] == 'standby'
+        # Standby pods belong to their pool's ConfigMap until claimed
+        pool_object = api.get('configmaps', 'default', f"agent-pool-{KEY}")
+        assert created[0]['metadata']['ownerReferences'] == [
+            {'apiVersion': 'v1', 'kind': 'ConfigMap', 'name': f"agent-pool-{KEY}", 'uid': pool_object['metadata']['uid']}
+        ]
+        assert pool.stats['hits'] == 1
+        assert writer._pending_fields[('default', 'a')]['warmPool']['hit'] is True
+
+    run_with_pool(monkeypatch, api, test)
+
+
+def test_conflict_moves_to_next_standby_pod(monkeypatch):
+    """A pod claimed by another replica is skipped"""
+    api = FakeCoreApi(pods=[standby_pod('p-0', '5', ready=True), standby_pod('p-1', '6')], conflicts={'p-0'})
+
+    async def test(pool, writer):
+        pod, action = await create.claim_agent_pod('a', 'default', SPEC, OWNER)
+
+        assert pod['metadata']['name'] == 'p-1'
+        assert pool.stats['conflicts'] == 1
+
+    run_with_pool(monkeypatch, api, test)
+
+
+def test_empty_pool_falls_back_to_cold_start(monkeypatch):
+    """A miss returns None so the caller creates the pod as usual"""
+    api = FakeCoreApi()
+
+    async def test(pool, writer):
+        assert await create.claim_agent_pod('a', 'default', SPEC, OWNER) is None
+        assert await create.claim_agent_pod('b', 'default', {'agent': {'image': 'nginx:latest'}}, OWNER) is None
+        await pool.schedule_refill(KEY)
+
+        assert pool.stats['misses'] == 1
+        assert pool.hit_rate() == 0.0
+        assert len(api.bodies('create', 'pods')) == 2
+        # Pods created but not yet seen by the cache are not created again
+        assert await pool.refill(KEY) == 0
+
+    run_with_pool(monkeypatch, api, test)
+
+
+def test_idle_pool_expires_with_its_standby_pods(monkeypatch):
+    """A pool nobody used for the TTL is dropped and its standby pods deleted with one deletecollection"""
+    leftover = standby_pod('old-0', '7')
+    leftover['metadata']['labels'][POOL_LABEL] = 'other'
+    api = FakeCoreApi(pods=[leftover])
+
+    async def test(pool, writer):
+        pool.idle_ttl = 60
+        assert await create.claim_agent_pod('a', 'default', SPEC, OWNER) is None
+        await pool.schedule_refill(KEY)
+        await warmpool.get_pod_cache().relist()
+
+        assert await pool.expire() == 0
+        assert KEY in pool.pools and len(api.store['pods']) == 3
+
+        # Age both pools past the TTL: ours, and the one an earlier process left
+        pool._used[KEY] -= 61
+        pool._seen['other'] -= 61
+        pool_object = api.get('configmaps', 'default', f"agent-pool-{KEY}")
+        pool_object['metadata']['annotations'][warmpool.POOL_USED_ANNOTATION] = str(int(time.time()) - 61)
+        assert await pool.expire() == 2
+
+        assert pool.pools == {}
+        assert api.store['pods'] == {}
+        assert api.get('configmaps', 'default', f"agent-pool-{KEY}") is None
+        assert api.verbs('pods').count('deletecollection') == 2
+        assert await pool.refill(KEY) == 0
+
+    run_with_pool(monkeypatch, api, test)
+
+
+def test_pool_used_by_another_replica_is_kept(monkeypatch):
+    """A pool idle here but recently used according to its ConfigMap keeps its pods"""
+    api = FakeCoreApi()
+
+    async def test(pool, writer):
+        pool.idle_ttl = 60
+        assert await create.claim_agent_pod('a', 'default', SPEC, OWNER) is None
+        await pool.schedule_refill(KEY)
+        pool._used[KEY] -= 61
+
+        assert await pool.expire() == 0
+        assert pool.pools == {}
+        assert len(api.store['pods']) == 2
+        assert 'deletecollection' not in api.verbs()
+
+    run_with_pool(monkeypatch, api, test)
+
+
+def test_turning_pools_off_deletes_standby_pods(monkeypatch):
+    """With WARM_POOL_SIZE 0, standby pods left behind go with one deletecollection per namespace"""
+    claimed = standby_pod('p-1', '6')
+    claimed['metadata']['labels'][POOL_STATE_LABEL] = 'claimed'
+    api = FakeCoreApi(pods=[standby_pod('p-0', '5'), claimed],
+                      configmaps=[{'metadata': {'name': f"agent-pool-{KEY}", 'namespace': 'default'}}])
+    install_core_api(monkeypatch, api)
+
+    async def test():
+        cache = PodCache(api)
+        await cache.relist()
+        provide(monkeypatch, 'get_pod_cache', cache, warmpool)
+        assert await warmpool.delete_standby_pods() == 1
+        assert list(api.store['pods']) == [('default', 'p-1')]
+        assert api.store['configmaps'] == {}
+        assert api.verbs('pods') == ['list', 'deletecollection']
+
+    asyncio.run(test())
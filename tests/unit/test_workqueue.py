@@ -0,0 +1,153 @@
+import asyncio
+
+import kopf
+
+from agent_operator.utils.workqueue import PRIORITY_CREATE, PRIORITY_DELETE, WorkQueue
+
+
+def test_duplicate_keys_are_merged():
+    """A key submitted again while queued runs once, with the newest work"""
+    async def test():
+        queue = WorkQueue(workers=1)
+        calls = []
+
+        def work(value):
+            async def run():
+                calls.append(value)
+                return value
+            return run
+
+        first = queue.submit('default/a', 'default', PRIORITY_CREATE, work(1))
+        second = queue.submit('default/a', 'default', PRIORITY_CREATE, work(2))
+        queue.start()
+        assert await first == 2
+        assert await second == 2
+        assert calls == [2]
+        await queue.stop()
+
+    asyncio.run(test())
+
+
+def test_different_kinds_of_work_are_not_merged():
+    """A delete queued behind a create for the same key does not hand the create its result"""
+    async def test():
+        queue = WorkQueue(workers=1)
+
+        def work(value):
+            async def run():
+                return value
+            return run
+
+        create = queue.submit('default/a', 'default', PRIORITY_CREATE, work(('pod', 'created')))
+        delete = queue.submit('default/a', 'default', PRIORITY_DELETE, work(1))
+        queue.start()
+        assert await create == ('pod', 'created')
+        assert await delete == 1
+        await queue.stop()
+
+    asyncio.run(test())
+
+
+def test_higher_priority_runs_first():
+    """Deletes queued after creates still run before them"""
+    async def test():
+        queue = WorkQueue(workers=1)
+        order = []
+
+        def work(key):
+            async def run():
+                order.append(key)
+            return run
+
+        futures = [queue.submit(f"default/create-{i}", 'default', PRIORITY_CREATE, work(f"create-{i}")) for i in range(3)]
+        futures.append(queue.submit('default/delete', 'default', PRIORITY_DELETE, work('delete')))
+        queue.start()
+        await asyncio.gather(*futures)
+        assert order[0] == 'delete'
+        await queue.stop()
+
+    asyncio.run(test())
+
+
+def test_busy_namespace_does_not_starve_others():
+    """A namespace out of tokens is skipped while other namespaces proceed"""
+    async def test():
+        queue = WorkQueue(workers=1, namespace_rate=1.0, namespace_burst=2, global_rate=1000, global_burst=1000)
+        order = []
+
+        def work(namespace):
+            async def run():
+                order.append(namespace)
+            return run
+
+        for i in range(10):
+            queue.submit(f"busy/agent-{i}", 'busy', PRIORITY_CREATE, work('busy'))
+        quiet = queue.submit('quiet/agent', 'quiet', PRIORITY_CREATE, work('quiet'))
+        queue.start()
+        await asyncio.wait_for(quiet, 1)
+        assert order.index('quiet') <= 2
+        await queue.stop()
+
+    asyncio.run(test())
+
+
+def test_failures_are_retried_with_backoff():
+    """Transient failures are retried; permanent errors are not"""
+    async def test():
+        queue = WorkQueue(workers=2, backoff_base=0.01)
+        attempts = {'flaky': 0, 'broken': 0}
+
+        async def flaky():
+            attempts['flaky'] += 1
+            if attempts['flaky'] < 3:
+                raise RuntimeError("try again")
+            return 'ok'
+
+        async def broken():
+            attempts['broken'] += 1
+            raise kopf.PermanentError("bad spec")
+
+        queue.start()
+        assert await queue.submit('default/flaky', 'default', PRIORITY_CREATE, flaky) == 'ok'
+        try:
+            await queue.submit('default/broken', 'default', PRIORITY_CREATE, broken)
+        except kopf.PermanentError:
+            pass
+        assert attempts == {'flaky': 3, 'broken': 1}
+        assert queue.stats['retries'] == 2
+        await queue.stop()
+
+    asyncio.run(test())
+
+
+def test_a_key_never_runs_twice_at_once():
+    """Work submitted for a key in flight waits for it, whatever its kind, while other keys go ahead"""
+    async def test():
+        queue = WorkQueue(workers=3)
+        running = set()
+        overlaps = []
+        order = []
+
+        def work(key, value):
+            async def run():
+                if key in running:
+                    overlaps.append(value)
+                running.add(key)
+                order.append(value)
+                await asyncio.sleep(0.01)
+                running.discard(key)
+                return value
+            return run
+
+        queue.start()
+        first = queue.submit('default/a', 'default', PRIORITY_CREATE, work('a', 'create'))
+        await asyncio.sleep(0.001)
+        again = queue.submit('default/a', 'default', PRIORITY_CREATE, work('a', 'create again'))
+        delete = queue.submit('default/a', 'default', PRIORITY_DELETE, work('a', 'delete'))
+        other = queue.submit('default/b', 'default', PRIORITY_CREATE, work('b', 'other'))
+        assert await asyncio.gather(first, again, delete, other) == ['create', 'create again', 'delete', 'other']
+        assert overlaps == []
+        assert order == ['create', 'other', 'delete', 'create again']
+        await queue.stop()
+
+    asyncio.run(test())